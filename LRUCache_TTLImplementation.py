@@ -1,9 +1,12 @@
 import time
 from threading import RLock
 import sys
+import pickle
+from array import array
 from typing import Any, Union
-import tqdm
 import random
+from ttl_index import TTLIndex
+from trace_reader import read_trace
 
 try:
     from collections import OrderedDict
@@ -13,8 +16,11 @@ except ImportError:
 
 
 class ExpiringDict(OrderedDict):
-    def __init__(self, max_len, max_age_seconds, items=None):
-        # type: (Union[int, None], Union[float, None], Union[None,dict,OrderedDict,ExpiringDict]) -> None
+    # every key maps to a slot record (value, set_time, size), size is
+    # int(value[0]) taken once on insert and charged against max_len
+
+    def __init__(self, max_len, max_age_seconds, items=None, event_hook=None):
+        # type: (Union[int, None], Union[float, None], Union[None,dict,OrderedDict,ExpiringDict], Any) -> None
 
         if not self.__is_instance_of_expiring_dict(items):
             self.__assertions(max_len, max_age_seconds)
@@ -28,6 +34,8 @@ class ExpiringDict(OrderedDict):
         self.totalrequest = 0
         self.num_evicted = 0
         self.evictionbyttl=0
+        self.__ttl_index = TTLIndex() #expiry order of every key, absolute expiry = set_time + max_age
+        self.event_hook = event_hook #called as event_hook(event, key, size) on "evict" and "expire", None disables it
 
         if sys.version_info >= (3, 5):
             self._safe_keys = lambda: list(self.keys())
@@ -58,6 +66,8 @@ class ExpiringDict(OrderedDict):
                     del self[key]
                     self.num_evicted+=1
                     self.evictionbyttl+=1
+                    if self.event_hook is not None:
+                        self.event_hook("expire", key, item[2])
         except KeyError:
             pass
         return False
@@ -70,8 +80,8 @@ class ExpiringDict(OrderedDict):
         with self.lock:
             item = OrderedDict.__getitem__(self, key)
             item_age = time.time() - item[1]
-            self.hit+=1
             if item_age < self.max_age:
+                self.hit+=1
                 if with_age:
                     return item[0], item_age
                 else:
@@ -80,43 +90,66 @@ class ExpiringDict(OrderedDict):
                 del self[key]
                 self.num_evicted += 1
                 self.evictionbyttl += 1
+                if self.event_hook is not None:
+                    self.event_hook("expire", key, item[2])
                 raise KeyError(key)
 
+    def __delitem__(self, key):
+        item = OrderedDict.pop(self, key)
+        self.__ttl_index.discard(key)
+        self.current_len -= item[2]
+
+    def popitem(self, last=True):
+        item = OrderedDict.popitem(self, last)
+        self.__ttl_index.discard(item[0])
+        self.current_len -= item[1][2]
+        return item
+
     def __setitem__(self, key, value, set_time=None):
-        """ Set d[key] to value. """
+        """ Set d[key] to value, value[0] is its size in bytes. """
         with self.lock:
-            if len(self) == self.max_len or (value[0]+self.current_len >= self.max_len):
-                if key in self:
-                    del self[key]
-                    self.num_evicted += 1
-                    self.totalrequest += 1
-                    self.hit+=1
-                    item = OrderedDict.__getitem__(self, key)
-                    print("currentsize=",self.current_len,"newlen=",value[0],"item=",item)
-                    self.current_len-= int(item[1][0])
-                else:
-                    try:
-                        item = self.popitem(last=False)
-                        self.current_len -= int(item[1][0])
-                        print("currentsize=", self.current_len, "newlen=", value[0])
-                        self.num_evicted += 1
-                        self.totalrequest += 1
-                    except KeyError:
-                        pass
             if set_time is None:
                 set_time = time.time()
-            while(value[0]+self.current_len>=self.max_len):
-                try:
-                    item = self.popitem(last=False)
-                    print(item)
-                    self.current_len -= int(item[1][0])
-                    print("currentsize=", self.current_len, "newlen=", value[0],"check size",item[1][0])
-                    self.num_evicted += 1
-                    self.totalrequest += 1
-                except KeyError:
-                    pass
-            OrderedDict.__setitem__(self, key, (value, set_time))
-            self.current_len+=value[0]
+            size = int(value[0])
+            if OrderedDict.__contains__(self, key): #rewrite, release the old bytes first
+                del self[key]
+            if size > self.max_len: #item can never fit
+                return
+            if size + self.current_len > self.max_len:
+                self.__make_room(size, set_time)
+            OrderedDict.__setitem__(self, key, (value, set_time, size))
+            self.__ttl_index.add(key, set_time + self.max_age)
+            self.current_len += size
+
+    def __make_room(self, size, now):
+        """ Free just enough bytes for an item of size bytes: expired items
+        first, then least recently set ones, in a single pass.
+        """
+        self.purge_expired(now)
+        hook = self.event_hook
+        while size + self.current_len > self.max_len:
+            key, item = self.popitem(last=False)
+            self.num_evicted += 1
+            if hook is not None:
+                hook("evict", key, item[2])
+
+    def purge_expired(self, now=None):
+        """ Remove every expired item without scanning the live ones.
+        Returns the number of items removed.
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            hook = self.event_hook
+            expired = self.__ttl_index.expire(now, inclusive=True)
+            for key in expired:
+                item = OrderedDict.pop(self, key)
+                self.current_len -= item[2]
+                self.num_evicted += 1
+                self.evictionbyttl += 1
+                if hook is not None:
+                    hook("expire", key, item[2])
+            return len(expired)
 
     def pop(self, key, default=None):
         """ Get item from the dict and remove it.
@@ -188,6 +221,73 @@ class ExpiringDict(OrderedDict):
         reduced = self.__class__, (self.max_len, self.max_age, ('reduce_result', self.items_with_timestamp()))
         return reduced
 
+    def snapshot(self):
+        """ Return the dict as (meta, columns) for snapshot.py: keys, sizes and
+        set times in LRU order, the TTL index, and the values, which can be
+        any object, pickled into one byte column. Keys must be ints.
+        """
+        with self.lock:
+            records = [(key, OrderedDict.__getitem__(self, key)) for key in self._safe_keys()]
+            meta = {
+                "engine": "expiring_dict",
+                "max_len": self.max_len,
+                "max_age": self.max_age,
+                "current_len": self.current_len,
+                "hit": self.hit,
+                "totalrequest": self.totalrequest,
+                "num_evicted": self.num_evicted,
+                "evictionbyttl": self.evictionbyttl,
+            }
+            arrays = {
+                "keys": array("Q", [key for key, item in records]),
+                "sizes": array("q", [item[2] for key, item in records]),
+                "set_times": array("d", [item[1] for key, item in records]),
+                "values": array("B", pickle.dumps([item[0] for key, item in records],
+                                                  protocol=pickle.HIGHEST_PROTOCOL)),
+            }
+            arrays.update(self.__ttl_index.columns("d"))
+            return meta, arrays
+
+    def restore(self, meta, arrays):
+        """ Refill an empty dict built with the max_len and max_age of meta
+        from the columns of snapshot().
+        """
+        with self.lock:
+            values = pickle.loads(arrays["values"])
+            for key, value, size, set_time in zip(arrays["keys"], values, arrays["sizes"], arrays["set_times"]):
+                OrderedDict.__setitem__(self, key, (value, set_time, size))
+            self.__ttl_index.restore(arrays)
+            self.current_len = meta["current_len"]
+            self.hit = meta["hit"]
+            self.totalrequest = meta["totalrequest"]
+            self.num_evicted = meta["num_evicted"]
+            self.evictionbyttl = meta["evictionbyttl"]
+
+    def __copy_expiring_dict(self, max_len, max_age_seconds, items):
+        # type: (Union[int, None], Union[float, None], ExpiringDict) -> None
+        if max_len is not None:
+            self.__assert_max_len(max_len)
+            self.max_len = max_len
+        else:
+            self.max_len = items.max_len
+        if max_age_seconds is not None:
+            self.__assert_max_age_seconds(max_age_seconds)
+            self.max_age = max_age_seconds
+        else:
+            self.max_age = items.max_age
+        for key, (value, set_time, size) in items.items_with_timestamp():
+            self.__setitem__(key, value, set_time)
+
+    def __copy_dict(self, items):
+        # type: (dict) -> None
+        for key, value in items.items():
+            self[key] = value
+
+    def __copy_reduced_result(self, items):
+        # type: (tuple) -> None
+        for key, (value, set_time, size) in items[1]: #the slot records of items_with_timestamp()
+            self.__setitem__(key, value, set_time)
+
     def __assertions(self, max_len, max_age_seconds):
         self.__assert_max_len(max_len)
         self.__assert_max_age_seconds(max_age_seconds)
@@ -266,57 +366,52 @@ class ExpiringDict(OrderedDict):
 # cache.get_evictionbyttl()
 # cache.get_sizeofdict()
 
-#Read data into dictionary, need to consider the length of data as well when inserting
-
-#Data from Trace:
-# (epoch time, obj, length of data, new time to live)
-# 1585440000 11606970 104857622 50331658
-# 1585440000 2814533 104857627 50331658
-
-#Total 1000000 data points, anymore will take too long
-#500000 for insertion
-#500000 for get searches
-#Ignore Time start, key = obj, value = length of data, time = new ttl
-start = time.time()
-full_heapsize=1048576000 #1,048,576,000
-heapsize = 10000000
-cache = ExpiringDict(max_len=full_heapsize,max_age_seconds=30)
-readfile = open("n.sbin-10000000_items_10_ttl.txt","r")
-# readfile = open("mix1_cache.sbin-sampled_1000_items_10_ttl_mix.txt","r")
-# readfile = open("mix1_cache.sbin-sampled_1000_items_100_ttl_mix_3.txt","r")
-filelines = readfile.readlines()
-length = 10000000
-numofinsertions = length/2
-counter =0
-totallen=0
-for line in filelines:
-    data = line.split(" ")
-    obj = int(data[1])
-    key_len = int(data[2])
-    # key_len = (key_len >> 22) & (0x00000400 - 1)
-    totallen+=key_len
-    ttl = int(data[3])
-    # print(key_len)
-    # print(obj,value,ttl)
-
-    if(counter<numofinsertions):
-        cache[obj] = (key_len,ttl)
-    else:
-        cache.get(obj)
-    counter += 1
-    # if(counter==11):
-    #     break
-print("totallen=",totallen,"averagesize=",totallen/counter,"Total Items=",counter)
-cache.items_with_timestamp()
-cache.get_hitratio()
-cache.get_missratio()
-cache.get_eviction()
-cache.get_evictionbyttl()
-cache.get_numofitems()
-cache.get_currentcachesize()
-print("Total len=",totallen)
-print("Heap Size=",full_heapsize)
-end = time.time()
-
-print(end - start)
-
+if __name__ == "__main__":
+    #Read data into dictionary, need to consider the length of data as well when inserting
+
+    #Data from Trace:
+    # (epoch time, obj, length of data, new time to live)
+    # 1585440000 11606970 104857622 50331658
+    # 1585440000 2814533 104857627 50331658
+
+    #Total 1000000 data points, anymore will take too long
+    #500000 for insertion
+    #500000 for get searches
+    #Ignore Time start, key = obj, value = length of data, time = new ttl
+    start = time.time()
+    full_heapsize=1048576000 #1,048,576,000
+    heapsize = 10000000
+    cache = ExpiringDict(max_len=full_heapsize,max_age_seconds=30)
+    fpath = "n.sbin-10000000_items_10_ttl.txt"
+    # fpath = "mix1_cache.sbin-sampled_1000_items_10_ttl_mix.txt"
+    # fpath = "mix1_cache.sbin-sampled_1000_items_100_ttl_mix_3.txt"
+    length = 10000000
+    numofinsertions = length/2
+    counter =0
+    totallen=0
+    for ts, obj, key_len, ttl in read_trace(fpath):
+        # key_len = (key_len >> 22) & (0x00000400 - 1)
+        totallen+=key_len
+        # print(key_len)
+        # print(obj,value,ttl)
+
+        if(counter<numofinsertions):
+            cache[obj] = (key_len,ttl)
+        else:
+            cache.get(obj)
+        counter += 1
+        # if(counter==11):
+        #     break
+    print("totallen=",totallen,"averagesize=",totallen/counter,"Total Items=",counter)
+    cache.items_with_timestamp()
+    cache.get_hitratio()
+    cache.get_missratio()
+    cache.get_eviction()
+    cache.get_evictionbyttl()
+    cache.get_numofitems()
+    cache.get_currentcachesize()
+    print("Total len=",totallen)
+    print("Heap Size=",full_heapsize)
+    end = time.time()
+
+    print(end - start)
@@ -0,0 +1,164 @@
+from array import array
+
+from hashing import mix64, mix64_array
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, it only speeds up hashing a block of keys
+    np = None
+
+
+MEAN_OBJECT_SIZE = 64 #bytes, sizes the sketch from a byte budget; the twemcache sample traces average about 50
+COUNTER_MAX = 15 #saturating counters, TinyLFU only needs to tell small frequencies apart
+DEPTH = 4 #rows of the count-min sketch
+SAMPLE_FACTOR = 10 #the sketch ages after SAMPLE_FACTOR * width recorded requests
+_HALVE = bytes(i >> 1 for i in range(256)) #bytearray.translate table halving every counter
+
+
+class TinyLFU(object):
+    """
+    W-TinyLFU style admission filter (Einziger, Friedman and Manes, 2017).
+
+    every request is recorded in a count-min sketch of DEPTH rows of width
+    byte counters, behind a doorkeeper bloom filter: the first request of
+    a key since the last aging only sets its doorkeeper bits, later ones
+    increment the sketch, so one-hit wonders never reach it. after
+    SAMPLE_FACTOR * width requests every counter is halved and the
+    doorkeeper cleared, so the estimates follow recent popularity.
+
+    on overflow the cache asks admit(candidate, victim) and only inserts the
+    missed object when its estimated frequency beats that of the eviction
+    victim. memory is fixed at DEPTH * width bytes of counters plus width
+    bytes (8 * width bits) of doorkeeper. every operation works on the
+    mix64 hash of the key, which hashes() computes for a whole block of
+    keys at once
+    """
+
+    def __init__(self, n_items):
+        """
+        :type n_items: int, expected number of cached objects, rounded up to a power of two
+        """
+        width = 64
+        while width < n_items:
+            width <<= 1
+        self.width = width
+        self.sample_size = SAMPLE_FACTOR * width
+        self.samples = 0 #requests recorded since the last aging
+        self.resets = 0
+        self.__mask = width - 1
+        self.__table = bytearray(DEPTH * width) #row i is table[i * width:(i + 1) * width]
+        self.__door_mask = 8 * width - 1
+        self.__doorkeeper = bytearray(width)
+
+    @staticmethod
+    def hashes(keys):
+        """
+        mix64 of a block of keys, vectorized when numpy is available
+        :rtype: list of int
+        """
+        if np is not None and len(keys) > 64:
+            return mix64_array(np.asarray(keys, dtype=np.uint64)).tolist()
+        return [mix64(key) for key in keys]
+
+    def record_hash(self, h):
+        """
+        count one request of the key with mix64 hash h. the row i counter
+        is lo + i * hi of the two 32 bit halves of h (double hashing), the
+        doorkeeper bits are hi and hi + lo
+        """
+        lo = h & 0xffffffff
+        hi = h >> 32
+        door = self.__doorkeeper
+        b0 = hi & self.__door_mask
+        b1 = (hi + lo) & self.__door_mask
+        if door[b0 >> 3] >> (b0 & 7) & 1 and door[b1 >> 3] >> (b1 & 7) & 1:
+            table = self.__table
+            mask = self.__mask
+            width = self.width
+            i = lo & mask
+            if table[i] < COUNTER_MAX:
+                table[i] += 1
+            i = width + ((lo + hi) & mask)
+            if table[i] < COUNTER_MAX:
+                table[i] += 1
+            i = 2 * width + ((lo + 2 * hi) & mask)
+            if table[i] < COUNTER_MAX:
+                table[i] += 1
+            i = 3 * width + ((lo + 3 * hi) & mask)
+            if table[i] < COUNTER_MAX:
+                table[i] += 1
+        else:
+            door[b0 >> 3] |= 1 << (b0 & 7)
+            door[b1 >> 3] |= 1 << (b1 & 7)
+        self.samples += 1
+        if self.samples >= self.sample_size:
+            self.reset()
+
+    def record(self, key):
+        self.record_hash(mix64(key))
+
+    def estimate_hash(self, h):
+        """
+        :rtype: int, estimated requests of the key since the last aging, at most COUNTER_MAX + 1
+        """
+        lo = h & 0xffffffff
+        hi = h >> 32
+        table = self.__table
+        mask = self.__mask
+        width = self.width
+        count = min(table[lo & mask], table[width + ((lo + hi) & mask)],
+                    table[2 * width + ((lo + 2 * hi) & mask)], table[3 * width + ((lo + 3 * hi) & mask)])
+        door = self.__doorkeeper
+        b0 = hi & self.__door_mask
+        b1 = (hi + lo) & self.__door_mask
+        if door[b0 >> 3] >> (b0 & 7) & 1 and door[b1 >> 3] >> (b1 & 7) & 1:
+            count += 1
+        return count
+
+    def estimate(self, key):
+        return self.estimate_hash(mix64(key))
+
+    def admit(self, candidate, victim):
+        """
+        :return: True if candidate should replace victim in the cache
+        """
+        return self.estimate(candidate) > self.estimate(victim)
+
+    def reset(self):
+        """
+        age the sketch: halve every counter and clear the doorkeeper
+        """
+        self.__table = self.__table.translate(_HALVE)
+        self.__doorkeeper = bytearray(self.width)
+        self.samples //= 2
+        self.resets += 1
+
+    def snapshot(self):
+        """
+        :return: (json serializable meta, dict name -> array), see snapshot.py
+        """
+        meta = {"width": self.width, "samples": self.samples, "resets": self.resets}
+        return meta, {"table": array("B", self.__table), "doorkeeper": array("B", self.__doorkeeper)}
+
+    def restore(self, meta, arrays):
+        self.samples = meta["samples"]
+        self.resets = meta["resets"]
+        self.__table = bytearray(arrays["table"])
+        self.__doorkeeper = bytearray(arrays["doorkeeper"])
+
+
+ADMISSIONS = ["none", "tinylfu"]
+
+
+def make_admission(name, capacity, overhead=0):
+    """
+    :type name: str, one of ADMISSIONS
+    :type capacity: int, byte budget of the cache the filter guards
+    :rtype: TinyLFU or None
+    """
+    if name is None or name == "none":
+        return None
+    if name == "tinylfu":
+        return TinyLFU(capacity // (MEAN_OBJECT_SIZE + overhead))
+    raise ValueError(f"unknown admission filter {name}, expected one of {ADMISSIONS}")
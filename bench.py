@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+import argparse
+import itertools
+import json
+import platform
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from cache_core import byte_hit_ratio
+from eviction_policies import POLICIES
+from replay_sweep import ENGINES, OVERHEAD, TTL_OVERRIDE, make_cache
+from trace_reader import read_trace_batches
+
+
+BENCH_TTL = 3600 #ttl of every synthetic request
+OPS_PER_SECOND = 1000 #synthetic requests per simulated second
+DEFAULT_TRACE = "n.sbin-10000000_items_10_ttl.txt"
+
+
+def _sizes(n_keys, rng):
+    """
+    object size of every key, fixed for the whole workload
+    """
+    return [rng.randint(16, 1024) for _ in range(n_keys)]
+
+
+def _columns(keys, sizes):
+    """
+    :return: (times, keys, sizes, ttls) request columns for a key sequence
+    """
+    n = len(keys)
+    return ([i // OPS_PER_SECOND for i in range(n)], keys,
+            [sizes[k] for k in keys], [BENCH_TTL] * n)
+
+
+def uniform(n_ops, n_keys, seed):
+    rng = random.Random(seed)
+    sizes = _sizes(n_keys, rng)
+    return _columns([rng.randrange(n_keys) for _ in range(n_ops)], sizes)
+
+
+def zipf(n_ops, n_keys, seed, alpha):
+    """
+    key k (0 is the most popular) is requested with probability ~ 1 / (k + 1) ** alpha
+    """
+    rng = random.Random(seed)
+    sizes = _sizes(n_keys, rng)
+    cum_weights = list(itertools.accumulate(1.0 / (k + 1) ** alpha for k in range(n_keys)))
+    return _columns(rng.choices(range(n_keys), cum_weights=cum_weights, k=n_ops), sizes)
+
+
+def scan(n_ops, n_keys, seed, hot_fraction=0.1, scan_share=0.5):
+    """
+    a zipf(1.0) hot set of hot_fraction of the keys mixed with sequential
+    scans over the rest; scan_share of the requests belong to scans
+    """
+    rng = random.Random(seed)
+    sizes = _sizes(n_keys, rng)
+    n_hot = max(1, int(n_keys * hot_fraction))
+    cum_weights = list(itertools.accumulate(1.0 / (k + 1) for k in range(n_hot)))
+    keys = []
+    cursor = n_hot
+    while len(keys) < n_ops:
+        if rng.random() < scan_share:
+            length = rng.randint(100, 1000)
+            keys.extend(n_hot + (cursor + i - n_hot) % (n_keys - n_hot) for i in range(length))
+            cursor += length
+        else:
+            keys.extend(rng.choices(range(n_hot), cum_weights=cum_weights, k=100))
+    return _columns(keys[:n_ops], sizes)
+
+
+def trace(n_ops, trace_path=DEFAULT_TRACE):
+    """
+    the first n_ops records of a trace, ttls as the replay loops use them
+    """
+    times, keys, sizes, ttls = [], [], [], []
+    for t, o, s, ttl in read_trace_batches(trace_path):
+        times.extend(t)
+        keys.extend(o)
+        sizes.extend(s)
+        ttls.extend(TTL_OVERRIDE if x == 10 or x == 0 else x for x in ttl)
+        if len(keys) >= n_ops:
+            break
+    return times[:n_ops], keys[:n_ops], sizes[:n_ops], ttls[:n_ops]
+
+
+WORKLOADS = ["uniform", "zipf-0.6", "zipf-0.8", "zipf-1.0", "zipf-1.2", "scan", "trace"]
+
+
+def make_workload(name, n_ops, n_keys, seed, trace_path=DEFAULT_TRACE):
+    """
+    :type name: str, one of WORKLOADS
+    :return: (times, keys, sizes, ttls)
+    """
+    if name == "uniform":
+        return uniform(n_ops, n_keys, seed)
+    if name.startswith("zipf-"):
+        return zipf(n_ops, n_keys, seed, float(name[len("zipf-"):]))
+    if name == "scan":
+        return scan(n_ops, n_keys, seed)
+    if name == "trace":
+        return trace(n_ops, trace_path)
+    raise ValueError(f"unknown workload {name}, expected one of {WORKLOADS}")
+
+
+def _percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def run_bench(workload, policy, n_ops, n_keys, seed, capacity_fraction, trace_path=DEFAULT_TRACE):
+    """
+    benchmark one policy on one workload, this is what each worker process runs.
+    the capacity is capacity_fraction of the bytes of all distinct objects.
+    ops/sec and the hit ratios come from a batched access_many replay, the
+    latencies from a second, per-request replay timed with perf_counter_ns
+    :return: dict result row
+    """
+    times, keys, sizes, ttls = make_workload(workload, n_ops, n_keys, seed, trace_path)
+    footprint = sum(dict(zip(keys, sizes)).values()) + OVERHEAD * len(set(keys))
+    capacity = max(1, int(footprint * capacity_fraction))
+
+    cache = make_cache(policy, capacity)
+    start = time.perf_counter()
+    hits = sum(cache.access_many(keys, sizes, times, ttls))
+    elapsed = time.perf_counter() - start
+    byte_hits = byte_hit_ratio(cache.getStats())
+
+    cache = make_cache(policy, capacity)
+    get = cache.get
+    put = cache.put
+    clock = time.perf_counter_ns
+    latencies = []
+    for t, key, size, ttl in zip(times, keys, sizes, ttls):
+        begin = clock()
+        if get(key, t, ttl, size) < 0:
+            put(key, size, t, ttl)
+        latencies.append(clock() - begin)
+    latencies.sort()
+
+    return {
+        "workload": workload,
+        "policy": policy,
+        "capacity": capacity,
+        "requests": len(keys),
+        "ops_per_sec": len(keys) / elapsed if elapsed else 0.0,
+        "p50_us": _percentile(latencies, 0.50) / 1000,
+        "p99_us": _percentile(latencies, 0.99) / 1000,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, #kilobytes on linux
+        "hit_ratio": hits / len(keys) if keys else 0.0,
+        "byte_hit_ratio": byte_hits,
+    }
+
+
+def bench(workloads, policies, n_ops, n_keys, seed, capacity_fraction, workers=1,
+          trace_path=DEFAULT_TRACE):
+    """
+    run every workload x policy in its own worker process, so that the peak
+    rss of one run is not inherited by the next. max_tasks_per_child needs
+    python 3.11, older versions start a one-worker pool per run instead
+    :return: list of result rows in configuration order
+    """
+    configs = [(workload, policy, n_ops, n_keys, seed, capacity_fraction, trace_path)
+               for workload, policy in itertools.product(workloads, policies)]
+    if sys.version_info < (3, 11):
+        with ThreadPoolExecutor(max_workers=workers) as threads:
+            return list(threads.map(_run_isolated, configs))
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as pool:
+        futures = [pool.submit(run_bench, *config) for config in configs]
+        return [f.result() for f in futures]
+
+
+def _run_isolated(config):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(run_bench, *config).result()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workloads", help="workloads to run", nargs="+", choices=WORKLOADS,
+                    default=WORKLOADS)
+    ap.add_argument("--policies", help="policies to benchmark", nargs="+",
+                    choices=sorted(POLICIES) + sorted(ENGINES), default=sorted(POLICIES) + sorted(ENGINES))
+    ap.add_argument("--ops", help="requests per run", type=int, default=200000)
+    ap.add_argument("--keys", help="distinct keys of the synthetic workloads", type=int, default=50000)
+    ap.add_argument("--seed", help="seed of the synthetic workloads", type=int, default=0)
+    ap.add_argument("--capacity_fraction", help="cache size as a fraction of the bytes of "
+                    "all distinct objects", type=float, default=0.1)
+    ap.add_argument("--trace", help="trace of the trace workload", type=str, default=DEFAULT_TRACE)
+    ap.add_argument("--workers", help="worker processes, keep 1 for stable timings", type=int, default=1)
+    ap.add_argument("--out", help="write the JSON report to this file instead of stdout", type=str)
+    args = ap.parse_args()
+
+    rows = bench(args.workloads, args.policies, args.ops, args.keys, args.seed,
+                 args.capacity_fraction, args.workers, args.trace)
+    report = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "ops": args.ops,
+        "keys": args.keys,
+        "seed": args.seed,
+        "capacity_fraction": args.capacity_fraction,
+        "results": rows,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as ofile:
+            ofile.write(text + "\n")
+    else:
+        print(text)
@@ -0,0 +1,514 @@
+from array import array
+from itertools import repeat
+from time import perf_counter_ns
+
+from ttl_index import TTLIndex
+
+
+class ListNode(object):
+    __slots__ = ("key", "value", "freq", "ttl", "ttl_bucket", "prev", "next") #no per-node __dict__, millions of these are alive at once
+
+    def __init__(self, key, value, ttl=-1, freq=0):
+        self.key = key #object name
+        self.value = value #object size
+        self.freq = freq
+        self.ttl = ttl #-1 ttl is infinity
+        self.ttl_bucket = -1 #class_stats TTL bucket the node was inserted with, -1 unknown
+        self.prev = None #links used by list based policies
+        self.next = None
+
+    def __getstate__(self):
+        #links are left out, pickling a long chain would recurse through it;
+        #the policy that owns the links rebuilds them
+        return self.key, self.value, self.ttl, self.freq
+
+    def __setstate__(self, state):
+        self.key, self.value, self.ttl, self.freq = state
+        self.ttl_bucket = -1
+        self.prev = None
+        self.next = None
+
+
+def byte_hit_ratio(stats):
+    """
+    :type stats: dict, getStats() of any engine
+    """
+    requested = stats["hit_bytes"] + stats["miss_bytes"]
+    return stats["hit_bytes"] / requested if requested else 0.0
+
+
+class CacheCore(object):
+    """
+    byte-budgeted cache shared by every eviction policy. the core owns the
+    key index, size accounting, TTL bookkeeping and statistics; the policy
+    only orders the cached nodes and picks the next victim
+    (see eviction_policies.py). an optional admission filter sees every
+    request and decides, on overflow, whether a missed object may replace
+    the policy's victim at all (see admission.py). with instruments, timed
+    wrappers shadow get() and put() on the instance and the block methods
+    fall back to them, so a cache without pays nothing for the hooks (see
+    instrumentation.py). a breakdown is told about every get(), through a
+    wrapper shadowing it the same way, and every insertion, eviction and
+    expiration (see class_stats.py)
+    """
+
+    def __init__(self, capacity, policy, overhead=0, reclaim_expired=True, proactive_expiry=False,
+                 admission=None, instruments=None, breakdown=None):
+        """
+        :type capacity: int
+        :type policy: eviction_policies.EvictionPolicy
+        :type overhead: int
+        :type reclaim_expired: bool, drop expired items before evicting live ones on overflow
+        :type proactive_expiry: bool, reclaim expired items every time the timer advances
+        :type admission: admission.TinyLFU or None to admit every object
+        :type instruments: instrumentation.Instruments or None
+        :type breakdown: class_stats.ClassStats or None
+        """
+        self.__capa = capacity #maximum size of cache in bytes
+        self.__size = 0
+        self.__policy = policy
+        policy.attach(capacity, overhead)
+        self.__key_to_node = {}
+        self.__overhead = overhead #overhead for each item in bytes
+        self.__timer = 0 #keeps track of time for TTL expiration detection
+        self.__ttl_index = TTLIndex() #expiry order of every cached key
+        self.__reclaim_expired = reclaim_expired
+        self.__proactive_expiry = proactive_expiry
+        self.__admission = admission
+        self.__instruments = None
+        self.__breakdown = None
+        self.observe(instruments, breakdown)
+
+        #variables below are for statistics
+        self.__evictions = 0 #keeps track of items evicted that are not from ttl expiration
+        self.__hits = 0
+        self.__misses = 0
+        self.__ttl_expirations = 0
+        self.__insertions = 0
+        self.__rejections = 0 #missed objects the admission filter kept out
+        self.__hit_bytes = 0 #object bytes served by hits
+        self.__miss_bytes = 0 #object bytes of missed objects, as given to get()
+
+    @property
+    def policy(self):
+        return self.__policy
+
+    @property
+    def admission(self):
+        return self.__admission
+
+    @property
+    def instruments(self):
+        return self.__instruments
+
+    @property
+    def breakdown(self):
+        return self.__breakdown
+
+    def observe(self, instruments=None, breakdown=None):
+        """
+        attach instruments and a breakdown, e.g. to a cache restored from a
+        snapshot, which leaves both out; None detaches them
+        """
+        self.__instruments = instruments
+        self.__breakdown = breakdown
+        if breakdown is not None:
+            self.get = self.__observed_get
+        elif instruments is not None:
+            self.get = self.__timed_get
+        else:
+            self.__dict__.pop("get", None)
+        if instruments is not None:
+            self.put = self.__timed_put
+        else:
+            self.__dict__.pop("put", None)
+
+    def __observed_get(self, key, current_time, ttl=0, value=0):
+        breakdown = self.__breakdown
+        breakdown.advance(current_time)
+        if self.__instruments is not None:
+            result = self.__timed_get(key, current_time, ttl, value)
+        else:
+            result = CacheCore.get(self, key, current_time, ttl, value)
+        breakdown.request(ttl, value, result >= 0)
+        return result
+
+    def __timed_get(self, key, current_time, ttl=0, value=0):
+        start = perf_counter_ns()
+        result = CacheCore.get(self, key, current_time, ttl, value)
+        elapsed = perf_counter_ns() - start
+        self.__instruments.record("get_hit" if result >= 0 else "get_miss" if result == -1 else "get_expired",
+                                  elapsed)
+        return result
+
+    def __timed_put(self, key, value, current_time, ttl=0):
+        cached = key in self.__key_to_node
+        start = perf_counter_ns()
+        CacheCore.put(self, key, value, current_time, ttl)
+        elapsed = perf_counter_ns() - start
+        if key not in self.__key_to_node:
+            self.__instruments.record("put_skip", elapsed)
+        else:
+            self.__instruments.record("put_update" if cached else "put_insert", elapsed)
+
+    def __timed_evictions(self, value):
+        """
+        the eviction loop of put(), timing every victim
+        """
+        instruments = self.__instruments
+        size = self.__size
+        n = 0
+        while (self.__capa < self.__size + value + self.__overhead):
+            start = perf_counter_ns()
+            self.__evict()
+            instruments.record("eviction", perf_counter_ns() - start)
+            n += 1
+        if n:
+            instruments.record_evictions(n, size - self.__size)
+
+    def get(self, key, current_time, ttl=0, value=0):
+        """
+        :type key: int
+        :type value: int, size of the object, counted in miss_bytes on a miss; an expired
+                     object counts its cached size when it is 0
+        :rtype: int, object size on a hit, -1 on a miss, -2 if the item had expired
+        """
+        if self.__admission is not None:
+            self.__admission.record(key)
+        node = self.__key_to_node.get(key)
+        if node is None: #item not in cache
+            self.__misses += 1
+            self.__miss_bytes += value
+            return -1
+        elif (node.ttl < self.__timer): #item has expired
+            self.__expire(node)
+            self.__misses += 1
+            self.__miss_bytes += value if value else node.value
+            return -2
+
+        self.__policy.touch(node)
+        if (current_time + ttl > node.ttl):
+            node.ttl = current_time + ttl
+            self.__ttl_index.add(key, node.ttl)
+        self.__hits += 1
+        self.__hit_bytes += node.value
+        return node.value
+
+    def put(self, key, value, current_time, ttl=0): #value is size of the object
+        """
+        :type key: int
+        :type value: int
+        :rtype: void
+        """
+        if current_time < self.__timer:
+            print("ERROR TIMER")
+        if current_time > self.__timer: #update timer
+            self.__timer = current_time
+            if self.__proactive_expiry:
+                self.__remove_expired()
+
+        if (ttl == 0): #if ttl is 0 no need to cache
+            return
+
+        node = self.__key_to_node.get(key)
+        if node is not None: #if key already exits then update ttl
+            if (node.value != value):
+                print(f"ERROR {node.value} != {value}")
+                exit()
+            node.ttl = ttl + self.__timer
+            self.__ttl_index.add(key, node.ttl)
+            return
+
+        if (self.__capa < value + self.__overhead): #item can never fit
+            return
+
+        if (self.__capa < self.__size + value + self.__overhead): #if item will not fit
+            if self.__reclaim_expired:
+                self.__remove_expired()
+            if (self.__admission is not None and self.__capa < self.__size + value + self.__overhead
+                    and not self.__admission.admit(key, self.__policy.victim().key)):
+                self.__rejections += 1 #the first victim is worth more than the newcomer
+                return
+            #evict items chosen by the policy one at a time until the item fits
+            if self.__instruments is not None:
+                self.__timed_evictions(value)
+            while (self.__capa < self.__size + value + self.__overhead):
+                self.__evict()
+
+        #add item
+        node = ListNode(key, value, ttl+self.__timer)
+        self.__key_to_node[key] = node
+        self.__policy.insert(node)
+        self.__ttl_index.add(key, node.ttl)
+        self.__size += value + self.__overhead
+        self.__insertions += 1
+        if self.__breakdown is not None:
+            self.__breakdown.inserted(node, ttl)
+        return
+
+    def get_many(self, keys, times, ttls, values=None):
+        """
+        get() over a block of requests, in order
+        :type values: list of int or None, object sizes for miss_bytes, as get() takes them
+        :return: array('b') hit mask, 1 where get() returns the object size
+        """
+        if values is None:
+            values = repeat(0)
+        if self.__instruments is not None or self.__breakdown is not None:
+            get = self.get
+            return array("b", [get(key, t, ttl, value) >= 0
+                               for key, t, ttl, value in zip(keys, times, ttls, values)])
+        hits = array("b", bytes(len(keys)))
+        lookup = self.__key_to_node.get
+        touch = self.__policy.touch
+        add_expiry = self.__ttl_index.add
+        record, hashes = self.__recorder(keys)
+        timer = self.__timer #only put() moves the timer
+        n_hits = 0
+        hit_bytes = 0
+        miss_bytes = 0
+        i = -1
+        for key, t, ttl, value, h in zip(keys, times, ttls, values, hashes):
+            i += 1
+            if record is not None:
+                record(h)
+            node = lookup(key)
+            if node is None:
+                miss_bytes += value
+                continue
+            if (node.ttl < timer):
+                self.__expire(node)
+                miss_bytes += value if value else node.value
+                continue
+            touch(node)
+            if (t + ttl > node.ttl):
+                node.ttl = t + ttl
+                add_expiry(key, node.ttl)
+            hits[i] = 1
+            n_hits += 1
+            hit_bytes += node.value
+        self.__hits += n_hits
+        self.__hit_bytes += hit_bytes
+        self.__miss_bytes += miss_bytes
+        self.__misses += len(keys) - n_hits
+        return hits
+
+    def put_many(self, keys, values, times, ttls):
+        """
+        put() over a block of objects, in order
+        """
+        put = self.put
+        for key, value, t, ttl in zip(keys, values, times, ttls):
+            put(key, value, t, ttl)
+
+    def access_many(self, keys, values, times, ttls, ttl_override=None):
+        """
+        the replay step over a block of requests: get() each object and put()
+        it on a miss, with ttl_override replacing a trace ttl of 0 or 10.
+        identical to calling get/put one request at a time
+        :return: array('b') hit mask
+        """
+        if self.__instruments is not None or self.__breakdown is not None:
+            return self.__access_many_per_request(keys, values, times, ttls, ttl_override)
+        hits = array("b", bytes(len(keys)))
+        lookup = self.__key_to_node.get
+        touch = self.__policy.touch
+        add_expiry = self.__ttl_index.add
+        put = self.put
+        record, hashes = self.__recorder(keys)
+        timer = self.__timer
+        n_hits = 0
+        hit_bytes = 0
+        miss_bytes = 0
+        i = -1
+        for key, value, t, ttl, h in zip(keys, values, times, ttls, hashes):
+            i += 1
+            if record is not None:
+                record(h)
+            node = lookup(key)
+            if node is not None:
+                if (node.ttl >= timer):
+                    touch(node)
+                    if (t + ttl > node.ttl):
+                        node.ttl = t + ttl
+                        add_expiry(key, node.ttl)
+                    hits[i] = 1
+                    n_hits += 1
+                    hit_bytes += node.value
+                    continue
+                self.__expire(node)
+            miss_bytes += value
+            if ttl_override is not None and (ttl == 10 or ttl == 0):
+                ttl = ttl_override
+            put(key, value, t, ttl)
+            timer = self.__timer
+        self.__hits += n_hits
+        self.__hit_bytes += hit_bytes
+        self.__miss_bytes += miss_bytes
+        self.__misses += len(keys) - n_hits
+        return hits
+
+    def __access_many_per_request(self, keys, values, times, ttls, ttl_override):
+        """
+        access_many() through the get() and put() wrappers of the instruments
+        and the breakdown
+        """
+        hits = array("b", bytes(len(keys)))
+        get = self.get
+        put = self.put
+        i = -1
+        for key, value, t, ttl in zip(keys, values, times, ttls):
+            i += 1
+            if get(key, t, ttl, value) >= 0:
+                hits[i] = 1
+            else:
+                if ttl_override is not None and (ttl == 10 or ttl == 0):
+                    ttl = ttl_override
+                put(key, value, t, ttl)
+        return hits
+
+    def __recorder(self, keys):
+        """
+        :return: (admission.record_hash or None, key hashes for it), the
+                 hashes of the whole block are computed up front
+        """
+        if self.__admission is None:
+            return None, repeat(None)
+        return self.__admission.record_hash, self.__admission.hashes(keys)
+
+    def __expire(self, node):
+        """
+        drop an expired node found by a lookup
+        """
+        self.__size -= node.value + self.__overhead #update cache size
+        self.__ttl_expirations += 1
+        del self.__key_to_node[node.key] #delete expired node
+        self.__policy.remove(node)
+        self.__ttl_index.discard(node.key)
+        if self.__breakdown is not None:
+            self.__breakdown.expired(node)
+
+    def __evict(self):
+        node = self.__policy.evict()
+        del self.__key_to_node[node.key]
+        self.__ttl_index.discard(node.key)
+        self.__size -= node.value + self.__overhead #decrease cache size
+        self.__evictions += 1
+        if self.__breakdown is not None:
+            self.__breakdown.evicted(node)
+
+    def __remove_expired(self):
+        """
+        drop every item whose ttl is before the timer, in O(expired)
+        """
+        for k in self.__ttl_index.expire(self.__timer):
+            node = self.__key_to_node.pop(k)
+            self.__policy.remove(node)
+            self.__size -= node.value + self.__overhead #decrease cache size
+            self.__ttl_expirations += 1
+            if self.__breakdown is not None:
+                self.__breakdown.expired(node)
+
+    def snapshot(self):
+        """
+        the whole cache as flat columns, see snapshot.py: the nodes in
+        policy order and the TTL index; keys must be ints
+        :return: (json serializable meta, dict name -> array)
+        """
+        nodes = list(self.__policy.nodes())
+        meta = {
+            "engine": "cache_core",
+            "policy": self.__policy.name,
+            "policy_state": self.__policy.state(),
+            "capacity": self.__capa,
+            "overhead": self.__overhead,
+            "reclaim_expired": self.__reclaim_expired,
+            "proactive_expiry": self.__proactive_expiry,
+            "admission": None,
+            "size": self.__size,
+            "timer": self.__timer,
+            "stats": self.getStats(),
+        }
+        arrays = {
+            "keys": array("Q", [node.key for node in nodes]),
+            "values": array("q", [node.value for node in nodes]),
+            "ttls": array("q", [node.ttl for node in nodes]),
+            "freqs": array("q", [node.freq for node in nodes]),
+            "ttl_buckets": array("h", [node.ttl_bucket for node in nodes]),
+        }
+        arrays.update(self.__ttl_index.columns())
+        arrays.update(("policy_" + name, column) for name, column in self.__policy.columns().items())
+        if self.__admission is not None:
+            meta["admission"], columns = self.__admission.snapshot()
+            arrays.update(("admission_" + name, column) for name, column in columns.items())
+        return meta, arrays
+
+    def restore(self, meta, arrays):
+        """
+        refill an empty cache built with the capacity, policy and flags of
+        meta from the columns of snapshot()
+        """
+        key_to_node = self.__key_to_node
+        nodes = []
+        for key, value, ttl, freq in zip(arrays["keys"], arrays["values"], arrays["ttls"], arrays["freqs"]):
+            node = ListNode(key, value, ttl, freq)
+            key_to_node[key] = node
+            nodes.append(node)
+        if "ttl_buckets" in arrays:
+            for node, bucket in zip(nodes, arrays["ttl_buckets"]):
+                node.ttl_bucket = bucket
+        self.__policy.restore(nodes, meta["policy_state"],
+                              {name[len("policy_"):]: column for name, column in arrays.items()
+                               if name.startswith("policy_")})
+        self.__ttl_index.restore(arrays)
+        if self.__admission is not None:
+            self.__admission.restore(meta["admission"], {name[len("admission_"):]: column
+                                                         for name, column in arrays.items()
+                                                         if name.startswith("admission_")})
+        self.__size = meta["size"]
+        self.__timer = meta["timer"]
+        stats = meta["stats"]
+        self.__evictions = stats["evictions"]
+        self.__hits = stats["hits"]
+        self.__misses = stats["misses"]
+        self.__ttl_expirations = stats["expirations"]
+        self.__insertions = stats["insertions"]
+        self.__rejections = stats.get("admission_rejections", 0)
+        self.__hit_bytes = stats.get("hit_bytes", 0)
+        self.__miss_bytes = stats.get("miss_bytes", 0)
+
+    def __contains__(self, key):
+        return key in self.__key_to_node
+
+    def __len__(self):
+        return len(self.__key_to_node)
+
+    def getSize(self):
+        return self.__size
+
+    def getCapacity(self):
+        return self.__capa
+
+    def getStats(self):
+        stats = {
+            "evictions": self.__evictions,
+            "hits": self.__hits,
+            "misses": self.__misses,
+            "expirations": self.__ttl_expirations,
+            "insertions": self.__insertions,
+            "hit_bytes": self.__hit_bytes,
+            "miss_bytes": self.__miss_bytes,
+        }
+        if self.__admission is not None:
+            stats["admission_rejections"] = self.__rejections
+        return stats
+
+    def printStats(self):
+        print(f"evictions {self.__evictions}")
+        print(f"hits {self.__hits}")
+        print(f"misses {self.__misses}")
+        print(f"expirations {self.__ttl_expirations}")
+        print(f"insertions {self.__insertions}")
+        print(f"byte hit ratio {byte_hit_ratio(self.getStats())}")
+        if self.__admission is not None:
+            print(f"admission rejections {self.__rejections}")
@@ -0,0 +1,203 @@
+import bisect
+from array import array
+
+
+TTL_BOUNDS = [0, 60, 300, 3600, 43200, 86400, 604800, 1296000] #inclusive upper ends of the TTL buckets, a last one takes the rest
+N_SIZE_CLASSES = 32 #size class c holds sizes in [2 ** (c - 1), 2 ** c), the last one everything larger
+METRICS = ["requests", "hits", "bytes", "hit_bytes", "evictions", "evicted_bytes", "expirations",
+           "expired_bytes"]
+ROW_COLUMNS = ["window_start", "dimension", "class", "requests", "hits", "hit_ratio", "bytes", "hit_bytes",
+               "byte_hit_ratio", "evictions", "evicted_bytes", "expirations", "expired_bytes"]
+
+
+def size_class(size):
+    return min(size.bit_length(), N_SIZE_CLASSES - 1)
+
+
+def size_class_label(c):
+    if c == 0:
+        return "0"
+    if c == N_SIZE_CLASSES - 1:
+        return f">={1 << (c - 1)}"
+    return f"{1 << (c - 1)}-{(1 << c) - 1}"
+
+
+class ClassStats(object):
+    """
+    streaming breakdown of a replay by TTL bucket and by log2 size class:
+    requests, hits and their bytes, evictions and expirations with their
+    bytes. every counter lives in a preallocated array of one cell per
+    (TTL bucket, size class) pair, so both breakdowns come from the same
+    counts and nothing grows with the trace.
+
+    the counts are also kept per window of trace time; when a request
+    starts a new window, the rows of the previous one go to emit(rows), by
+    default appended to self.series.
+
+    CacheCore(breakdown=...) feeds it: get(), and so every block method,
+    reports each request with its size, and the core reports insertions,
+    evictions and expirations. the TTL bucket of a request is that of the
+    ttl the cache applies, after ttl_override; an evicted or expired object is counted in the bucket
+    it was inserted with, kept in the ttl_bucket slot of its node. objects
+    cached before the breakdown was attached go to an "unknown" TTL bucket
+    """
+
+    def __init__(self, window=3600, ttl_bounds=TTL_BOUNDS, emit=None, ttl_override=None):
+        """
+        :type window: int, seconds of trace time per time series row
+        :type ttl_bounds: sorted list of int, inclusive upper ends of the TTL buckets
+        :type emit: callable(list of dict rows) or None to collect them in self.series
+        :type ttl_override: int or None, the ttl_override of the replay: a request
+                            with a ttl of 0 or 10 counts in the bucket of this ttl
+        """
+        self.window = window
+        self.ttl_override = ttl_override
+        self.ttl_bounds = list(ttl_bounds)
+        self.n_ttl = len(self.ttl_bounds) + 2 #the last bound is followed by an overflow and an unknown bucket
+        self.series = []
+        self.__emit = emit if emit is not None else self.series.extend
+        n_cells = self.n_ttl * N_SIZE_CLASSES
+        self.__window_counts = {metric: array("q", bytes(8 * n_cells)) for metric in METRICS}
+        self.__total_counts = {metric: array("q", bytes(8 * n_cells)) for metric in METRICS}
+        self.__window_start = None
+
+    def ttl_bucket(self, ttl):
+        return bisect.bisect_left(self.ttl_bounds, ttl)
+
+    def ttl_label(self, bucket):
+        if bucket == self.n_ttl - 1:
+            return "unknown"
+        if bucket == len(self.ttl_bounds):
+            return f">{self.ttl_bounds[-1]}"
+        low = self.ttl_bounds[bucket - 1] + 1 if bucket else 0
+        return f"{low}-{self.ttl_bounds[bucket]}"
+
+    def advance(self, t):
+        """
+        move to the window holding trace time t, emitting the finished ones
+        """
+        if self.__window_start is None:
+            self.__window_start = t - t % self.window
+        elif t >= self.__window_start + self.window:
+            self.__close_window()
+            self.__window_start = t - t % self.window
+
+    def request(self, ttl, size, hit):
+        """
+        count a request of the current window
+        :type ttl: int, ttl of the request
+        """
+        if self.ttl_override is not None and (ttl == 10 or ttl == 0):
+            ttl = self.ttl_override
+        counts = self.__window_counts
+        cell = self.ttl_bucket(ttl) * N_SIZE_CLASSES + size_class(size)
+        counts["requests"][cell] += 1
+        counts["bytes"][cell] += size
+        if hit:
+            counts["hits"][cell] += 1
+            counts["hit_bytes"][cell] += size
+
+    def inserted(self, node, ttl):
+        node.ttl_bucket = self.ttl_bucket(ttl)
+
+    def __node_cell(self, node):
+        bucket = node.ttl_bucket if node.ttl_bucket >= 0 else self.n_ttl - 1
+        return bucket * N_SIZE_CLASSES + size_class(node.value)
+
+    def evicted(self, node):
+        cell = self.__node_cell(node)
+        self.__window_counts["evictions"][cell] += 1
+        self.__window_counts["evicted_bytes"][cell] += node.value
+
+    def expired(self, node):
+        cell = self.__node_cell(node)
+        self.__window_counts["expirations"][cell] += 1
+        self.__window_counts["expired_bytes"][cell] += node.value
+
+    def __close_window(self):
+        window = self.__window_counts
+        self.__emit(self.rows(window, self.__window_start))
+        for metric in METRICS:
+            total = self.__total_counts[metric]
+            counts = window[metric]
+            for cell, n in enumerate(counts):
+                if n:
+                    total[cell] += n
+            window[metric] = array("q", bytes(8 * len(counts)))
+
+    def flush(self):
+        """
+        emit the window in progress, at the end of a replay
+        """
+        if self.__window_start is not None:
+            self.__close_window()
+            self.__window_start = None
+
+    def state(self):
+        """
+        :return: json serializable counts of the open window and the totals, for restore()
+        """
+        return {
+            "window": self.window,
+            "ttl_bounds": self.ttl_bounds,
+            "ttl_override": self.ttl_override,
+            "window_start": self.__window_start,
+            "window_counts": {metric: counts.tolist() for metric, counts in self.__window_counts.items()},
+            "total_counts": {metric: counts.tolist() for metric, counts in self.__total_counts.items()},
+        }
+
+    def restore(self, state):
+        """
+        continue from state(), e.g. with a cache resumed from a checkpoint
+        """
+        mine = (self.window, self.ttl_bounds, self.ttl_override)
+        theirs = (state["window"], state["ttl_bounds"], state["ttl_override"])
+        if mine != theirs:
+            raise ValueError(f"breakdown of (window, ttl_bounds, ttl_override) {theirs}, not {mine}")
+        self.__window_start = state["window_start"]
+        self.__window_counts = {metric: array("q", state["window_counts"][metric]) for metric in METRICS}
+        self.__total_counts = {metric: array("q", state["total_counts"][metric]) for metric in METRICS}
+
+    def rows(self, counts=None, window_start="total"):
+        """
+        one row per TTL bucket and per size class with any activity, after a
+        row for all of them; the totals of every closed window by default
+        :rtype: list of dict with ROW_COLUMNS
+        """
+        if counts is None:
+            counts = self.__total_counts
+        ttl_sums = {metric: [0] * self.n_ttl for metric in METRICS}
+        size_sums = {metric: [0] * N_SIZE_CLASSES for metric in METRICS}
+        for metric in METRICS:
+            for cell, n in enumerate(counts[metric]):
+                if n:
+                    ttl_sums[metric][cell // N_SIZE_CLASSES] += n
+                    size_sums[metric][cell % N_SIZE_CLASSES] += n
+        rows = [_row(window_start, "all", "all", {metric: sum(ttl_sums[metric]) for metric in METRICS})]
+        for dimension, sums, label in [("ttl", ttl_sums, self.ttl_label), ("size", size_sums, size_class_label)]:
+            for c in range(len(sums["requests"])):
+                values = {metric: sums[metric][c] for metric in METRICS}
+                if any(values.values()):
+                    rows.append(_row(window_start, dimension, label(c), values))
+        return rows
+
+
+def _row(window_start, dimension, label, values):
+    row = {"window_start": window_start, "dimension": dimension, "class": label}
+    row.update(values)
+    row["hit_ratio"] = values["hits"] / values["requests"] if values["requests"] else 0.0
+    row["byte_hit_ratio"] = values["hit_bytes"] / values["bytes"] if values["bytes"] else 0.0
+    return row
+
+
+def format_rows(rows, sep=None, header=True):
+    """
+    :param sep: column separator, None pads columns for the console
+    """
+    cells = [[f"{r[c]:.6f}" if isinstance(r[c], float) else str(r[c]) for c in ROW_COLUMNS] for r in rows]
+    if header:
+        cells.insert(0, ROW_COLUMNS)
+    if sep is not None:
+        return "\n".join(sep.join(line) for line in cells)
+    widths = [max(len(line[i]) for line in cells) for i in range(len(ROW_COLUMNS))]
+    return "\n".join("  ".join(v.rjust(w) for v, w in zip(line, widths)) for line in cells)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+import fast_core
+from cache_core import CacheCore
+from eviction_policies import LFUPolicy, LRUPolicy
+from replay_sweep import FULL_HEAPSIZE, OVERHEAD, TTL_OVERRIDE, _share_trace
+from segcache import SegCache
+from trace_format import TraceWriter
+from trace_reader import read_trace_batches
+
+
+# (name, reference factory, fast factory), each takes (capacity, overhead); the
+# reclaim / proactive flags are those of the *_main scripts and replay_sweep.py
+PAIRS = [
+    ("lru", lambda c, o: CacheCore(c, LRUPolicy(), o),
+            lambda c, o: fast_core.FastLRUCache(c, o)),
+    ("lru no reclaim", lambda c, o: CacheCore(c, LRUPolicy(), o, reclaim_expired=False),
+                       lambda c, o: fast_core.FastLRUCache(c, o, reclaim_expired=False)),
+    ("lru proactive", lambda c, o: CacheCore(c, LRUPolicy(), o, proactive_expiry=True),
+                      lambda c, o: fast_core.FastLRUCache(c, o, proactive_expiry=True)),
+    ("lfu", lambda c, o: CacheCore(c, LFUPolicy(), o),
+            lambda c, o: fast_core.FastLFUCache(c, o)),
+    ("lfu no reclaim", lambda c, o: CacheCore(c, LFUPolicy(), o, reclaim_expired=False),
+                       lambda c, o: fast_core.FastLFUCache(c, o, reclaim_expired=False)),
+    ("lfu proactive", lambda c, o: CacheCore(c, LFUPolicy(), o, proactive_expiry=True),
+                      lambda c, o: fast_core.FastLFUCache(c, o, proactive_expiry=True)),
+]
+SYNTHETIC_TTLS = [2, 5, 60, 600, 3600] #real ttls, never the 0 or 10 that ttl_override replaces
+SYNTHETIC_FRACTIONS = [32, 8, 4] #synthetic trace capacities are its footprint divided by these
+
+
+def synthetic_trace(out_path, n_req=200000, n_keys=20000, seed=0, alpha=1.0, rate=100,
+                    overhead=OVERHEAD):
+    """
+    write a seeded zipf(alpha) trace of small objects (16 to 1024 bytes)
+    with short ttls, rate requests per second of trace time, so that every
+    pair both evicts and expires at capacities below its footprint
+    :return: footprint in bytes, the distinct objects with overhead
+    """
+    rng = random.Random(seed)
+    sizes = [rng.randint(16, 1024) for _ in range(n_keys)]
+    ttls = [rng.choice(SYNTHETIC_TTLS) for _ in range(n_keys)]
+    cum_weights = list(itertools.accumulate(1.0 / (k + 1) ** alpha for k in range(n_keys)))
+    seen = set()
+    with TraceWriter(out_path) as writer:
+        for i, key in enumerate(rng.choices(range(n_keys), cum_weights=cum_weights, k=n_req)):
+            seen.add(key)
+            writer.write(i // rate, key, sizes[key], 0, 1, ttls[key])
+        writer.close(len(seen))
+    return sum(sizes[key] + overhead for key in seen)
+
+
+def check(trace_path, capacities, ttl_override=TTL_OVERRIDE, overhead=OVERHEAD, require_activity=False):
+    """
+    replay the trace through every reference / fast pair at every capacity;
+    the counts and the bytes cached, expired objects included, must match
+    after every block of requests, not only at the end, as most expiry
+    differences are reclaimed by the next put that has to evict
+    :param require_activity: also fail a replay that evicted or expired nothing, as it
+                             shows nothing about that code
+    :return: list of (name, capacity, message) that failed
+    """
+    failures = []
+    for name, reference, fast in PAIRS:
+        for capacity in capacities:
+            expected = reference(capacity, overhead)
+            actual = fast(capacity, overhead)
+            error = None
+            for times, objs, sizes, ttls in read_trace_batches(trace_path, batch_size=4096):
+                expected.access_many(objs, sizes, times, ttls, ttl_override)
+                actual.access_many(objs, sizes, times, ttls, ttl_override)
+                if expected.getStats() != actual.getStats():
+                    error = f"at time {times[-1]}: expected {expected.getStats()}, got {actual.getStats()}"
+                elif expected.getSize() != actual.getSize():
+                    error = (f"at time {times[-1]}: expected {expected.getSize()} bytes cached, "
+                             f"got {actual.getSize()}")
+                if error is not None:
+                    break
+            stats = actual.getStats()
+            if error is None and require_activity and not (stats["evictions"] and stats["expirations"]):
+                error = f"nothing evicted or nothing expired: {stats}"
+            print(f"{'ok  ' if error is None else 'FAIL'} {name:15s} {capacity:12d}  {stats}")
+            if error is not None:
+                failures.append((name, capacity, error))
+    return failures
+
+
+def check_segcache(trace_path, capacities, ttl_override=TTL_OVERRIDE, overhead=OVERHEAD):
+    """
+    replay the trace through SegCache with 8 segments, so merges are
+    frequent, putting hits as well as misses so cached keys get rewritten
+    into their segment; the byte accounting is checked after every block
+    and a replay without merges fails. capacities whose segments are
+    smaller than the largest object of the trace are skipped
+    :return: list of (name, capacity, error message) that failed
+    """
+    failures = []
+    shared_path, tmp_path = _share_trace(trace_path, 0)
+    size_field = "key_len" if tmp_path is None else "val_len"
+    try:
+        largest = max(max(sizes) for _, _, sizes, _ in read_trace_batches(shared_path, size_field=size_field))
+        for capacity in capacities:
+            segment_size = capacity // 8
+            if segment_size < largest + overhead:
+                print(f"skip {'segcache merges':15s} {capacity:12d}  segments of {segment_size} bytes, "
+                      f"objects up to {largest + overhead}")
+                continue
+            cache = SegCache(capacity, overhead, segment_size=segment_size)
+            error = None
+            try:
+                for times, objs, sizes, ttls in read_trace_batches(shared_path, size_field=size_field,
+                                                                   batch_size=4096):
+                    for t, key, size, ttl in zip(times, objs, sizes, ttls):
+                        cached = cache.get(key, t, ttl, size)
+                        if cached >= 0: #rewrite with the cached size, a trace may change it
+                            size = cached
+                        if ttl_override is not None and (ttl == 10 or ttl == 0):
+                            ttl = ttl_override
+                        cache.put(key, size, t, ttl)
+                    cache.check()
+                if not cache.getStats()["merges"]:
+                    error = f"no merges: {cache.getStats()}"
+            except ValueError as e:
+                error = str(e)
+            print(f"{'ok  ' if error is None else 'FAIL'} {'segcache merges':15s} {capacity:12d}  "
+                  f"{error or cache.getStats()}")
+            if error is not None:
+                failures.append(("segcache merges", capacity, error))
+    finally:
+        if tmp_path is not None:
+            os.remove(tmp_path)
+    return failures
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("trace", help="the path to the trace", type=str, nargs="?",
+                    default="n.sbin-10000000_items_10_ttl.txt")
+    ap.add_argument("--capacities", help="cache sizes in bytes", nargs="+", type=int,
+                    default=[FULL_HEAPSIZE // 4, FULL_HEAPSIZE, 4 * FULL_HEAPSIZE])
+    ap.add_argument("--synthetic_requests", help="requests of the synthetic small-object trace "
+                    "also checked, 0 to skip it", type=int, default=200000)
+    args = ap.parse_args()
+
+    start = time.time()
+    print(f"fast_core compiled: {fast_core.COMPILED}")
+    failures = check(args.trace, args.capacities)
+    failures += check_segcache(args.trace, args.capacities)
+    if args.synthetic_requests:
+        #the bundled trace holds a handful of ~100 MB objects that never expire; this one
+        #runs every pair through evictions and expirations
+        fd, synthetic_path = tempfile.mkstemp(suffix=".ctrace")
+        os.close(fd)
+        try:
+            footprint = synthetic_trace(synthetic_path, args.synthetic_requests)
+            print(f"synthetic trace: {args.synthetic_requests} requests, footprint {footprint} bytes")
+            capacities = [footprint // fraction for fraction in SYNTHETIC_FRACTIONS]
+            failures += check(synthetic_path, capacities, require_activity=True)
+            failures += check_segcache(synthetic_path, capacities)
+        finally:
+            os.remove(synthetic_path)
+    for name, capacity, error in failures:
+        print(f"{name} at {capacity}: {error}")
+    print(f"time: {time.time() - start} seconds")
+    sys.exit(1 if failures else 0)
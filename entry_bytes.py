@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import argparse
+import gc
+import sys
+import tracemalloc
+
+from replay_sweep import ENGINES, OVERHEAD, make_cache
+from eviction_policies import POLICIES
+from sharded_cache import ShardedExpiringDict
+from LRUCache_TTLImplementation import ExpiringDict
+
+
+def _fill_engine(name, n, value_size):
+    """
+    :type name: str, an eviction policy name or one of replay_sweep.ENGINES
+    """
+    cache = make_cache(name, n * (value_size + OVERHEAD) * 2, OVERHEAD)
+    for key in range(n):
+        cache.put(key, value_size, 1, 3600)
+    return cache
+
+
+def _fill_expiring(cls, n, value_size):
+    """
+    :type cls: ExpiringDict or ShardedExpiringDict
+    """
+    cache = cls(n * value_size * 2, 3600)
+    for key in range(n):
+        cache.__setitem__(key, (value_size, 3600), set_time=1)
+    return cache
+
+
+def entry_bytes(fill, name, n, value_size=100):
+    """
+    python heap allocated per cached object once n objects are in the cache,
+    measured with tracemalloc while fill(name, n, value_size) builds it
+    :rtype: float
+    """
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    cache = fill(name, n, value_size)
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del cache
+    return used / n
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--objects", help="objects put in every cache", type=int, default=200000)
+    ap.add_argument("--value_size", help="simulated object size in bytes", type=int, default=100)
+    args = ap.parse_args()
+
+    print(f"python {sys.version.split()[0]}, {args.objects} objects of {args.value_size} bytes")
+    print("engine              bytes_per_entry")
+    for name in sorted(POLICIES) + sorted(ENGINES):
+        print(f"{name:18s}  {entry_bytes(_fill_engine, name, args.objects, args.value_size):15.1f}")
+    for cls in (ExpiringDict, ShardedExpiringDict):
+        print(f"{cls.__name__:18s}  {entry_bytes(_fill_expiring, cls, args.objects, args.value_size):15.1f}")
@@ -0,0 +1,812 @@
+import random
+from array import array
+from collections import OrderedDict
+
+from cache_core import ListNode
+from ghost_list import GhostList
+from hashing import mix64
+from indexed_heap import IndexedHeap
+
+
+class EvictionPolicy(object):
+    """
+    ordering of the cached nodes of a CacheCore. the core calls insert() for
+    every new node, touch() on every hit, remove() when a node leaves for
+    another reason (expiry) and evict() when it needs room
+    """
+    name = None
+
+    def attach(self, capacity, overhead):
+        """
+        called once by the core with its byte budget and per-item overhead,
+        for policies that size their queues in bytes; a node takes
+        node.value + overhead bytes
+        """
+        pass
+
+    def insert(self, node):
+        raise NotImplementedError
+
+    def touch(self, node):
+        raise NotImplementedError
+
+    def remove(self, node):
+        raise NotImplementedError
+
+    def evict(self):
+        """
+        unlink and return the next victim
+        :rtype: ListNode
+        """
+        raise NotImplementedError
+
+    def victim(self):
+        """
+        the node evict() would return next, left in place; used by admission
+        filters to weigh a candidate against it
+        :rtype: ListNode
+        """
+        raise NotImplementedError
+
+    def nodes(self):
+        """
+        every node, in the order restore() rebuilds the policy from
+        """
+        raise NotImplementedError
+
+    def state(self):
+        """
+        json serializable policy state beyond the node order, None if there is none
+        """
+        return None
+
+    def columns(self):
+        """
+        policy state too large for state(), such as ghost entries, as flat columns
+        :return: dict name -> array
+        """
+        return {}
+
+    def restore(self, nodes, state=None, columns=None):
+        """
+        refill an empty, attached policy with the nodes(), state() and
+        columns() of another one
+        """
+        for node in nodes:
+            self.insert(node)
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class LRUPolicy(EvictionPolicy):
+    """
+    least recently used, an OrderedDict with the LRU node first
+    """
+    name = "lru"
+
+    def __init__(self):
+        self.__order = OrderedDict()
+
+    def insert(self, node):
+        self.__order[node.key] = node
+
+    def touch(self, node):
+        self.__order.move_to_end(node.key) #mark as most recently used
+
+    def remove(self, node):
+        del self.__order[node.key]
+
+    def evict(self):
+        return self.__order.popitem(last=False)[1]
+
+    def victim(self):
+        return next(iter(self.__order.values()))
+
+    def nodes(self):
+        return iter(self.__order.values()) #least recently used first
+
+    def __len__(self):
+        return len(self.__order)
+
+
+class FIFOPolicy(LRUPolicy):
+    """
+    first in first out, hits do not change the order
+    """
+    name = "fifo"
+
+    def touch(self, node):
+        pass
+
+
+class RandomPolicy(EvictionPolicy):
+    """
+    evicts a uniformly random node; nodes live in a list and are removed by
+    swapping the last one into their slot
+    """
+    name = "random"
+
+    def __init__(self, seed=0):
+        self.__nodes = []
+        self.__slot = {} #key -> index in __nodes
+        self.__random = random.Random(seed)
+        self.__victim = None #drawn by victim() and not evicted yet
+
+    def insert(self, node):
+        self.__slot[node.key] = len(self.__nodes)
+        self.__nodes.append(node)
+
+    def touch(self, node):
+        pass
+
+    def remove(self, node):
+        if node is self.__victim:
+            self.__victim = None
+        i = self.__slot.pop(node.key)
+        last = self.__nodes.pop()
+        if last is not node:
+            self.__nodes[i] = last
+            self.__slot[last.key] = i
+
+    def evict(self):
+        node = self.victim()
+        self.remove(node)
+        return node
+
+    def victim(self):
+        if self.__victim is None: #draw once, evict() takes the same node
+            self.__victim = self.__nodes[self.__random.randrange(len(self.__nodes))]
+        return self.__victim
+
+    def nodes(self):
+        return iter(self.__nodes) #slot order, so the same draws pick the same victims
+
+    def state(self):
+        version, internal, gauss_next = self.__random.getstate()
+        return {"random": [version, list(internal), gauss_next],
+                "victim": None if self.__victim is None else self.__victim.key}
+
+    def restore(self, nodes, state=None, columns=None):
+        EvictionPolicy.restore(self, nodes)
+        if state is not None:
+            version, internal, gauss_next = state["random"]
+            self.__random.setstate((version, tuple(internal), gauss_next))
+            if state["victim"] is not None:
+                self.__victim = self.__nodes[self.__slot[state["victim"]]]
+
+    def __len__(self):
+        return len(self.__nodes)
+
+
+class LinkedList(object):
+    """
+    circular doubly linked list holding every node with the same frequency,
+    most recently used node at the head and least recently used at the tail.
+    the lists themselves are chained in increasing frequency order so the
+    next smallest frequency is always one link away
+    """
+    __slots__ = ("freq", "size", "head", "lower", "higher")
+
+    def __init__(self, freq=0):
+        self.freq = freq
+        self.size = 0
+        self.head = ListNode(None, 0) #sentinel node
+        self.head.prev = self.head
+        self.head.next = self.head
+        self.lower = None #bucket with the next smaller frequency
+        self.higher = None #bucket with the next larger frequency
+
+    def __len__(self):
+        return self.size
+
+    def append(self, node):
+        """
+        insert node at the most recently used end
+        :type node: ListNode
+        """
+        node.prev = self.head
+        node.next = self.head.next
+        self.head.next.prev = node
+        self.head.next = node
+        self.size += 1
+
+    def pop(self, node=None):
+        """
+        unlink node, or the least recently used node if none is given
+        :type node: ListNode
+        :rtype: ListNode
+        """
+        if self.size == 0:
+            return None
+        if node is None:
+            node = self.head.prev
+        node.prev.next = node.next
+        node.next.prev = node.prev
+        node.prev = None
+        node.next = None
+        self.size -= 1
+        return node
+
+
+class LFUPolicy(EvictionPolicy):
+    """
+    least frequently used with O(1) insert, touch and evict: nodes sit in
+    per-frequency LinkedLists and ties are broken by recency
+    """
+    name = "lfu"
+
+    def __init__(self):
+        self.__freq_to_nodes = {} #frequency -> LinkedList of nodes with that frequency
+        self.__buckets = LinkedList(-1) #sentinel of the frequency chain, lowest bucket is __buckets.higher
+        self.__buckets.lower = self.__buckets
+        self.__buckets.higher = self.__buckets
+        self.__len = 0
+
+    @property
+    def min_freq(self):
+        return self.__buckets.higher.freq
+
+    def __bucket_after(self, bucket, freq):
+        """
+        return the bucket for freq, creating it right above bucket if missing
+        :type bucket: LinkedList
+        :type freq: int
+        :rtype: LinkedList
+        """
+        nxt = bucket.higher
+        if nxt.freq == freq:
+            return nxt
+        new = LinkedList(freq)
+        new.lower = bucket
+        new.higher = nxt
+        bucket.higher = new
+        nxt.lower = new
+        self.__freq_to_nodes[freq] = new
+        return new
+
+    def __unlink(self, node):
+        """
+        remove node from its frequency bucket, dropping the bucket once empty
+        """
+        bucket = self.__freq_to_nodes[node.freq]
+        bucket.pop(node)
+        if not bucket.size:
+            bucket.lower.higher = bucket.higher
+            bucket.higher.lower = bucket.lower
+            del self.__freq_to_nodes[node.freq]
+
+    def insert(self, node):
+        node.freq = 0
+        self.__bucket_after(self.__buckets, 0).append(node)
+        self.__len += 1
+
+    def touch(self, node):
+        bucket = self.__freq_to_nodes[node.freq]
+        target = self.__bucket_after(bucket, node.freq + 1)
+        self.__unlink(node)
+        node.freq += 1 #update frequency
+        target.append(node)
+
+    def remove(self, node):
+        self.__unlink(node)
+        self.__len -= 1
+
+    def evict(self):
+        node = self.__buckets.higher.head.prev #lru node of the lowest frequency
+        self.remove(node)
+        return node
+
+    def victim(self):
+        return self.__buckets.higher.head.prev
+
+    def nodes(self):
+        """
+        every node in eviction order: lowest frequency first, least
+        recently used first within a frequency
+        """
+        bucket = self.__buckets.higher
+        while bucket is not self.__buckets:
+            node = bucket.head.prev
+            while node is not bucket.head:
+                yield node
+                node = node.prev
+            bucket = bucket.higher
+
+    def __getstate__(self):
+        return {"nodes": list(self.nodes())} #a dict, pickle skips __setstate__ for an empty state
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.restore(state["nodes"])
+
+    def restore(self, nodes, state=None, columns=None):
+        """
+        unlike insert(), keeps the frequency of every node
+        """
+        bucket = self.__buckets
+        for node in nodes: #frequencies ascend, append() puts each node at the most recent end
+            if bucket.freq != node.freq:
+                bucket = self.__bucket_after(bucket, node.freq)
+            bucket.append(node)
+            self.__len += 1
+
+    def __len__(self):
+        return self.__len
+
+
+class ARCPolicy(EvictionPolicy):
+    """
+    adaptive replacement cache (Megiddo and Modha, FAST '03) counted in
+    bytes. T1 holds the objects not read since they entered, T2 those read
+    again, both in LRU order; node.freq is 0 in T1 and 1 in T2. an evicted
+    object leaves its key hash in ghost list B1 or B2. a miss found in B1
+    grows the byte target p of T1, one found in B2 shrinks it, and either
+    goes straight to T2. the core makes room before it inserts, so p adapts
+    on the insert that follows the evictions
+    """
+    name = "arc"
+
+    def __init__(self):
+        self.__t1 = OrderedDict() #key -> node, least recently used first
+        self.__t2 = OrderedDict()
+        self.__b1 = GhostList()
+        self.__b2 = GhostList()
+        self.__t1_bytes = 0
+        self.__t2_bytes = 0
+        self.__p = 0 #target bytes of T1
+        self.__capacity = 0
+        self.__overhead = 0
+
+    def attach(self, capacity, overhead):
+        self.__capacity = capacity
+        self.__overhead = overhead
+
+    def __trim_ghosts(self):
+        """
+        keep T1 + B1 within the capacity and the whole directory within twice it
+        """
+        self.__b1.trim(max(0, self.__capacity - self.__t1_bytes))
+        self.__b2.trim(max(0, 2 * self.__capacity - self.__t1_bytes - self.__t2_bytes - self.__b1.bytes))
+
+    def insert(self, node):
+        size = node.value + self.__overhead
+        h = mix64(node.key)
+        b1 = self.__b1.bytes
+        b2 = self.__b2.bytes
+        if self.__b1.pop(h) is not None: #evicted from T1 too early, favor recency
+            self.__p = min(self.__capacity, self.__p + size * max(1.0, b2 / b1 if b1 else 1.0))
+        elif self.__b2.pop(h) is not None: #evicted from T2 too early, favor frequency
+            self.__p = max(0, self.__p - size * max(1.0, b1 / b2 if b2 else 1.0))
+        else:
+            node.freq = 0
+            self.__t1[node.key] = node
+            self.__t1_bytes += size
+            self.__trim_ghosts()
+            return
+        node.freq = 1
+        self.__t2[node.key] = node
+        self.__t2_bytes += size
+
+    def touch(self, node):
+        if node.freq == 0:
+            size = node.value + self.__overhead
+            del self.__t1[node.key]
+            self.__t1_bytes -= size
+            node.freq = 1
+            self.__t2[node.key] = node
+            self.__t2_bytes += size
+        else:
+            self.__t2.move_to_end(node.key) #mark as most recently used
+
+    def remove(self, node):
+        if node.freq == 0:
+            del self.__t1[node.key]
+            self.__t1_bytes -= node.value + self.__overhead
+        else:
+            del self.__t2[node.key]
+            self.__t2_bytes -= node.value + self.__overhead
+
+    def victim(self):
+        if self.__t1 and (self.__t1_bytes > self.__p or not self.__t2):
+            return next(iter(self.__t1.values()))
+        return next(iter(self.__t2.values()))
+
+    def evict(self):
+        node = self.victim()
+        self.remove(node)
+        (self.__b1 if node.freq == 0 else self.__b2).append(mix64(node.key), node.value + self.__overhead)
+        self.__trim_ghosts()
+        return node
+
+    def nodes(self):
+        yield from self.__t1.values()
+        yield from self.__t2.values()
+
+    def state(self):
+        return {"p": self.__p}
+
+    def columns(self):
+        columns = self.__b1.columns("b1")
+        columns.update(self.__b2.columns("b2"))
+        return columns
+
+    def restore(self, nodes, state=None, columns=None):
+        """
+        node.freq tells T1 from T2
+        """
+        for node in nodes:
+            if node.freq == 0:
+                self.__t1[node.key] = node
+                self.__t1_bytes += node.value + self.__overhead
+            else:
+                self.__t2[node.key] = node
+                self.__t2_bytes += node.value + self.__overhead
+        if state is not None:
+            self.__p = state["p"]
+        if columns:
+            self.__b1.restore(columns, "b1")
+            self.__b2.restore(columns, "b2")
+
+    def __len__(self):
+        return len(self.__t1) + len(self.__t2)
+
+
+class LIRSPolicy(EvictionPolicy):
+    """
+    low inter-reference recency set (Jiang and Zhang, SIGMETRICS '02)
+    counted in bytes. LIR objects (node.freq 1) fill up to 1 - HIR_FRACTION
+    of the capacity and are never evicted directly; the other, HIR objects
+    (node.freq 0) wait in a FIFO queue whose head is the victim. the LIRS
+    stack orders recently used objects by key hash, resident or not, and is
+    pruned so its bottom is always LIR: an HIR object read again while it is
+    still in the stack turns LIR and the bottom LIR object is demoted to
+    the queue. stack entries of evicted objects are ghosts, kept in a FIFO
+    of their own that holds at most the capacity in bytes
+    """
+    name = "lirs"
+    HIR_FRACTION = 0.01
+
+    def __init__(self):
+        self.__stack = GhostList() #key hash -> node, None once evicted; bottom (oldest) first
+        self.__queue = OrderedDict() #key -> node of the resident HIR objects, victim first
+        self.__ghosts = GhostList() #hashes of the nonresident stack entries, oldest first
+        self.__lir_bytes = 0
+        self.__lir_count = 0 #LIR objects, the resident HIR ones are the queue
+        self.__lir_limit = 0
+        self.__capacity = 0
+        self.__overhead = 0
+
+    def attach(self, capacity, overhead):
+        self.__capacity = capacity
+        self.__lir_limit = capacity * (1 - self.HIR_FRACTION)
+        self.__overhead = overhead
+
+    def __prune(self):
+        """
+        pop HIR and ghost entries off the stack bottom until an LIR object is there
+        """
+        stack = self.__stack
+        while len(stack):
+            h, size, node = stack.oldest()
+            if node is not None and node.freq == 1:
+                return
+            stack.popleft()
+            if node is None:
+                self.__ghosts.pop(h)
+
+    def __demote_bottom(self):
+        h, size, node = self.__stack.popleft()
+        node.freq = 0
+        self.__lir_bytes -= size
+        self.__lir_count -= 1
+        self.__queue[node.key] = node
+        self.__prune()
+
+    def __promote(self, node, h, size):
+        """
+        turn node LIR at the top of the stack and demote bottom LIR objects to make room
+        """
+        node.freq = 1
+        self.__lir_bytes += size
+        self.__lir_count += 1
+        self.__stack.append(h, size, node)
+        while self.__lir_bytes > self.__lir_limit and len(self.__stack):
+            self.__demote_bottom()
+
+    def insert(self, node):
+        size = node.value + self.__overhead
+        h = mix64(node.key)
+        was_ghost = self.__ghosts.pop(h) is not None
+        if self.__lir_bytes + size <= self.__lir_limit or was_ghost: #warming up, or reused within the LIR set
+            self.__promote(node, h, size)
+        else:
+            node.freq = 0
+            self.__stack.append(h, size, node)
+            self.__queue[node.key] = node
+
+    def touch(self, node):
+        size = node.value + self.__overhead
+        h = mix64(node.key)
+        stack = self.__stack
+        if node.freq == 1:
+            at_bottom = stack.oldest()[0] == h
+            stack.append(h, size, node)
+            if at_bottom:
+                self.__prune()
+        elif h in stack: #reused within the LIR set
+            del self.__queue[node.key]
+            self.__promote(node, h, size)
+        else:
+            stack.append(h, size, node)
+            self.__queue.move_to_end(node.key)
+
+    def remove(self, node):
+        h = mix64(node.key)
+        if node.freq == 1:
+            self.__stack.pop(h)
+            self.__lir_bytes -= node.value + self.__overhead
+            self.__lir_count -= 1
+            self.__prune()
+        else:
+            del self.__queue[node.key]
+            self.__stack.pop(h)
+
+    def victim(self):
+        if not self.__queue: #every resident object is LIR
+            self.__demote_bottom()
+        return next(iter(self.__queue.values()))
+
+    def evict(self):
+        node = self.victim()
+        del self.__queue[node.key]
+        h = mix64(node.key)
+        if h in self.__stack: #stays in the stack as a ghost
+            self.__stack.set_obj(h, None)
+            ghosts = self.__ghosts
+            ghosts.append(h, node.value + self.__overhead)
+            while ghosts.bytes > self.__capacity:
+                self.__stack.pop(ghosts.popleft()[0])
+        return node
+
+    def nodes(self):
+        yield from self.__queue.values()
+        for h, size, node in self.__stack.items():
+            if node is not None and node.freq == 1:
+                yield node
+
+    def columns(self):
+        columns = self.__stack.columns("stack")
+        columns.update(self.__ghosts.columns("ghosts"))
+        return columns
+
+    def restore(self, nodes, state=None, columns=None):
+        """
+        node.freq tells LIR from HIR objects, the stack entries find their
+        nodes by key hash
+        """
+        resident = {}
+        for node in nodes:
+            resident[mix64(node.key)] = node
+            if node.freq == 0:
+                self.__queue[node.key] = node
+            else:
+                self.__lir_bytes += node.value + self.__overhead
+                self.__lir_count += 1
+        if columns:
+            self.__stack.restore(columns, "stack", resident)
+            self.__ghosts.restore(columns, "ghosts")
+
+    def __len__(self):
+        return len(self.__queue) + self.__lir_count
+
+
+class S3FIFOPolicy(EvictionPolicy):
+    """
+    S3-FIFO (Yang et al., SOSP '23) counted in bytes. new objects enter a
+    small FIFO holding SMALL_FRACTION of the capacity; at its tail, objects
+    read while in it move to the main FIFO and the rest are evicted, their
+    key hash going to a ghost FIFO as large as the main one. a miss still in
+    the ghost goes straight to the main FIFO, which reinserts objects read
+    since they last reached its tail. node.freq counts reads up to FREQ_MAX
+    and a hit touches nothing else, so hits are a single field update
+    """
+    name = "s3fifo"
+    SMALL_FRACTION = 0.1
+    FREQ_MAX = 3
+
+    def __init__(self):
+        self.__small = OrderedDict() #key -> node, oldest first
+        self.__main = OrderedDict()
+        self.__ghost = GhostList()
+        self.__small_bytes = 0
+        self.__small_target = 0
+        self.__ghost_limit = 0
+        self.__overhead = 0
+
+    def attach(self, capacity, overhead):
+        self.__small_target = capacity * self.SMALL_FRACTION
+        self.__ghost_limit = capacity - self.__small_target
+        self.__overhead = overhead
+
+    def insert(self, node):
+        node.freq = 0
+        if self.__ghost.pop(mix64(node.key)) is not None:
+            self.__main[node.key] = node
+        else:
+            self.__small[node.key] = node
+            self.__small_bytes += node.value + self.__overhead
+
+    def touch(self, node):
+        if node.freq < self.FREQ_MAX:
+            node.freq += 1
+
+    def remove(self, node):
+        if self.__small.pop(node.key, None) is not None:
+            self.__small_bytes -= node.value + self.__overhead
+        else:
+            del self.__main[node.key]
+
+    def victim(self):
+        """
+        move objects along until the victim is at the tail of its queue;
+        evict() takes it from there
+        """
+        small = self.__small
+        main = self.__main
+        while True:
+            if small and (self.__small_bytes >= self.__small_target or not main):
+                node = next(iter(small.values()))
+                if node.freq == 0:
+                    return node
+                del small[node.key] #read while in the small queue
+                self.__small_bytes -= node.value + self.__overhead
+                main[node.key] = node
+            else:
+                node = next(iter(main.values()))
+                if node.freq == 0:
+                    return node
+                node.freq -= 1
+                main.move_to_end(node.key)
+
+    def evict(self):
+        node = self.victim()
+        if self.__small.pop(node.key, None) is not None:
+            size = node.value + self.__overhead
+            self.__small_bytes -= size
+            self.__ghost.append(mix64(node.key), size)
+            self.__ghost.trim(self.__ghost_limit)
+        else:
+            del self.__main[node.key]
+        return node
+
+    def nodes(self):
+        yield from self.__small.values()
+        yield from self.__main.values()
+
+    def state(self):
+        return {"small": len(self.__small)}
+
+    def columns(self):
+        return self.__ghost.columns("ghost")
+
+    def restore(self, nodes, state=None, columns=None):
+        """
+        the first state["small"] nodes are those of the small FIFO
+        """
+        n_small = state["small"] if state is not None else 0
+        for i, node in enumerate(nodes):
+            if i < n_small:
+                self.__small[node.key] = node
+                self.__small_bytes += node.value + self.__overhead
+            else:
+                self.__main[node.key] = node
+        if columns:
+            self.__ghost.restore(columns, "ghost")
+
+    def __len__(self):
+        return len(self.__small) + len(self.__main)
+
+
+class GDSFPolicy(EvictionPolicy):
+    """
+    GreedyDual-Size-Frequency (Cherkasova, 1998): the priority of an object
+    is L + freq / size, with size its bytes including the overhead and freq
+    its requests since it was inserted (node.freq). the lowest priority is
+    evicted and becomes the new L, so objects not requested for a while
+    age out. small, popular objects stay, which favors the object hit
+    ratio over the byte hit ratio. priorities live in an indexed heap,
+    O(log n) per request
+    """
+    name = "gdsf"
+    frequency = True #False leaves freq out: GreedyDual-Size, LRU with a size discount
+
+    def __init__(self):
+        self.__heap = IndexedHeap()
+        self.__clock = 0.0 #L, priority of the last victim
+        self.__overhead = 0
+
+    def attach(self, capacity, overhead):
+        self.__overhead = overhead
+
+    def __priority(self, node):
+        return self.__clock + (node.freq if self.frequency else 1) / max(1, node.value + self.__overhead)
+
+    def insert(self, node):
+        node.freq = 1
+        self.__heap.push(node.key, node, self.__priority(node))
+
+    def touch(self, node):
+        node.freq += 1
+        self.__heap.update(node.key, self.__priority(node))
+
+    def remove(self, node):
+        self.__heap.remove(node.key)
+
+    def victim(self):
+        return self.__heap.peek()[1]
+
+    def evict(self):
+        self.__clock, node = self.__heap.pop()
+        return node
+
+    def nodes(self):
+        for priority, seq, node in self.__heap.items():
+            yield node
+
+    def state(self):
+        return dict(self.__heap.state(), clock=self.__clock)
+
+    def columns(self):
+        entries = list(self.__heap.items())
+        return {"priorities": array("d", [priority for priority, seq, node in entries]),
+                "seqs": array("q", [seq for priority, seq, node in entries])}
+
+    def restore(self, nodes, state=None, columns=None):
+        """
+        nodes come in heap order; without columns (no snapshot of this
+        policy) every node gets a fresh priority
+        """
+        if columns:
+            self.__heap.restore(zip(columns["priorities"], columns["seqs"], nodes), state)
+            self.__clock = state["clock"]
+        else:
+            for node in nodes:
+                self.__heap.push(node.key, node, self.__priority(node))
+
+    def __len__(self):
+        return len(self.__heap)
+
+
+class SizeLRUPolicy(GDSFPolicy):
+    """
+    size-aware LRU, GreedyDual-Size with unit cost: priority L + 1 / size,
+    renewed on every hit. with equal sizes it evicts exactly like LRU,
+    otherwise large objects leave first
+    """
+    name = "size-lru"
+    frequency = False
+
+
+POLICIES = {
+    LRUPolicy.name: LRUPolicy,
+    LFUPolicy.name: LFUPolicy,
+    FIFOPolicy.name: FIFOPolicy,
+    RandomPolicy.name: RandomPolicy,
+    ARCPolicy.name: ARCPolicy,
+    LIRSPolicy.name: LIRSPolicy,
+    S3FIFOPolicy.name: S3FIFOPolicy,
+    GDSFPolicy.name: GDSFPolicy,
+    SizeLRUPolicy.name: SizeLRUPolicy,
+}
+
+
+def make_policy(name):
+    """
+    :type name: str, one of POLICIES
+    :rtype: EvictionPolicy
+    """
+    try:
+        return POLICIES[name]()
+    except KeyError:
+        raise ValueError(f"unknown eviction policy {name}, expected one of {sorted(POLICIES)}")
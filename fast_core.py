@@ -0,0 +1,522 @@
+"""
+typed LRU and LFU engines for the hot replay path
+
+this module is plain Python and runs as is, but it is written in Cython's
+pure Python mode: the classes are extension types with C-typed fields and
+the per-request methods are C calls once compiled with
+
+    cythonize -i -3 fast_core.py     (pip install cython)
+
+which builds a native extension next to this file that Python then
+imports instead of the .py. without cython the decorators below are no-ops.
+cache_core.CacheCore with eviction_policies.LRUPolicy / LFUPolicy is the
+reference implementation; conformance.py checks that both produce the same
+hit, miss, eviction, expiration and insertion counts.
+
+instead of an OrderedDict and ListNode objects the engines keep their own
+intrusive doubly linked lists, and the TTL index is a heap of
+(expiry, key) pairs checked against the node on the way out
+"""
+
+from __future__ import annotations
+
+import heapq
+import sys
+from array import array
+
+from cache_core import byte_hit_ratio
+
+try:
+    import cython
+except ImportError:
+    # cython is optional, without it the module runs as ordinary Python
+    class cython(object):
+        compiled = False
+        longlong = int
+        Py_ssize_t = int
+        bint = bool
+
+        @staticmethod
+        def cclass(cls):
+            return cls
+
+        @staticmethod
+        def ccall(func):
+            return func
+
+        @staticmethod
+        def cfunc(func):
+            return func
+
+        @staticmethod
+        def final(cls):
+            return cls
+
+
+COMPILED = cython.compiled #True when the native build was imported
+
+
+@cython.final
+@cython.cclass
+class Node:
+    key: object #object name
+    value: cython.longlong #object size
+    ttl: cython.longlong #absolute expiry time
+    freq: cython.longlong
+    prev: Node
+    next: Node
+
+    def __init__(self, key, value: cython.longlong, ttl: cython.longlong):
+        self.key = key
+        self.value = value
+        self.ttl = ttl
+        self.freq = 0
+        self.prev = self
+        self.next = self
+
+
+@cython.final
+@cython.cclass
+class Bucket:
+    """
+    circular list of the nodes with one frequency, most recently used at
+    head.next, chained to the buckets of the next lower and higher frequency
+    """
+    freq: cython.longlong
+    size: cython.longlong
+    head: Node #sentinel node
+    lower: Bucket
+    higher: Bucket
+
+    def __init__(self, freq: cython.longlong):
+        self.freq = freq
+        self.size = 0
+        self.head = Node(None, 0, 0)
+        self.lower = self
+        self.higher = self
+
+    @cython.cfunc
+    def append(self, node: Node):
+        head: Node = self.head
+        node.prev = head
+        node.next = head.next
+        head.next.prev = node
+        head.next = node
+        self.size += 1
+
+    @cython.cfunc
+    def unlink(self, node: Node):
+        node.prev.next = node.next
+        node.next.prev = node.prev
+        self.size -= 1
+
+
+@cython.cclass
+class FastCache:
+    """
+    byte-budgeted cache with the same get/put contract and statistics as
+    cache_core.CacheCore; subclasses supply the eviction order
+    """
+    capacity: cython.longlong #maximum size of cache in bytes
+    overhead: cython.longlong #overhead for each item in bytes
+    reclaim_expired: cython.bint
+    proactive_expiry: cython.bint
+    size: cython.longlong
+    timer: cython.longlong #keeps track of time for TTL expiration detection
+    index: dict #key -> Node
+    heap: list #(expiry, key), stale once the node's ttl moved
+    evictions: cython.longlong
+    hits: cython.longlong
+    misses: cython.longlong
+    ttl_expirations: cython.longlong
+    insertions: cython.longlong
+    hit_bytes: cython.longlong #object bytes served by hits
+    miss_bytes: cython.longlong #object bytes of missed objects, as given to get()
+
+    def __init__(self, capacity, overhead=0, reclaim_expired=True, proactive_expiry=False):
+        self.capacity = capacity
+        self.overhead = overhead
+        self.reclaim_expired = reclaim_expired
+        self.proactive_expiry = proactive_expiry
+        self.size = 0
+        self.timer = 0
+        self.index = {}
+        self.heap = []
+
+        #variables below are for statistics
+        self.evictions = 0
+        self.hits = 0
+        self.misses = 0
+        self.ttl_expirations = 0
+        self.insertions = 0
+        self.hit_bytes = 0
+        self.miss_bytes = 0
+
+    @cython.ccall
+    def insert(self, node: Node):
+        raise NotImplementedError
+
+    @cython.ccall
+    def touch(self, node: Node):
+        raise NotImplementedError
+
+    @cython.ccall
+    def remove(self, node: Node):
+        raise NotImplementedError
+
+    @cython.ccall
+    def evict(self) -> Node:
+        raise NotImplementedError
+
+    @cython.cfunc
+    def push_expiry(self, key, expiry: cython.longlong):
+        node: Node
+        heapq.heappush(self.heap, (expiry, key))
+        if len(self.heap) > 2 * len(self.index) + 64: #drop stale entries
+            heap = []
+            for node in self.index.values():
+                heap.append((node.ttl, node.key))
+            heapq.heapify(heap)
+            self.heap = heap
+
+    @cython.ccall
+    def get(self, key, current_time: cython.longlong, ttl: cython.longlong = 0,
+            value: cython.longlong = 0) -> cython.longlong:
+        """
+        :param value: size of the object, see CacheCore.get
+        :return: object size on a hit, -1 on a miss, -2 if the item had expired
+        """
+        found = self.index.get(key)
+        if found is None: #item not in cache
+            self.misses += 1
+            self.miss_bytes += value
+            return -1
+        node: Node = found
+        if node.ttl < self.timer: #item has expired
+            self.expire(node)
+            self.misses += 1
+            self.miss_bytes += value if value else node.value
+            return -2
+        self.touch(node)
+        if current_time + ttl > node.ttl:
+            node.ttl = current_time + ttl
+            self.push_expiry(key, node.ttl)
+        self.hits += 1
+        self.hit_bytes += node.value
+        return node.value
+
+    @cython.ccall
+    def put(self, key, value: cython.longlong, current_time: cython.longlong, ttl: cython.longlong = 0):
+        node: Node
+        item: cython.longlong
+        if current_time < self.timer:
+            print("ERROR TIMER")
+        if current_time > self.timer: #update timer
+            self.timer = current_time
+            if self.proactive_expiry:
+                self.remove_expired()
+
+        if ttl == 0: #if ttl is 0 no need to cache
+            return
+
+        found = self.index.get(key)
+        if found is not None: #if key already exits then update ttl
+            node = found
+            if node.value != value:
+                print(f"ERROR {node.value} != {value}")
+                sys.exit()
+            node.ttl = ttl + self.timer
+            self.push_expiry(key, node.ttl)
+            return
+
+        item = value + self.overhead
+        if self.capacity < item: #item can never fit
+            return
+        if self.capacity < self.size + item: #if item will not fit
+            if self.reclaim_expired:
+                self.remove_expired()
+            while self.capacity < self.size + item:
+                node = self.evict()
+                del self.index[node.key]
+                self.size -= node.value + self.overhead
+                self.evictions += 1
+
+        node = Node(key, value, ttl + self.timer)
+        self.index[key] = node
+        self.insert(node)
+        self.push_expiry(key, node.ttl)
+        self.size += item
+        self.insertions += 1
+
+    def access_many(self, keys, values, times, ttls, ttl_override=None):
+        """
+        get() every request and put() it on a miss, see CacheCore.access_many
+        :return: array('b') hit mask
+        """
+        i: cython.Py_ssize_t
+        n: cython.Py_ssize_t = len(keys)
+        ttl: cython.longlong
+        hits = array("b", bytes(n))
+        for i in range(n):
+            if self.get(keys[i], times[i], ttls[i], values[i]) >= 0:
+                hits[i] = 1
+            else:
+                ttl = ttls[i]
+                if ttl_override is not None and (ttl == 10 or ttl == 0):
+                    ttl = ttl_override
+                self.put(keys[i], values[i], times[i], ttl)
+        return hits
+
+    def get_many(self, keys, times, ttls, values=None):
+        i: cython.Py_ssize_t
+        n: cython.Py_ssize_t = len(keys)
+        hits = array("b", bytes(n))
+        for i in range(n):
+            if self.get(keys[i], times[i], ttls[i], values[i] if values is not None else 0) >= 0:
+                hits[i] = 1
+        return hits
+
+    def put_many(self, keys, values, times, ttls):
+        i: cython.Py_ssize_t
+        for i in range(len(keys)):
+            self.put(keys[i], values[i], times[i], ttls[i])
+
+    @cython.cfunc
+    def expire(self, node: Node):
+        self.size -= node.value + self.overhead
+        self.ttl_expirations += 1
+        del self.index[node.key]
+        self.remove(node)
+
+    @cython.cfunc
+    def remove_expired(self):
+        """
+        drop every item whose ttl is before the timer
+        """
+        expiry: cython.longlong
+        node: Node
+        while self.heap and self.heap[0][0] < self.timer:
+            expiry, key = heapq.heappop(self.heap)
+            found = self.index.get(key)
+            if found is not None:
+                node = found
+                if node.ttl == expiry:
+                    self.expire(node)
+
+    def nodes(self):
+        """
+        :return: list of every node in the order restore_nodes() takes them
+        """
+        raise NotImplementedError
+
+    def restore_nodes(self, nodes):
+        raise NotImplementedError
+
+    def snapshot(self):
+        """
+        the whole cache as flat columns in nodes() order, see
+        CacheCore.snapshot; the expiry heap is rebuilt from the ttls
+        """
+        node: Node
+        nodes = self.nodes()
+        keys = array("Q")
+        values = array("q")
+        ttls = array("q")
+        freqs = array("q")
+        for node in nodes:
+            keys.append(node.key)
+            values.append(node.value)
+            ttls.append(node.ttl)
+            freqs.append(node.freq)
+        meta = {
+            "engine": self.name,
+            "capacity": self.capacity,
+            "overhead": self.overhead,
+            "reclaim_expired": bool(self.reclaim_expired),
+            "proactive_expiry": bool(self.proactive_expiry),
+            "size": self.size,
+            "timer": self.timer,
+            "stats": self.getStats(),
+        }
+        return meta, {"keys": keys, "values": values, "ttls": ttls, "freqs": freqs}
+
+    def restore(self, meta, arrays):
+        node: Node
+        nodes = []
+        heap = []
+        for key, value, ttl, freq in zip(arrays["keys"], arrays["values"], arrays["ttls"], arrays["freqs"]):
+            node = Node(key, value, ttl)
+            node.freq = freq
+            self.index[key] = node
+            nodes.append(node)
+            heap.append((node.ttl, key))
+        self.restore_nodes(nodes)
+        heapq.heapify(heap)
+        self.heap = heap
+        self.size = meta["size"]
+        self.timer = meta["timer"]
+        stats = meta["stats"]
+        self.evictions = stats["evictions"]
+        self.hits = stats["hits"]
+        self.misses = stats["misses"]
+        self.ttl_expirations = stats["expirations"]
+        self.insertions = stats["insertions"]
+        self.hit_bytes = stats.get("hit_bytes", 0)
+        self.miss_bytes = stats.get("miss_bytes", 0)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def getSize(self):
+        return self.size
+
+    def getCapacity(self):
+        return self.capacity
+
+    def getStats(self):
+        return {
+            "evictions": self.evictions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expirations": self.ttl_expirations,
+            "insertions": self.insertions,
+            "hit_bytes": self.hit_bytes,
+            "miss_bytes": self.miss_bytes,
+        }
+
+    def printStats(self):
+        stats = self.getStats()
+        for name, value in stats.items():
+            print(f"{name} {value}")
+        print(f"byte_hit_ratio {byte_hit_ratio(stats)}")
+
+
+@cython.final
+@cython.cclass
+class FastLRUCache(FastCache):
+    """
+    least recently used: one circular list, most recently used at head.next
+    """
+    name = "fast-lru"
+    order: Bucket
+
+    def __init__(self, capacity, overhead=0, reclaim_expired=True, proactive_expiry=False):
+        FastCache.__init__(self, capacity, overhead, reclaim_expired, proactive_expiry)
+        self.order = Bucket(0)
+
+    @cython.ccall
+    def insert(self, node: Node):
+        self.order.append(node)
+
+    @cython.ccall
+    def touch(self, node: Node):
+        self.order.unlink(node)
+        self.order.append(node) #mark as most recently used
+
+    @cython.ccall
+    def remove(self, node: Node):
+        self.order.unlink(node)
+
+    @cython.ccall
+    def evict(self) -> Node:
+        node: Node = self.order.head.prev
+        self.order.unlink(node)
+        return node
+
+    def nodes(self):
+        head: Node = self.order.head
+        node: Node = head.prev
+        nodes = []
+        while node is not head: #least recently used first
+            nodes.append(node)
+            node = node.prev
+        return nodes
+
+    def restore_nodes(self, nodes):
+        node: Node
+        for node in nodes:
+            self.order.append(node)
+
+
+@cython.final
+@cython.cclass
+class FastLFUCache(FastCache):
+    """
+    least frequently used, ties broken by recency; the same bucket chain as
+    eviction_policies.LFUPolicy
+    """
+    name = "fast-lfu"
+    freq_to_bucket: dict #frequency -> Bucket
+    buckets: Bucket #sentinel of the frequency chain, lowest bucket is buckets.higher
+
+    def __init__(self, capacity, overhead=0, reclaim_expired=True, proactive_expiry=False):
+        FastCache.__init__(self, capacity, overhead, reclaim_expired, proactive_expiry)
+        self.freq_to_bucket = {}
+        self.buckets = Bucket(-1)
+
+    @cython.cfunc
+    def bucket_after(self, bucket: Bucket, freq: cython.longlong) -> Bucket:
+        nxt: Bucket = bucket.higher
+        if nxt.freq == freq:
+            return nxt
+        new: Bucket = Bucket(freq)
+        new.lower = bucket
+        new.higher = nxt
+        bucket.higher = new
+        nxt.lower = new
+        self.freq_to_bucket[freq] = new
+        return new
+
+    @cython.cfunc
+    def unlink(self, node: Node):
+        bucket: Bucket = self.freq_to_bucket[node.freq]
+        bucket.unlink(node)
+        if bucket.size == 0:
+            bucket.lower.higher = bucket.higher
+            bucket.higher.lower = bucket.lower
+            del self.freq_to_bucket[node.freq]
+
+    @cython.ccall
+    def insert(self, node: Node):
+        node.freq = 0
+        self.bucket_after(self.buckets, 0).append(node)
+
+    @cython.ccall
+    def touch(self, node: Node):
+        target: Bucket = self.bucket_after(self.freq_to_bucket[node.freq], node.freq + 1)
+        self.unlink(node)
+        node.freq += 1 #update frequency
+        target.append(node)
+
+    @cython.ccall
+    def remove(self, node: Node):
+        self.unlink(node)
+
+    @cython.ccall
+    def evict(self) -> Node:
+        node: Node = self.buckets.higher.head.prev #lru node of the lowest frequency
+        self.unlink(node)
+        return node
+
+    def nodes(self):
+        bucket: Bucket = self.buckets.higher
+        node: Node
+        nodes = []
+        while bucket is not self.buckets: #lowest frequency first, least recently used first within one
+            node = bucket.head.prev
+            while node is not bucket.head:
+                nodes.append(node)
+                node = node.prev
+            bucket = bucket.higher
+        return nodes
+
+    def restore_nodes(self, nodes):
+        bucket: Bucket = self.buckets
+        node: Node
+        for node in nodes: #frequencies ascend
+            if bucket.freq != node.freq:
+                bucket = self.bucket_after(bucket, node.freq)
+            bucket.append(node)
@@ -0,0 +1,239 @@
+from array import array
+
+
+class GhostList(object):
+    """
+    insertion ordered set of 64 bit key hashes, each with a size in bytes
+    and an optional object, for the ghost (recently evicted) entries of
+    ARC, LIRS and S3-FIFO.
+
+    entries live in a ring of flat arrays, oldest at the head, and an open
+    addressing table of ring slots (linear probing, at most half full)
+    finds them by hash. removing an entry from the middle leaves a hole in
+    the ring that is skipped at the head and squeezed out when the ring is
+    rebuilt, so every operation is O(1) amortized and a ghost costs about
+    40 bytes instead of a dict entry and a node.
+
+    hashes must be unique per key; hashing.mix64 is a bijection on 64 bit
+    ints, so trace object ids never collide
+    """
+
+    def __init__(self, capacity=64):
+        self.bytes = 0 #sum of the sizes of the live entries
+        self.__len = 0
+        self.__build(max(64, capacity), [])
+
+    def __build(self, capacity, entries):
+        """
+        reset the ring to capacity slots (a power of two) holding entries
+        :type entries: list of (hash, size, obj), oldest first
+        """
+        cap = 64
+        while cap < capacity:
+            cap <<= 1
+        self.__mask = cap - 1
+        self.__hashes = array("Q", bytes(8 * cap))
+        self.__sizes = array("q", bytes(8 * cap)) #-1 marks a hole
+        self.__objs = [None] * cap
+        self.__index = array("q", [-1]) * (2 * cap) #ring slot of every live hash, -1 is empty
+        self.__index_mask = 2 * cap - 1
+        self.__head = 0
+        self.__used = 0 #slots from head on, holes included
+        for h, size, obj in entries:
+            slot = self.__used
+            self.__hashes[slot] = h
+            self.__sizes[slot] = size
+            self.__objs[slot] = obj
+            self.__used += 1
+            self.__index_insert(h, slot)
+
+    def __len__(self):
+        return self.__len
+
+    def __contains__(self, h):
+        return self.__find(h)[1] >= 0
+
+    def __find(self, h):
+        """
+        :return: (table position, ring slot), slot -1 if h is absent
+        """
+        index = self.__index
+        hashes = self.__hashes
+        i = h & self.__index_mask
+        while True:
+            slot = index[i]
+            if slot < 0 or hashes[slot] == h:
+                return i, slot
+            i = (i + 1) & self.__index_mask
+
+    def __index_insert(self, h, slot):
+        index = self.__index
+        i = h & self.__index_mask
+        while index[i] >= 0:
+            i = (i + 1) & self.__index_mask
+        index[i] = slot
+
+    def __index_delete(self, i):
+        """
+        empty table position i, shifting back the entries probed past it
+        """
+        index = self.__index
+        hashes = self.__hashes
+        mask = self.__index_mask
+        j = i
+        while True:
+            j = (j + 1) & mask
+            slot = index[j]
+            if slot < 0:
+                break
+            home = hashes[slot] & mask
+            if (i <= j and (home <= i or home > j)) or (i > j and home <= i and home > j):
+                index[i] = slot
+                i = j
+        index[i] = -1
+
+    def __remove(self, i, slot):
+        """
+        :return: (size, obj) of the entry at ring slot, found at table position i
+        """
+        self.__index_delete(i)
+        sizes = self.__sizes
+        size = sizes[slot]
+        obj = self.__objs[slot]
+        sizes[slot] = -1
+        self.__objs[slot] = None
+        self.__len -= 1
+        self.bytes -= size
+        if slot == self.__head: #skip the holes at the head
+            mask = self.__mask
+            head = self.__head
+            used = self.__used
+            while used and sizes[head] < 0:
+                head = (head + 1) & mask
+                used -= 1
+            self.__head = head
+            self.__used = used
+        return size, obj
+
+    def append(self, h, size, obj=None):
+        """
+        add h as the newest entry, moving it there if already present
+        """
+        index = self.__index
+        index_mask = self.__index_mask
+        i = h & index_mask
+        while True: #__find inlined, append is the hot path of every eviction
+            slot = index[i]
+            if slot < 0:
+                break
+            if self.__hashes[slot] == h:
+                self.__remove(i, slot)
+                break
+            i = (i + 1) & index_mask
+        if self.__used > self.__mask: #ring full, squeeze out the holes and grow if still over half full
+            entries = list(self.items())
+            self.__build(2 * (self.__mask + 1) if 2 * len(entries) > self.__mask else self.__mask + 1, entries)
+        slot = (self.__head + self.__used) & self.__mask
+        self.__hashes[slot] = h
+        self.__sizes[slot] = size
+        self.__objs[slot] = obj
+        self.__used += 1
+        index = self.__index
+        index_mask = self.__index_mask
+        i = h & index_mask
+        while index[i] >= 0:
+            i = (i + 1) & index_mask
+        index[i] = slot
+        self.__len += 1
+        self.bytes += size
+
+    def get(self, h):
+        """
+        :return: (size, obj) of h, or None if absent
+        """
+        slot = self.__find(h)[1]
+        if slot < 0:
+            return None
+        return self.__sizes[slot], self.__objs[slot]
+
+    def set_obj(self, h, obj):
+        """
+        replace the object of h in place, keeping its position
+        """
+        slot = self.__find(h)[1]
+        if slot < 0:
+            raise KeyError(h)
+        self.__objs[slot] = obj
+
+    def pop(self, h):
+        """
+        remove h
+        :return: (size, obj), or None if absent
+        """
+        index = self.__index
+        hashes = self.__hashes
+        index_mask = self.__index_mask
+        i = h & index_mask
+        while True:
+            slot = index[i]
+            if slot < 0:
+                return None
+            if hashes[slot] == h:
+                return self.__remove(i, slot)
+            i = (i + 1) & index_mask
+
+    def oldest(self):
+        """
+        :return: (hash, size, obj) of the oldest entry, None if empty
+        """
+        if not self.__len:
+            return None
+        head = self.__head
+        return self.__hashes[head], self.__sizes[head], self.__objs[head]
+
+    def popleft(self):
+        """
+        remove the oldest entry
+        :return: (hash, size, obj)
+        """
+        h = self.__hashes[self.__head]
+        size, obj = self.pop(h)
+        return h, size, obj
+
+    def trim(self, limit):
+        """
+        drop the oldest entries until at most limit bytes are left
+        """
+        while self.bytes > limit:
+            self.popleft()
+
+    def items(self):
+        """
+        (hash, size, obj) of every entry, oldest first
+        """
+        hashes = self.__hashes
+        sizes = self.__sizes
+        objs = self.__objs
+        mask = self.__mask
+        for k in range(self.__used):
+            slot = (self.__head + k) & mask
+            if sizes[slot] >= 0:
+                yield hashes[slot], sizes[slot], objs[slot]
+
+    def columns(self, prefix):
+        """
+        hashes and sizes, oldest first, as flat columns for a snapshot;
+        the objects are left out, their owner restores them
+        :return: dict name -> array
+        """
+        entries = list(self.items())
+        return {prefix + "_hashes": array("Q", [h for h, size, obj in entries]),
+                prefix + "_sizes": array("q", [size for h, size, obj in entries])}
+
+    def restore(self, columns, prefix, objs=None):
+        """
+        refill an empty list from columns(prefix)
+        :type objs: dict hash -> obj for the entries that carry one
+        """
+        for h, size in zip(columns[prefix + "_hashes"], columns[prefix + "_sizes"]):
+            self.append(h, size, None if objs is None else objs.get(h))
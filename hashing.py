@@ -0,0 +1,40 @@
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, only mix64_array needs it
+    np = None
+
+
+# 64-bit finalizer from MurmurHash3 (fmix64). trace object ids are often
+# small sequential integers, so hash(obj) % rate would not spread them
+# evenly; this mixes every input bit into the output.
+MASK64 = (1 << 64) - 1
+_C1 = 0xff51afd7ed558ccd
+_C2 = 0xc4ceb9fe1a85ec53
+
+
+def mix64(x):
+    """
+    :type x: int
+    :rtype: int, uniformly mixed 64 bit hash of x
+    """
+    x &= MASK64
+    x ^= x >> 33
+    x = (x * _C1) & MASK64
+    x ^= x >> 33
+    x = (x * _C2) & MASK64
+    x ^= x >> 33
+    return x
+
+
+def mix64_array(x):
+    """
+    vectorized mix64 over a numpy integer array
+    """
+    x = np.asarray(x).astype(np.uint64)
+    x ^= x >> np.uint64(33)
+    x *= np.uint64(_C1)
+    x ^= x >> np.uint64(33)
+    x *= np.uint64(_C2)
+    x ^= x >> np.uint64(33)
+    return x
@@ -0,0 +1,137 @@
+class IndexedHeap(object):
+    """
+    binary min-heap of objects by priority that also knows the position of
+    every object by its key, so changing the priority of an object or
+    removing it from the middle is O(log n). objects are found by their
+    .key (cache nodes). priorities are compared with a sequence number of
+    their last push or update, so ties come out oldest first
+    """
+
+    def __init__(self):
+        self.__prios = [] #(priority, seq) of heap slot i
+        self.__objs = []
+        self.__pos = {} #key -> heap slot
+        self.__seq = 0
+
+    def __len__(self):
+        return len(self.__objs)
+
+    def __contains__(self, key):
+        return key in self.__pos
+
+    def push(self, key, obj, priority):
+        self.__seq += 1
+        self.__prios.append((priority, self.__seq))
+        self.__objs.append(obj)
+        self.__pos[key] = len(self.__objs) - 1
+        self.__sift_up(len(self.__objs) - 1)
+
+    def update(self, key, priority):
+        i = self.__pos[key]
+        old = self.__prios[i]
+        self.__seq += 1
+        self.__prios[i] = (priority, self.__seq)
+        if self.__prios[i] < old:
+            self.__sift_up(i)
+        else:
+            self.__sift_down(i)
+
+    def peek(self):
+        """
+        :return: (priority, obj) of the minimum
+        """
+        return self.__prios[0][0], self.__objs[0]
+
+    def pop(self):
+        """
+        remove the minimum
+        :return: (priority, obj)
+        """
+        priority = self.__prios[0][0]
+        return priority, self.__remove_at(0)
+
+    def remove(self, key):
+        """
+        :return: the object of key
+        """
+        return self.__remove_at(self.__pos[key])
+
+    def __remove_at(self, i):
+        prios = self.__prios
+        objs = self.__objs
+        obj = objs[i]
+        del self.__pos[obj.key]
+        last_prio = prios.pop()
+        last_obj = objs.pop()
+        if i < len(objs):
+            old = prios[i]
+            prios[i] = last_prio
+            objs[i] = last_obj
+            self.__pos[last_obj.key] = i
+            if last_prio < old:
+                self.__sift_up(i)
+            else:
+                self.__sift_down(i)
+        return obj
+
+    def __sift_up(self, i):
+        prios = self.__prios
+        objs = self.__objs
+        pos = self.__pos
+        prio = prios[i]
+        obj = objs[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if prio >= prios[parent]:
+                break
+            prios[i] = prios[parent]
+            objs[i] = objs[parent]
+            pos[objs[i].key] = i
+            i = parent
+        prios[i] = prio
+        objs[i] = obj
+        pos[obj.key] = i
+
+    def __sift_down(self, i):
+        prios = self.__prios
+        objs = self.__objs
+        pos = self.__pos
+        n = len(objs)
+        prio = prios[i]
+        obj = objs[i]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and prios[child + 1] < prios[child]:
+                child += 1
+            if prio <= prios[child]:
+                break
+            prios[i] = prios[child]
+            objs[i] = objs[child]
+            pos[objs[i].key] = i
+            i = child
+        prios[i] = prio
+        objs[i] = obj
+        pos[obj.key] = i
+
+    def items(self):
+        """
+        (priority, seq, obj) of every object, in heap order
+        """
+        for (priority, seq), obj in zip(self.__prios, self.__objs):
+            yield priority, seq, obj
+
+    def state(self):
+        return {"seq": self.__seq}
+
+    def restore(self, entries, state):
+        """
+        refill an empty heap from items() in the same order
+        :type entries: iterable of (priority, seq, obj)
+        """
+        for priority, seq, obj in entries:
+            self.__prios.append((priority, seq))
+            self.__objs.append(obj)
+            self.__pos[obj.key] = len(self.__objs) - 1
+        self.__seq = state["seq"]
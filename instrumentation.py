@@ -0,0 +1,187 @@
+import math
+from array import array
+
+
+SUB_BITS = 3 #linear sub-buckets per power of two are 2 ** SUB_BITS, at most 12.5% relative error
+N_BUCKETS = 64 << SUB_BITS #enough for any 64 bit value
+PERCENTILES = [0.5, 0.9, 0.99, 0.999]
+OPERATIONS = ["get_hit", "get_miss", "get_expired", "put_insert", "put_update", "put_skip", "eviction"]
+
+
+def bucket_of(value):
+    """
+    HDR style log-linear bucket of a non-negative int: values below
+    2 ** SUB_BITS have a bucket each, every power of two above is split in
+    2 ** SUB_BITS equal buckets
+    """
+    if value < (1 << SUB_BITS):
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    return ((shift + 1) << SUB_BITS) + (value >> shift) - (1 << SUB_BITS)
+
+
+def bucket_bounds(index):
+    """
+    :return: (lowest, highest) value of bucket index, both inclusive
+    """
+    if index < (1 << SUB_BITS):
+        return index, index
+    shift = (index >> SUB_BITS) - 1
+    low = ((index & ((1 << SUB_BITS) - 1)) + (1 << SUB_BITS)) << shift
+    return low, low + (1 << shift) - 1
+
+
+class LogHistogram(object):
+    """
+    fixed size histogram of non-negative ints (latencies in ns, byte or
+    object counts) in N_BUCKETS log-linear buckets, see bucket_of()
+    """
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * N_BUCKETS))
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value):
+        self.counts[bucket_of(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            if n:
+                self.counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+
+    def buckets(self):
+        """
+        (lowest, highest, count) of every non-empty bucket, in value order
+        """
+        for i, n in enumerate(self.counts):
+            if n:
+                low, high = bucket_bounds(i)
+                yield low, high, n
+
+    def percentile(self, q):
+        """
+        :type q: float in [0, 1]
+        :rtype: int, highest value of the bucket holding the q quantile, capped at the maximum
+        """
+        if not self.count:
+            return 0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for low, high, n in self.buckets():
+            seen += n
+            if seen >= rank:
+                return min(high, self.max)
+        return self.max
+
+    def to_dict(self):
+        """
+        :return: json serializable summary and non-empty buckets as [lowest, highest, count]
+        """
+        summary = {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min if self.min is not None else 0,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else 0.0,
+        }
+        for q in PERCENTILES:
+            summary[f"p{q * 100:g}"] = self.percentile(q)
+        summary["buckets"] = [list(bucket) for bucket in self.buckets()]
+        return summary
+
+
+class Instruments(object):
+    """
+    opt-in profiling hooks of CacheCore: a latency histogram in ns per
+    operation in OPERATIONS, and for every put that had to evict, the
+    objects evicted (eviction_batch) and the bytes they freed
+    (eviction_bytes). put_skip is a put that cached nothing: ttl 0, too
+    large, or kept out by the admission filter. "eviction" times one
+    victim, put_insert includes the evictions it triggered
+    """
+
+    def __init__(self):
+        self.latency = {op: LogHistogram() for op in OPERATIONS}
+        self.eviction_batch = LogHistogram()
+        self.eviction_bytes = LogHistogram()
+
+    def record(self, op, elapsed_ns):
+        self.latency[op].record(elapsed_ns)
+
+    def record_evictions(self, objects, freed_bytes):
+        self.eviction_batch.record(objects)
+        self.eviction_bytes.record(freed_bytes)
+
+    def merge(self, other):
+        for op, hist in other.latency.items():
+            self.latency[op].merge(hist)
+        self.eviction_batch.merge(other.eviction_batch)
+        self.eviction_bytes.merge(other.eviction_bytes)
+
+    def to_json(self):
+        """
+        :return: json serializable dict, latencies in ns
+        """
+        return {
+            "unit": "ns",
+            "operations": {op: hist.to_dict() for op, hist in self.latency.items()},
+            "eviction_batch": self.eviction_batch.to_dict(),
+            "eviction_bytes": self.eviction_bytes.to_dict(),
+        }
+
+    def to_prometheus(self, prefix="cache", labels=None):
+        """
+        the histograms in the Prometheus text exposition format, latencies
+        in seconds. there is one bucket line per non-empty bucket, at its
+        highest value, plus +Inf
+        :type labels: dict name -> value added to every sample
+        :rtype: str
+        """
+        lines = []
+        name = f"{prefix}_operation_duration_seconds"
+        lines.append(f"# HELP {name} latency of cache operations")
+        lines.append(f"# TYPE {name} histogram")
+        for op, hist in self.latency.items():
+            _prometheus_histogram(lines, name, hist, dict(labels or {}, op=op), 1e-9)
+        for suffix, hist, help_text in [("eviction_batch_objects", self.eviction_batch,
+                                         "objects evicted by a put"),
+                                        ("eviction_freed_bytes", self.eviction_bytes,
+                                         "bytes freed by the evictions of a put")]:
+            name = f"{prefix}_{suffix}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            _prometheus_histogram(lines, name, hist, dict(labels or {}), 1)
+        return "\n".join(lines) + "\n"
+
+
+def _prometheus_labels(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def _prometheus_histogram(lines, name, hist, labels, scale):
+    """
+    append the cumulative bucket, sum and count samples of hist, its values multiplied by scale
+    """
+    seen = 0
+    for low, high, n in hist.buckets():
+        seen += n
+        le = _prometheus_labels(dict(labels, le=f"{high * scale:.9g}"))
+        lines.append(f"{name}_bucket{{{le}}} {seen}")
+    le = _prometheus_labels(dict(labels, le="+Inf"))
+    lines.append(f"{name}_bucket{{{le}}} {hist.count}")
+    lines.append(f"{name}_sum{{{_prometheus_labels(labels)}}} {hist.total * scale:.9g}")
+    lines.append(f"{name}_count{{{_prometheus_labels(labels)}}} {hist.count}")
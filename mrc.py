@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+import time
+from array import array
+
+from hashing import mix64
+from trace_reader import read_trace
+
+
+SHARDS_MODULUS = 1 << 24
+
+
+class StackDistanceMRC(object):
+    """
+    one-pass LRU miss-ratio curve from byte-weighted Mattson stack distances
+
+    every request is given a position in time. a Fenwick tree over the
+    positions holds the size of each object at the position of its most
+    recent request (positions are renumbered when the tree fills up, so its
+    memory follows the number of distinct objects, not the trace length), so the bytes of distinct objects requested since the
+    last request to obj are total - prefix(last position of obj), and a
+    byte-budgeted LRU of capacity C hits iff that distance (plus the size of
+    obj itself) is <= C. sizes are value + overhead, the same bytes
+    LFUCache.put charges. TTLs are ignored, this is the pure LRU curve.
+
+    with sample_rate < 1 only objects with mix64(obj) % 2**24 below
+    sample_rate * 2**24 are tracked (SHARDS) and their distances are scaled
+    by 1 / sample_rate. the SHARDS-adj correction is applied: the gap
+    between the expected (all requests * sample_rate) and the actual number
+    of sampled requests is credited to the smallest distance bin, which
+    removes most of the bias from a few very hot objects landing in or out
+    of the sample
+    """
+
+    def __init__(self, overhead=0, bin_bytes=4096, sample_rate=1.0, positions=1 << 20):
+        """
+        :type overhead: int, bytes charged per object on top of its size
+        :type bin_bytes: int, resolution of the distance histogram
+        :type sample_rate: float, fraction of objects tracked, 1.0 tracks all
+        :type positions: int, initial size of the Fenwick tree
+        """
+        self.overhead = overhead
+        self.bin_bytes = bin_bytes
+        self.sample_rate = sample_rate
+        self.__threshold = int(sample_rate * SHARDS_MODULUS)
+        self.__tree = array("q", bytes(8 * (positions + 1))) #Fenwick tree, 1-indexed
+        self.__n = 0 #positions handed out so far
+        self.__total = 0 #bytes of all distinct objects seen
+        self.__last = {} #obj -> (position of its last request, size charged there)
+        self.__hist = {} #distance bin -> number of requests
+        self.requests = 0 #requests that were tracked
+        self.seen = 0 #all requests, sampled or not
+        self.cold_misses = 0
+
+    def access(self, obj, size):
+        """
+        record one request to obj, whose value is size bytes
+        """
+        self.seen += 1
+        if self.__threshold < SHARDS_MODULUS and mix64(obj) % SHARDS_MODULUS >= self.__threshold:
+            return
+        if self.__n == len(self.__tree) - 1:
+            self.__compact()
+        tree = self.__tree
+        size += self.overhead
+        self.requests += 1
+        self.__n += 1
+        pos = self.__n
+        n = len(tree) - 1
+        last = self.__last.get(obj)
+        if last is None:
+            self.cold_misses += 1
+        else:
+            p, old = last
+            prefix = 0
+            i = p
+            while i > 0:
+                prefix += tree[i]
+                i -= i & -i
+            distance = (self.__total - prefix + size) / self.sample_rate
+            b = -(-int(distance) // self.bin_bytes)
+            self.__hist[b] = self.__hist.get(b, 0) + 1
+            i = p
+            while i <= n:
+                tree[i] -= old
+                i += i & -i
+            self.__total -= old
+        i = pos
+        while i <= n:
+            tree[i] += size
+            i += i & -i
+        self.__total += size
+        self.__last[obj] = (pos, size)
+
+    def __compact(self):
+        """
+        renumber the last request of every object to 1..m keeping their order
+        and rebuild the tree with room for as many new positions again
+        """
+        live = sorted(self.__last.items(), key=lambda item: item[1][0])
+        n = max(2 * len(live), 1024)
+        tree = array("q", bytes(8 * (n + 1)))
+        for i, (obj, (p, size)) in enumerate(live, 1):
+            tree[i] = size
+            self.__last[obj] = (i, size)
+        for i in range(1, n + 1): #O(n) Fenwick build
+            j = i + (i & -i)
+            if j <= n:
+                tree[j] += tree[i]
+        self.__tree = tree
+        self.__n = len(live)
+
+    def __adjustment(self):
+        """
+        :return: (expected number of sampled requests, SHARDS-adj hit correction)
+        """
+        if self.sample_rate >= 1.0:
+            return self.requests, 0
+        expected = self.seen * self.sample_rate
+        return expected, expected - self.requests
+
+    def curve(self):
+        """
+        :return: list of (capacity in bytes, miss ratio) at every histogram bin
+                 boundary where the miss ratio changes, increasing capacity
+        """
+        if not self.requests:
+            return []
+        total, hits = self.__adjustment()
+        points = []
+        for b in sorted(self.__hist):
+            hits += self.__hist[b]
+            points.append((b * self.bin_bytes, min(1.0, max(0.0, 1 - hits / total))))
+        return points
+
+    def miss_ratio(self, capacity):
+        """
+        :type capacity: int, cache size in bytes
+        """
+        if not self.requests:
+            return 0.0
+        total, hits = self.__adjustment()
+        limit = capacity // self.bin_bytes
+        hits += sum(c for b, c in self.__hist.items() if b <= limit)
+        return min(1.0, max(0.0, 1 - hits / total))
+
+
+def compute_mrc(trace_path, overhead=0, bin_bytes=4096, sample_rate=1.0, default_ttl=0):
+    """
+    :return: StackDistanceMRC fed with every request of the trace
+    """
+    mrc = StackDistanceMRC(overhead, bin_bytes, sample_rate)
+    access = mrc.access
+    for current_time, obj, value, ttl in read_trace(trace_path, default_ttl):
+        access(obj, value)
+    return mrc
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("trace", help="the path to the trace", type=str)
+    ap.add_argument("--capacities", help="cache sizes in bytes to report, "
+                    "defaults to powers of two up to the largest distance", nargs="+", type=int)
+    ap.add_argument("--bin_bytes", help="histogram resolution in bytes", type=int, default=4096)
+    ap.add_argument("--sample_rate", help="SHARDS sampling rate, 1.0 tracks every object",
+                    type=float, default=1.0)
+    ap.add_argument("--overhead", help="bytes charged per object", type=int,
+                    default=2 * sys.getsizeof(int()))
+    args = ap.parse_args()
+
+    start = time.time()
+    mrc = compute_mrc(args.trace, args.overhead, args.bin_bytes, args.sample_rate)
+    capacities = args.capacities
+    if not capacities:
+        points = mrc.curve()
+        largest = points[-1][0] if points else args.bin_bytes
+        capacities = []
+        c = args.bin_bytes
+        while c < 2 * largest:
+            capacities.append(c)
+            c *= 2
+    print(f"requests {mrc.requests}    cold misses {mrc.cold_misses}")
+    print("capacity  miss_ratio")
+    for c in capacities:
+        print(f"{c}  {mrc.miss_ratio(c):.6f}")
+    print(f"time: {time.time() - start} seconds")
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import time
+
+from admission import ADMISSIONS
+from cache_core import CacheCore
+from class_stats import ClassStats, format_rows
+from eviction_policies import POLICIES
+from instrumentation import Instruments
+from replay_sweep import ENGINES, FULL_HEAPSIZE, OVERHEAD, TTL_OVERRIDE, make_cache
+from snapshot import load_snapshot, save_snapshot
+from trace_reader import DEFAULT_BATCH_SIZE, read_trace_batches, trace_length
+
+
+def print_progress(offset, total, hits, misses):
+    requests = hits + misses
+    print(f"progress %{(offset * 100) // max(1, total)}    "
+          f"miss ratio {misses / requests if requests else 0.0}")
+
+
+def replay_resumable(trace_path, new_cache, checkpoint_path=None, checkpoint_every=10000000,
+                     progress=print_progress, progress_every=1000000,
+                     ttl_override=TTL_OVERRIDE, default_ttl=0, batch_size=DEFAULT_BATCH_SIZE,
+                     stop_after=None, on_restore=None, cache_config=None, save_state=None):
+    """
+    the replay loop of replay_sweep.replay, streamed in batches of
+    batch_size records so that memory is the cache plus one batch.
+    progress(offset, total, hits, misses) is called every progress_every
+    records and a snapshot of the cache with the trace offset and hit count
+    is saved to checkpoint_path every checkpoint_every records (both at
+    batch boundaries). if checkpoint_path already holds a snapshot of the
+    same replay of the same cache, it resumes from there instead of calling
+    new_cache(); a checkpoint of another replay or cache is refused.
+    with stop_after the replay ends, checkpointed, once that many records
+    are replayed: a cache pre-warmed on the start of a trace is saved once
+    and copies of the snapshot resume from there
+
+    :type new_cache: callable returning an empty cache
+    :type on_restore: callable(cache, state) run on a cache resumed from the checkpoint, with
+        what save_state returned when it was saved or None
+    :type save_state: callable returning json serializable state saved with every checkpoint
+    :type cache_config: json serializable description of the cache new_cache() builds (engine,
+        policy, capacity, ...), a checkpoint is only resumed with the same one
+    :return: (cache, hits, misses)
+    """
+    config = {"trace": os.path.abspath(trace_path), "ttl_override": ttl_override,
+              "default_ttl": default_ttl, "cache": cache_config}
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        cache, state = load_snapshot(checkpoint_path)
+        if state["config"] != config:
+            raise ValueError(f"{checkpoint_path} is a checkpoint of {state['config']}, not {config}")
+        offset, hits = state["offset"], state["hits"]
+        if on_restore is not None:
+            on_restore(cache, state.get("state"))
+    else:
+        cache, offset, hits = new_cache(), 0, 0
+
+    total = trace_length(trace_path)
+    next_progress = (offset // progress_every + 1) * progress_every if progress_every else None
+    next_checkpoint = offset + checkpoint_every if checkpoint_path is not None else None
+    for times, objs, sizes, ttls in read_trace_batches(trace_path, default_ttl, batch_size, offset):
+        if stop_after is not None and offset + len(objs) >= stop_after:
+            n = max(0, stop_after - offset)
+            times, objs, sizes, ttls = times[:n], objs[:n], sizes[:n], ttls[:n]
+            next_checkpoint = offset if checkpoint_path is not None else None
+        hits += sum(cache.access_many(objs, sizes, times, ttls, ttl_override))
+        offset += len(objs)
+        if next_progress is not None and offset >= next_progress:
+            progress(offset, total, hits, offset - hits)
+            next_progress = (offset // progress_every + 1) * progress_every
+        if next_checkpoint is not None and offset >= next_checkpoint:
+            save_snapshot(cache, checkpoint_path, {"config": config, "offset": offset, "hits": hits,
+                                                   "state": save_state() if save_state is not None else None})
+            next_checkpoint = offset + checkpoint_every
+        if stop_after is not None and offset >= stop_after:
+            break
+    return cache, hits, offset - hits
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("trace", help="the path to the trace", type=str)
+    ap.add_argument("--policy", help="policy to replay", choices=sorted(POLICIES) + sorted(ENGINES),
+                    default="lru")
+    ap.add_argument("--capacity", help="cache size in bytes", type=int, default=FULL_HEAPSIZE // 1000)
+    ap.add_argument("--admission", help="admission filter in front of an eviction policy",
+                    choices=ADMISSIONS, default="none")
+    ap.add_argument("--checkpoint", help="checkpoint file, resumed from when it exists", type=str)
+    ap.add_argument("--checkpoint_every", help="records between checkpoints", type=int, default=10000000)
+    ap.add_argument("--progress_every", help="records between progress lines", type=int, default=1000000)
+    ap.add_argument("--stop_after", help="checkpoint and stop after this many records, "
+                    "to pre-warm a snapshot", type=int)
+    ap.add_argument("--ttl_override", help="ttl used on a miss when the trace ttl is 0 or 10",
+                    type=int, default=TTL_OVERRIDE)
+    ap.add_argument("--default_ttl", help="ttl for .sbin records without one", type=int, default=0)
+    ap.add_argument("--latency_json", help="time every operation and write the histograms here as json",
+                    type=str)
+    ap.add_argument("--latency_prom", help="time every operation and write the histograms here "
+                    "in the Prometheus text format", type=str)
+    ap.add_argument("--breakdown", help="break the replay down by TTL bucket and size class "
+                    "and write the totals to this csv file", type=str)
+    ap.add_argument("--series", help="write the breakdown of every --window to this csv file", type=str)
+    ap.add_argument("--window", help="seconds of trace time per --series window", type=int, default=3600)
+    args = ap.parse_args()
+
+    instruments = Instruments() if args.latency_json or args.latency_prom else None
+    resuming = args.checkpoint is not None and os.path.exists(args.checkpoint)
+    breakdown = None
+    series_file = None
+    if args.breakdown or args.series:
+        if args.series:
+            if resuming: #keep the windows written before the checkpoint, reattach() cuts the rest
+                series_file = open(args.series, "r+")
+            else:
+                series_file = open(args.series, "w")
+                series_file.write(format_rows([], sep=",") + "\n")
+            emit = lambda rows: series_file.write(format_rows(rows, sep=",", header=False) + "\n")
+        else:
+            emit = lambda rows: None
+        breakdown = ClassStats(args.window, emit=emit, ttl_override=args.ttl_override)
+
+    def save_state():
+        """
+        the breakdown counts and how far the series file got, saved with each checkpoint
+        """
+        state = {}
+        if breakdown is not None:
+            state["breakdown"] = breakdown.state()
+        if series_file is not None:
+            series_file.flush()
+            state["series_offset"] = series_file.tell()
+        return state
+
+    def reattach(cache, state):
+        """
+        snapshots leave instruments and breakdowns out, give them back to a
+        resumed cache with the breakdown counts of the checkpoint
+        """
+        state = state or {}
+        if breakdown is not None:
+            if "breakdown" not in state:
+                raise ValueError(f"{args.checkpoint} was saved without --breakdown or --series")
+            breakdown.restore(state["breakdown"])
+        if series_file is not None:
+            if "series_offset" not in state:
+                raise ValueError(f"{args.checkpoint} was saved without --series")
+            series_file.seek(state["series_offset"])
+            series_file.truncate()
+        if instruments is not None or breakdown is not None:
+            if not isinstance(cache, CacheCore):
+                raise ValueError(f"{args.policy} does not take instruments or a breakdown")
+            cache.observe(instruments, breakdown)
+    cache_config = {"engine": args.policy if args.policy in ENGINES else "core", "policy": args.policy,
+                    "capacity": args.capacity, "overhead": OVERHEAD, "admission": args.admission}
+    start = time.time()
+    cache, hits, misses = replay_resumable(
+        args.trace, lambda: make_cache(args.policy, args.capacity, OVERHEAD, args.admission, instruments,
+                                       breakdown),
+        args.checkpoint,
+        args.checkpoint_every, progress_every=args.progress_every,
+        ttl_override=args.ttl_override, default_ttl=args.default_ttl, stop_after=args.stop_after,
+        on_restore=reattach, cache_config=cache_config, save_state=save_state)
+    print(f"misses: {misses}    hits: {hits}")
+    print(f"miss ratio {misses/(misses+hits)}")
+    print("=cache stats=")
+    cache.printStats()
+    if breakdown is not None:
+        breakdown.flush()
+        rows = breakdown.rows()
+        print(format_rows(rows))
+        if args.breakdown:
+            with open(args.breakdown, "w") as ofile:
+                ofile.write(format_rows(rows, sep=",") + "\n")
+        if series_file is not None:
+            series_file.close()
+    if instruments is not None:
+        if args.latency_json:
+            with open(args.latency_json, "w") as ofile:
+                json.dump(instruments.to_json(), ofile, indent=1)
+        if args.latency_prom:
+            with open(args.latency_prom, "w") as ofile:
+                ofile.write(instruments.to_prometheus(labels={"policy": args.policy}))
+    print(f"time: {time.time() - start} seconds")
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import trace_format
+from admission import ADMISSIONS, make_admission
+from cache_core import CacheCore, byte_hit_ratio
+from eviction_policies import POLICIES, make_policy
+from fast_core import FastLFUCache, FastLRUCache
+from segcache import SegCache
+from trace_reader import DEFAULT_BATCH_SIZE, is_binary_trace, read_trace, read_trace_batches
+
+
+# engines with their own storage layout instead of a CacheCore policy,
+# every one takes (capacity, overhead)
+ENGINES = {
+    "segcache": SegCache,
+    "fast-lru": FastLRUCache, #fast_core.py, same counts as lru, faster once compiled
+    "fast-lfu": FastLFUCache,
+}
+
+
+FULL_HEAPSIZE = 1048576000 #1,048,576,000
+OVERHEAD = 2 * sys.getsizeof(int())
+TTL_OVERRIDE = 150 #ttl used on a miss when the trace ttl is 0 or 10
+
+
+def replay(cache, trace_path, ttl_override=TTL_OVERRIDE, default_ttl=0,
+           batch_size=DEFAULT_BATCH_SIZE, size_field="key_len"):
+    """
+    run the replay loop of the *_main scripts over a trace, batch_size
+    records per cache.access_many call
+
+    :param ttl_override: ttl to put with when the trace ttl is 0 or 10,
+                         None keeps the trace ttl
+    :param size_field: see trace_reader.read_trace_batches
+    :return: (hits, misses)
+    """
+    hits = 0
+    requests = 0
+    for times, objs, sizes, ttls in read_trace_batches(trace_path, default_ttl, batch_size,
+                                                       size_field=size_field):
+        hits += sum(cache.access_many(objs, sizes, times, ttls, ttl_override))
+        requests += len(objs)
+    return hits, requests - hits
+
+
+def make_cache(policy, capacity, overhead=OVERHEAD, admission="none", instruments=None, breakdown=None):
+    """
+    :type policy: str, an eviction policy name or one of ENGINES
+    :type admission: str, one of admission.ADMISSIONS, only for the eviction policies
+    :type instruments: instrumentation.Instruments or None, only for the eviction policies
+    :type breakdown: class_stats.ClassStats or None, only for the eviction policies
+    """
+    if policy in ENGINES:
+        if admission not in (None, "none"):
+            raise ValueError(f"{policy} does not take an admission filter")
+        if instruments is not None or breakdown is not None:
+            raise ValueError(f"{policy} does not take instruments or a breakdown")
+        return ENGINES[policy](capacity, overhead)
+    return CacheCore(capacity, make_policy(policy), overhead,
+                     admission=make_admission(admission, capacity, overhead), instruments=instruments,
+                     breakdown=breakdown)
+
+
+def run_config(trace_path, policy, capacity, ttl_override, overhead=OVERHEAD, default_ttl=0,
+               admission="none", size_field="key_len"):
+    """
+    replay one configuration, this is what each worker process runs
+    :return: dict row of the results table
+    """
+    start = time.time()
+    cache = make_cache(policy, capacity, overhead, admission)
+    hits, misses = replay(cache, trace_path, ttl_override, default_ttl, size_field=size_field)
+    elapsed = time.time() - start
+    row = {
+        "policy": policy,
+        "admission": admission,
+        "admission_rejections": 0,
+        "capacity": capacity,
+        "ttl_override": ttl_override,
+        "requests": hits + misses,
+        "hits": hits,
+        "misses": misses,
+        "miss_ratio": misses / (hits + misses) if hits + misses else 0.0,
+        "seconds": elapsed,
+    }
+    row.update(cache.getStats())
+    row["byte_miss_ratio"] = 1.0 - byte_hit_ratio(row) if hits + misses else 0.0
+    return row
+
+
+def _share_trace(trace_path, default_ttl):
+    """
+    workers map binary traces directly, so the OS page cache holds one copy
+    for all of them. text traces are converted once to a temporary .ctrace,
+    with the size in the 32 bit val_len column: text sizes are byte counts,
+    too large for the 16 bit key_len
+    :return: (path to replay, temporary path to remove or None)
+    """
+    if trace_format.is_ctrace(trace_path) or is_binary_trace(trace_path):
+        return trace_path, None
+    fd, tmp_path = tempfile.mkstemp(suffix=trace_format.EXTENSION)
+    os.close(fd)
+    objs = set()
+    with trace_format.TraceWriter(tmp_path, default_ttl) as writer:
+        for ts, obj, size, ttl in read_trace(trace_path, default_ttl):
+            writer.write(ts, obj, 0, size, 0, ttl)
+            objs.add(obj)
+        writer.close(len(objs))
+    return tmp_path, tmp_path
+
+
+def sweep(trace_path, policies, capacities, ttl_overrides, workers=None,
+          overhead=OVERHEAD, default_ttl=0, admissions=("none",)):
+    """
+    replay every policy x admission x capacity x ttl override combination
+    in a process pool; admission filters only go in front of the eviction
+    policies, not the ENGINES
+    :return: list of result rows in configuration order
+    """
+    configs = [(policy, admission, capacity, ttl_override)
+               for policy, admission, capacity, ttl_override
+               in itertools.product(policies, admissions, capacities, ttl_overrides)
+               if admission == "none" or policy not in ENGINES]
+    shared_path, tmp_path = _share_trace(trace_path, default_ttl)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            size_field = "key_len" if tmp_path is None else "val_len"
+            futures = [pool.submit(run_config, shared_path, policy, capacity, ttl_override,
+                                   overhead, default_ttl, admission, size_field)
+                       for policy, admission, capacity, ttl_override in configs]
+            return [f.result() for f in futures]
+    finally:
+        if tmp_path is not None:
+            os.remove(tmp_path)
+
+
+COLUMNS = ["policy", "admission", "capacity", "ttl_override", "requests", "hits", "misses",
+           "miss_ratio", "byte_miss_ratio", "evictions", "expirations", "insertions", "admission_rejections", "seconds"]
+
+
+def format_table(rows, sep=None):
+    """
+    :param sep: column separator, None pads columns for the console
+    """
+    cells = [COLUMNS] + [[f"{r[c]:.6f}" if isinstance(r[c], float) else str(r[c])
+                          for c in COLUMNS] for r in rows]
+    if sep is not None:
+        return "\n".join(sep.join(line) for line in cells)
+    widths = [max(len(line[i]) for line in cells) for i in range(len(COLUMNS))]
+    return "\n".join("  ".join(v.rjust(w) for v, w in zip(line, widths)) for line in cells)
+
+
+def _ttl_override(value):
+    return None if value.lower() == "none" else int(value)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("trace", help="the path to the trace", type=str)
+    ap.add_argument("--policies", help="policies to replay", nargs="+",
+                    choices=sorted(POLICIES) + sorted(ENGINES), default=sorted(POLICIES))
+    ap.add_argument("--capacities", help="cache sizes in bytes", nargs="+", type=int)
+    ap.add_argument("--sampling_rate", help="capacity is full_heapsize // sampling_rate "
+                    "when --capacities is not given", type=int, default=1000)
+    ap.add_argument("--ttl_overrides", help="ttl used on a miss when the trace ttl is 0 or 10, "
+                    "'none' keeps the trace ttl", nargs="+", type=_ttl_override,
+                    default=[TTL_OVERRIDE])
+    ap.add_argument("--admissions", help="admission filters in front of the eviction policies",
+                    nargs="+", choices=ADMISSIONS, default=["none"])
+    ap.add_argument("--default_ttl", help="ttl for .sbin records without one", type=int, default=0)
+    ap.add_argument("--workers", help="worker processes, defaults to the cpu count", type=int)
+    ap.add_argument("--csv", help="also write the results table to this csv file", type=str)
+    args = ap.parse_args()
+
+    capacities = args.capacities or [FULL_HEAPSIZE // args.sampling_rate]
+    start = time.time()
+    rows = sweep(args.trace, args.policies, capacities, args.ttl_overrides,
+                 args.workers, default_ttl=args.default_ttl, admissions=args.admissions)
+    print(format_table(rows))
+    if args.csv:
+        with open(args.csv, "w") as ofile:
+            ofile.write(format_table(rows, sep=",") + "\n")
+    print(f"time: {time.time() - start} seconds")
@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+from array import array
+from itertools import repeat
+
+from cache_core import byte_hit_ratio
+
+
+# per-object metadata is a single int: segment id | size | 8 bit frequency
+FREQ_BITS = 8
+SIZE_BITS = 32
+FREQ_MAX = (1 << FREQ_BITS) - 1
+SIZE_MASK = (1 << SIZE_BITS) - 1
+SEG_SHIFT = FREQ_BITS + SIZE_BITS
+
+
+def ttl_bucket(ttl):
+    """
+    Segcache TTL buckets: 8s wide below 2048s, 128s below 32768s,
+    2048s below 524288s and 32768s above
+
+    :return: (bucket id, bucket ttl), the ttl is rounded down to the bucket
+             start so an object never outlives the ttl it was set with
+    """
+    if ttl < 2048:
+        width, base, first = 8, 0, 0
+    elif ttl < 32768:
+        width, base, first = 128, 2048, 256
+    elif ttl < 524288:
+        width, base, first = 2048, 32768, 496
+    else:
+        width, base, first = 32768, 524288, 736
+    i = (ttl - base) // width
+    return first + i, base + i * width
+
+
+class Segment(object):
+    __slots__ = ("seg_id", "keys", "used", "live", "expire_at", "bucket")
+
+    def __init__(self, seg_id):
+        self.seg_id = seg_id
+        self.keys = [] #keys in append order, may hold copies that moved elsewhere
+        self.used = 0 #bytes appended
+        self.live = 0 #bytes of objects whose current copy is here
+        self.expire_at = 0
+        self.bucket = -1
+
+    def reset(self):
+        self.keys = []
+        self.used = 0
+        self.live = 0
+        self.expire_at = 0
+        self.bucket = -1
+
+
+class SegCache(object):
+    """
+    segment-structured, TTL-bucketed cache in the style of Segcache (NSDI '21)
+
+    objects are appended to fixed-size segments; every TTL bucket has its
+    own chain of segments in creation order, so segments also expire in
+    order and a whole segment is reclaimed at once when its TTL passes.
+    when no free segment is left, up to merge_n of the oldest segments of a
+    bucket (chosen round-robin across buckets) are merged into one: the most
+    frequently read objects are copied forward and the rest are evicted.
+    an object's metadata is one packed int, its frequency a saturating
+    8 bit counter.
+
+    exposes the same get(key, current_time, ttl) / put(key, value,
+    current_time, ttl) contract as CacheCore, except that a hit does not
+    extend the TTL (objects cannot leave their segment's TTL)
+    """
+
+    def __init__(self, capacity, overhead=0, segment_size=None, merge_n=4):
+        """
+        :type capacity: int
+        :type overhead: int
+        :type segment_size: int, bytes per segment, defaults to capacity // 256
+        :type merge_n: int, segments merged into one on eviction
+        """
+        if segment_size is None:
+            segment_size = max(4096, capacity // 256)
+        self.__capa = capacity #maximum size of cache in bytes
+        self.__segment_size = segment_size
+        self.__merge_n = merge_n
+        self.__overhead = overhead #overhead for each item in bytes
+        self.__segments = [Segment(i) for i in range(max(1, capacity // segment_size))]
+        self.__free = list(range(len(self.__segments) - 1, -1, -1)) #stack of free segment ids
+        self.__chains = {} #ttl bucket -> list of segment ids, oldest first, last is active
+        self.__merge_cursor = 0 #round-robin position over buckets for merges
+        self.__meta = {} #key -> seg_id << SEG_SHIFT | size << FREQ_BITS | freq
+        self.__size = 0 #bytes of live objects
+        self.__timer = 0 #keeps track of time for TTL expiration detection
+
+        #variables below are for statistics
+        self.__evictions = 0 #keeps track of items evicted that are not from ttl expiration
+        self.__hits = 0
+        self.__misses = 0
+        self.__ttl_expirations = 0
+        self.__insertions = 0
+        self.__merges = 0
+        self.__segments_expired = 0
+        self.__hit_bytes = 0 #object bytes served by hits
+        self.__miss_bytes = 0 #object bytes of missed objects, as given to get()
+
+    def get(self, key, current_time, ttl=0, value=0):
+        """
+        :type key: int
+        :type value: int, size of the object, see CacheCore.get
+        :rtype: int, object size on a hit, -1 on a miss, -2 if the item had expired
+        """
+        meta = self.__meta.get(key)
+        if meta is None: #item not in cache
+            self.__misses += 1
+            self.__miss_bytes += value
+            return -1
+        seg = self.__segments[meta >> SEG_SHIFT]
+        size = (meta >> FREQ_BITS) & SIZE_MASK
+        if seg.expire_at < self.__timer: #item has expired, the segment goes later
+            del self.__meta[key]
+            seg.live -= size + self.__overhead
+            self.__size -= size + self.__overhead
+            self.__ttl_expirations += 1
+            self.__misses += 1
+            self.__miss_bytes += value if value else size
+            return -2
+        if meta & FREQ_MAX != FREQ_MAX:
+            self.__meta[key] = meta + 1 #update frequency
+        self.__hits += 1
+        self.__hit_bytes += size
+        return size
+
+    def put(self, key, value, current_time, ttl=0): #value is size of the object
+        """
+        :type key: int
+        :type value: int
+        :rtype: void
+        """
+        if current_time < self.__timer:
+            print("ERROR TIMER")
+        if current_time > self.__timer: #update timer
+            self.__timer = current_time
+            self.__expire_segments()
+
+        if (ttl == 0): #if ttl is 0 no need to cache
+            return
+        item = value + self.__overhead
+        if item > self.__segment_size: #item can never fit in a segment
+            return
+
+        meta = self.__meta.get(key)
+        if meta is not None: #if key already exits then rewrite it with the new ttl
+            if ((meta >> FREQ_BITS) & SIZE_MASK != value):
+                print(f"ERROR {(meta >> FREQ_BITS) & SIZE_MASK} != {value}")
+                exit()
+            self.__unlink(key, meta)
+        else:
+            self.__insertions += 1
+
+        bucket, bucket_ttl = ttl_bucket(ttl)
+        seg = self.__active_segment(bucket, bucket_ttl, item)
+        self.__append(seg, key, value, 0 if meta is None else meta & FREQ_MAX)
+
+    def get_many(self, keys, times, ttls, values=None):
+        """
+        get() over a block of requests, in order
+        :type values: list of int or None, object sizes for miss_bytes
+        :return: array('b') hit mask
+        """
+        get = self.get
+        return array("b", [get(key, t, ttl, value) >= 0 for key, t, ttl, value
+                           in zip(keys, times, ttls, values if values is not None else repeat(0))])
+
+    def put_many(self, keys, values, times, ttls):
+        put = self.put
+        for key, value, t, ttl in zip(keys, values, times, ttls):
+            put(key, value, t, ttl)
+
+    def access_many(self, keys, values, times, ttls, ttl_override=None):
+        """
+        get() every request and put() it on a miss, see CacheCore.access_many
+        :return: array('b') hit mask
+        """
+        hits = array("b", bytes(len(keys)))
+        get = self.get
+        put = self.put
+        i = 0
+        for key, value, t, ttl in zip(keys, values, times, ttls):
+            if get(key, t, ttl, value) >= 0:
+                hits[i] = 1
+            else:
+                if ttl_override is not None and (ttl == 10 or ttl == 0):
+                    ttl = ttl_override
+                put(key, value, t, ttl)
+            i += 1
+        return hits
+
+    def __append(self, seg, key, value, freq):
+        item = value + self.__overhead
+        seg.keys.append(key)
+        seg.used += item
+        seg.live += item
+        self.__size += item
+        self.__meta[key] = (seg.seg_id << SEG_SHIFT) | (value << FREQ_BITS) | freq
+
+    def __unlink(self, key, meta):
+        """
+        drop the current copy of key, its bytes stay used until the segment goes
+        """
+        item = ((meta >> FREQ_BITS) & SIZE_MASK) + self.__overhead
+        self.__segments[meta >> SEG_SHIFT].live -= item
+        self.__size -= item
+        del self.__meta[key]
+
+    def __active_segment(self, bucket, bucket_ttl, item):
+        """
+        :return: a segment of bucket with room for item bytes, opening a new one if needed
+        """
+        chain = self.__chains.get(bucket)
+        if chain:
+            seg = self.__segments[chain[-1]]
+            if seg.used + item <= self.__segment_size:
+                return seg
+        seg = self.__segments[self.__allocate()]
+        seg.bucket = bucket
+        seg.expire_at = self.__timer + bucket_ttl
+        self.__chains.setdefault(bucket, []).append(seg.seg_id)
+        return seg
+
+    def __allocate(self):
+        """
+        :return: id of a free segment, expiring or merging segments if none is left
+        """
+        if not self.__free:
+            self.__expire_segments()
+        while not self.__free:
+            self.__evict()
+        return self.__free.pop()
+
+    def __release(self, seg):
+        chain = self.__chains[seg.bucket]
+        chain.remove(seg.seg_id)
+        if not chain:
+            del self.__chains[seg.bucket]
+        seg.reset()
+        self.__free.append(seg.seg_id)
+
+    def __drop_segment(self, seg, expired):
+        """
+        remove every object whose current copy is in seg and free the segment
+        """
+        meta_of = self.__meta
+        seg_id = seg.seg_id
+        for key in seg.keys:
+            meta = meta_of.get(key)
+            if meta is not None and meta >> SEG_SHIFT == seg_id:
+                del meta_of[key]
+                self.__size -= ((meta >> FREQ_BITS) & SIZE_MASK) + self.__overhead
+                if expired:
+                    self.__ttl_expirations += 1
+                else:
+                    self.__evictions += 1
+        self.__release(seg)
+
+    def __expire_segments(self):
+        """
+        reclaim whole segments whose ttl has passed; segments of a bucket are
+        in expiry order so only the head of each chain has to be checked
+        """
+        timer = self.__timer
+        for bucket in list(self.__chains):
+            chain = self.__chains.get(bucket)
+            while chain and self.__segments[chain[0]].expire_at < timer:
+                self.__drop_segment(self.__segments[chain[0]], expired=True)
+                self.__segments_expired += 1
+                chain = self.__chains.get(bucket)
+
+    def __evict(self):
+        """
+        free at least one segment by merging the oldest segments of the next
+        bucket (round-robin) that has more than its active segment
+        """
+        buckets = sorted(self.__chains)
+        if not buckets:
+            return
+        n = len(buckets)
+        for step in range(n):
+            bucket = buckets[(self.__merge_cursor + step) % n]
+            if len(self.__chains[bucket]) > 1:
+                self.__merge_cursor = (self.__merge_cursor + step + 1) % n
+                self.__merge(self.__chains[bucket][:min(self.__merge_n, len(self.__chains[bucket]) - 1)])
+                return
+        #every bucket is down to its active segment, drop the one expiring first
+        oldest = min((self.__segments[c[0]] for c in self.__chains.values()),
+                     key=lambda seg: seg.expire_at)
+        self.__drop_segment(oldest, expired=False)
+
+    def __merge(self, seg_ids):
+        """
+        copy the most frequently read live objects of seg_ids into the first
+        of them and evict everything else; frees len(seg_ids) - 1 segments,
+        or the single segment when there is only one
+        """
+        self.__merges += 1
+        segs = [self.__segments[i] for i in seg_ids]
+        if len(segs) == 1:
+            self.__drop_segment(segs[0], expired=False)
+            return
+
+        meta_of = self.__meta
+        live = [] #(freq, order, key, size)
+        seen = set() #a key rewritten into the same segment is in its keys twice
+        for seg in segs:
+            for key in seg.keys:
+                meta = meta_of.get(key)
+                if meta is not None and meta >> SEG_SHIFT == seg.seg_id and key not in seen:
+                    seen.add(key)
+                    live.append((meta & FREQ_MAX, len(live), key, (meta >> FREQ_BITS) & SIZE_MASK))
+        live.sort(key=lambda obj: (-obj[0], obj[1]))
+        budget = self.__segment_size
+        keep = []
+        for freq, order, key, size in live:
+            if freq == 0 or size + self.__overhead > budget:
+                break
+            budget -= size + self.__overhead
+            keep.append((order, key, size))
+        keep.sort()
+
+        target = segs[0]
+        expire_at = min(seg.expire_at for seg in segs)
+        for seg in segs:
+            for key in seg.keys:
+                meta = meta_of.get(key)
+                if meta is not None and meta >> SEG_SHIFT == seg.seg_id:
+                    self.__unlink(key, meta)
+        for seg in segs[1:]:
+            self.__release(seg)
+        evicted = len(live) - len(keep)
+        self.__evictions += evicted
+
+        target.keys = []
+        target.used = 0
+        target.live = 0
+        target.expire_at = expire_at
+        for order, key, size in keep:
+            self.__append(target, key, size, 0) #frequency restarts after a merge
+
+    def snapshot(self):
+        """
+        the whole cache as flat columns, see snapshot.py: per-segment
+        columns, the keys of every segment back to back, the free stack,
+        the bucket chains and the packed object metadata; keys must be ints
+        :return: (json serializable meta, dict name -> array)
+        """
+        segments = self.__segments
+        chains = list(self.__chains.items())
+        meta = {
+            "engine": "segcache",
+            "capacity": self.__capa,
+            "overhead": self.__overhead,
+            "segment_size": self.__segment_size,
+            "merge_n": self.__merge_n,
+            "merge_cursor": self.__merge_cursor,
+            "size": self.__size,
+            "timer": self.__timer,
+            "stats": self.getStats(),
+        }
+        arrays = {
+            "seg_used": array("q", [seg.used for seg in segments]),
+            "seg_live": array("q", [seg.live for seg in segments]),
+            "seg_expire_at": array("q", [seg.expire_at for seg in segments]),
+            "seg_bucket": array("q", [seg.bucket for seg in segments]),
+            "seg_n_keys": array("q", [len(seg.keys) for seg in segments]),
+            "seg_keys": array("Q", [key for seg in segments for key in seg.keys]),
+            "free": array("q", self.__free),
+            "chain_buckets": array("q", [bucket for bucket, chain in chains]),
+            "chain_lens": array("q", [len(chain) for bucket, chain in chains]),
+            "chain_segs": array("q", [seg_id for bucket, chain in chains for seg_id in chain]),
+            "keys": array("Q", self.__meta.keys()),
+            "meta": array("Q", self.__meta.values()),
+        }
+        return meta, arrays
+
+    def restore(self, meta, arrays):
+        """
+        refill an empty cache built with the capacity, overhead, segment
+        size and merge_n of meta from the columns of snapshot()
+        """
+        seg_keys = arrays["seg_keys"]
+        lo = 0
+        for seg, used, live, expire_at, bucket, n_keys in zip(
+                self.__segments, arrays["seg_used"], arrays["seg_live"], arrays["seg_expire_at"],
+                arrays["seg_bucket"], arrays["seg_n_keys"]):
+            seg.keys = seg_keys[lo:lo + n_keys].tolist()
+            seg.used = used
+            seg.live = live
+            seg.expire_at = expire_at
+            seg.bucket = bucket
+            lo += n_keys
+        self.__free = arrays["free"].tolist()
+        chain_segs = arrays["chain_segs"]
+        lo = 0
+        for bucket, n in zip(arrays["chain_buckets"], arrays["chain_lens"]):
+            self.__chains[bucket] = chain_segs[lo:lo + n].tolist()
+            lo += n
+        self.__meta = dict(zip(arrays["keys"], arrays["meta"]))
+        self.__merge_cursor = meta["merge_cursor"]
+        self.__size = meta["size"]
+        self.__timer = meta["timer"]
+        stats = meta["stats"]
+        self.__evictions = stats["evictions"]
+        self.__hits = stats["hits"]
+        self.__misses = stats["misses"]
+        self.__ttl_expirations = stats["expirations"]
+        self.__insertions = stats["insertions"]
+        self.__merges = stats["merges"]
+        self.__segments_expired = stats["segments_expired"]
+        self.__hit_bytes = stats.get("hit_bytes", 0)
+        self.__miss_bytes = stats.get("miss_bytes", 0)
+
+    def getSize(self):
+        return self.__size
+
+    def check(self):
+        """
+        raise ValueError unless the size and the live bytes of every
+        segment add up to the objects the index points at
+        """
+        live = [0] * len(self.__segments)
+        total = 0
+        for meta in self.__meta.values():
+            item = ((meta >> FREQ_BITS) & SIZE_MASK) + self.__overhead
+            live[meta >> SEG_SHIFT] += item
+            total += item
+        if total != self.__size:
+            raise ValueError(f"size {self.__size} != {total} bytes of live objects")
+        for seg in self.__segments:
+            if seg.live != live[seg.seg_id]:
+                raise ValueError(f"segment {seg.seg_id} counts {seg.live} live bytes, holds {live[seg.seg_id]}")
+
+    def getStats(self):
+        return {
+            "evictions": self.__evictions,
+            "hits": self.__hits,
+            "misses": self.__misses,
+            "expirations": self.__ttl_expirations,
+            "insertions": self.__insertions,
+            "merges": self.__merges,
+            "segments_expired": self.__segments_expired,
+            "hit_bytes": self.__hit_bytes,
+            "miss_bytes": self.__miss_bytes,
+        }
+
+    def printStats(self):
+        stats = self.getStats()
+        for name, value in stats.items():
+            print(f"{name} {value}")
+        print(f"byte_hit_ratio {byte_hit_ratio(stats)}")
+
+
+
+if __name__ == "__main__":
+    from replay_sweep import replay
+
+    start = time.time()
+    full_heapsize=1048576000 #1,048,576,000
+    sampling_rate = 1000
+    heapsize = full_heapsize // sampling_rate
+    overhead = 2 * sys.getsizeof(int())
+    cache = SegCache(heapsize, overhead)
+    fpath = sys.argv[1] if len(sys.argv) > 1 else "n.sbin-10000000_items_10_ttl.txt"
+    hits, misses = replay(cache, fpath)
+    print(f"misses: {misses}    hits: {hits}")
+    print(f"miss ratio {misses/(misses+hits)}")
+    print("=cache stats=")
+    cache.printStats()
+    end = time.time()
+
+    print(f"time: {end - start} seconds")
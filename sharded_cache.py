@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+import argparse
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from hashing import mix64
+from ttl_index import TTLIndex
+
+
+class _Shard(object):
+    """
+    one partition of a ShardedExpiringDict: its own lock, byte budget,
+    LRU order (least recently used item first) and statistics
+    """
+
+    __slots__ = ("lock", "items", "ttl_index", "max_len", "max_age", "current_len",
+                 "hit", "totalrequest", "num_evicted", "evictionbyttl")
+
+    def __init__(self, max_len, max_age):
+        self.lock = Lock()
+        self.items = OrderedDict() #key -> (value, set_time, size), the ExpiringDict slot record
+        self.ttl_index = TTLIndex() #expiry order of every key, absolute expiry = set_time + max_age
+        self.max_len = max_len
+        self.max_age = max_age
+        self.current_len = 0
+        self.hit = 0
+        self.totalrequest = 0
+        self.num_evicted = 0
+        self.evictionbyttl = 0
+
+    def get(self, key, default, now):
+        with self.lock:
+            self.totalrequest += 1
+            item = self.items.get(key)
+            if item is None:
+                return default
+            if now - item[1] < self.max_age:
+                self.items.move_to_end(key) #mark as most recently used
+                self.hit += 1
+                return item[0]
+            self.remove(key)
+            self.num_evicted += 1
+            self.evictionbyttl += 1
+            return default
+
+    def set(self, key, value, now):
+        size = int(value[0])
+        with self.lock:
+            if key in self.items:
+                self.remove(key)
+            if size > self.max_len: #item can never fit
+                return
+            if size + self.current_len > self.max_len:
+                self.purge_expired(now) #reclaim expired items before evicting live ones
+            while size + self.current_len > self.max_len:
+                old_key, old = self.items.popitem(last=False)
+                self.ttl_index.discard(old_key)
+                self.current_len -= old[2]
+                self.num_evicted += 1
+            self.items[key] = (value, now, size)
+            self.ttl_index.add(key, now + self.max_age)
+            self.current_len += size
+
+    def remove(self, key):
+        """
+        unlink key, the caller holds the lock
+        :return: the removed value
+        """
+        item = self.items.pop(key)
+        self.ttl_index.discard(key)
+        self.current_len -= item[2]
+        return item[0]
+
+    def purge_expired(self, now):
+        """
+        drop every expired item, the caller holds the lock
+        """
+        expired = self.ttl_index.expire(now, inclusive=True)
+        for key in expired:
+            item = self.items.pop(key)
+            self.current_len -= item[2]
+            self.num_evicted += 1
+            self.evictionbyttl += 1
+        return len(expired)
+
+
+class ShardedExpiringDict(object):
+    """
+    lock-striped variant of ExpiringDict (LRUCache_TTLImplementation.py)
+
+    ExpiringDict serializes every request on one RLock. here keys are
+    hashed into n_shards independent sub-caches, each with its own lock,
+    byte budget of max_len // n_shards and LRU order, so threads only
+    contend when they hit the same shard. statistics are kept per shard
+    and merged when read.
+
+    values follow the ExpiringDict convention: value[0] is the size in
+    bytes charged against the budget
+    """
+
+    def __init__(self, max_len, max_age_seconds, n_shards=16):
+        """
+        :type max_len: int, total byte budget
+        :type max_age_seconds: float
+        :type n_shards: int
+        """
+        assert max_len >= n_shards >= 1
+        assert max_age_seconds >= 0
+        self.max_len = max_len
+        self.max_age = max_age_seconds
+        self.n_shards = n_shards
+        self.__shards = [_Shard(max_len // n_shards, max_age_seconds) for _ in range(n_shards)]
+
+    def shard_of(self, key):
+        """
+        :rtype: int, index of the shard that owns key
+        """
+        return mix64(hash(key)) % self.n_shards
+
+    def __shard(self, key):
+        return self.__shards[mix64(hash(key)) % self.n_shards]
+
+    def get(self, key, default=None):
+        """ Return the value for key if key is in the dictionary, else default. """
+        return self.__shard(key).get(key, default, time.time())
+
+    def __getitem__(self, key):
+        shard = self.__shard(key)
+        value = shard.get(key, shard, time.time())
+        if value is shard:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value, set_time=None):
+        """ Set d[key] to value. """
+        if set_time is None:
+            set_time = time.time()
+        self.__shard(key).set(key, value, set_time)
+
+    def __contains__(self, key):
+        shard = self.__shard(key)
+        return shard.get(key, shard, time.time()) is not shard
+
+    def __delitem__(self, key):
+        shard = self.__shard(key)
+        with shard.lock:
+            shard.remove(key)
+
+    def pop(self, key, default=None):
+        """ Get item from the dict and remove it.
+        Return default if expired or does not exist. Never raise KeyError.
+        """
+        shard = self.__shard(key)
+        now = time.time()
+        with shard.lock:
+            item = shard.items.get(key)
+            if item is None:
+                return default
+            shard.remove(key)
+            shard.num_evicted += 1
+            if now - item[1] < self.max_age:
+                return item[0]
+            shard.evictionbyttl += 1
+            return default
+
+    def purge_expired(self, now=None):
+        """ Remove every expired item, one shard at a time.
+        Returns the number of items removed.
+        """
+        if now is None:
+            now = time.time()
+        removed = 0
+        for shard in self.__shards:
+            with shard.lock:
+                removed += shard.purge_expired(now)
+        return removed
+
+    def __len__(self):
+        return sum(len(shard.items) for shard in self.__shards)
+
+    @property
+    def current_len(self):
+        return sum(shard.current_len for shard in self.__shards)
+
+    def getStats(self):
+        """
+        :return: statistics summed over the shards
+        """
+        stats = {"hit": 0, "totalrequest": 0, "num_evicted": 0, "evictionbyttl": 0,
+                 "current_len": 0, "items": 0}
+        for shard in self.__shards:
+            with shard.lock:
+                stats["hit"] += shard.hit
+                stats["totalrequest"] += shard.totalrequest
+                stats["num_evicted"] += shard.num_evicted
+                stats["evictionbyttl"] += shard.evictionbyttl
+                stats["current_len"] += shard.current_len
+                stats["items"] += len(shard.items)
+        return stats
+
+    def shard_sizes(self):
+        """
+        :return: bytes held by every shard, shows how evenly keys spread
+        """
+        return [shard.current_len for shard in self.__shards]
+
+    def get_hitratio(self):
+        stats = self.getStats()
+        if (stats["totalrequest"] != 0):
+            print("Hit Ratio:", 1.00 * stats["hit"] / stats["totalrequest"])
+
+    def get_eviction(self):
+        print("Total Evictions:", self.getStats()["num_evicted"])
+
+    def get_evictionbyttl(self):
+        print("Total Evictions by TTL:", self.getStats()["evictionbyttl"])
+
+
+def _worker(cache, ops, barrier):
+    get = cache.get
+    barrier.wait()
+    for key, value in ops:
+        if value is None:
+            get(key)
+        else:
+            cache[key] = value
+
+
+def run_threads(cache, n_threads, total_ops, n_keys, read_ratio=0.9, value_size=100, seed=0):
+    """
+    split total_ops random gets/sets over n_threads threads and time them
+    :return: ops per second
+    """
+    per_thread = total_ops // n_threads
+    work = []
+    for t in range(n_threads):
+        rng = random.Random(seed + t)
+        work.append([(rng.randrange(n_keys), None if rng.random() < read_ratio else (value_size, 0))
+                     for _ in range(per_thread)])
+    barrier = threading.Barrier(n_threads + 1)
+    threads = [threading.Thread(target=_worker, args=(cache, ops, barrier)) for ops in work]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return per_thread * n_threads / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    from LRUCache_TTLImplementation import ExpiringDict
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", help="thread counts to benchmark", nargs="+", type=int,
+                    default=[1, 4, 16, 64])
+    ap.add_argument("--ops", help="total requests per run", type=int, default=400000)
+    ap.add_argument("--keys", help="distinct keys", type=int, default=100000)
+    ap.add_argument("--shards", help="shards of the sharded dict", type=int, default=16)
+    ap.add_argument("--read_ratio", help="fraction of requests that are gets", type=float, default=0.9)
+    ap.add_argument("--max_len", help="byte budget, the default holds every key", type=int,
+                    default=1 << 24)
+    args = ap.parse_args()
+
+    print(f"python {sys.version.split()[0]}, {args.ops} ops, {args.keys} keys, "
+          f"{args.read_ratio:.0%} reads, {args.shards} shards")
+    print("threads  single_lock_ops_s  sharded_ops_s")
+    for n_threads in args.threads:
+        single = ExpiringDict(max_len=args.max_len, max_age_seconds=3600)
+        sharded = ShardedExpiringDict(args.max_len, 3600, args.shards)
+        single_rate = run_threads(single, n_threads, args.ops, args.keys, args.read_ratio)
+        sharded_rate = run_threads(sharded, n_threads, args.ops, args.keys, args.read_ratio)
+        print(f"{n_threads:7d}  {single_rate:17.0f}  {sharded_rate:13.0f}")
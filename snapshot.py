@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import gc
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from admission import TinyLFU
+from cache_core import CacheCore
+from eviction_policies import make_policy
+from fast_core import FastLFUCache, FastLRUCache
+from segcache import SegCache
+
+
+# binary snapshot of a cache engine written by save_snapshot()
+#
+# layout:
+#     32 byte header  magic, version, meta length, column count
+#     meta            json: engine, constructor parameters, scalar state,
+#                     statistics and the caller's info
+#     column table    per column: name, array typecode, offset, item count
+#     columns         the key index, sizes, expiries and policy order of the
+#                     engine (see its snapshot()), each one contiguous in
+#                     the byte order of the machine that wrote it and
+#                     8 byte aligned
+#
+# load_snapshot() maps the file and hands every column to the engine as a
+# memoryview cast to its typecode, so nothing is parsed or copied before
+# the engine rebuilds its index. the cyclic garbage collector is paused
+# meanwhile: every object created is kept, and collections triggered by
+# millions of new nodes would take about as long as creating them
+
+MAGIC = b"CSNP"
+VERSION = 1
+HEADER = struct.Struct("<4sIQI")
+HEADER_SIZE = 32
+COLUMN = struct.Struct("<32ss7xQQ") #name, typecode, offset, count
+ALIGN = 8
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def new_engine(meta):
+    """
+    an empty engine built with the parameters recorded in snapshot meta
+    """
+    engine = meta["engine"]
+    if engine == "cache_core":
+        admission = TinyLFU(meta["admission"]["width"]) if meta["admission"] is not None else None
+        return CacheCore(meta["capacity"], make_policy(meta["policy"]), meta["overhead"],
+                         meta["reclaim_expired"], meta["proactive_expiry"], admission)
+    if engine == "segcache":
+        return SegCache(meta["capacity"], meta["overhead"], meta["segment_size"], meta["merge_n"])
+    if engine == FastLRUCache.name:
+        return FastLRUCache(meta["capacity"], meta["overhead"], meta["reclaim_expired"],
+                            meta["proactive_expiry"])
+    if engine == FastLFUCache.name:
+        return FastLFUCache(meta["capacity"], meta["overhead"], meta["reclaim_expired"],
+                            meta["proactive_expiry"])
+    if engine == "expiring_dict":
+        from LRUCache_TTLImplementation import ExpiringDict
+        return ExpiringDict(meta["max_len"], meta["max_age"])
+    raise ValueError(f"unknown engine {engine} in snapshot")
+
+
+def save_snapshot(cache, out_path, info=None):
+    """
+    write cache.snapshot() to out_path; the file is written next to it and
+    renamed over it, so an interrupted save keeps the previous snapshot
+
+    :type info: json serializable, handed back by load_snapshot()
+    :return: number of bytes written
+    """
+    meta, arrays = cache.snapshot()
+    meta = dict(meta, info=info, byteorder=sys.byteorder)
+    raw_meta = json.dumps(meta).encode()
+    names = list(arrays)
+    offset = _aligned(HEADER_SIZE + len(raw_meta) + COLUMN.size * len(names))
+    table = []
+    for name in names:
+        column = arrays[name]
+        table.append(COLUMN.pack(name.encode(), column.typecode.encode(), offset, len(column)))
+        offset = _aligned(offset + column.itemsize * len(column))
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as ofile:
+        ofile.write(HEADER.pack(MAGIC, VERSION, len(raw_meta), len(names)).ljust(HEADER_SIZE, b"\0"))
+        ofile.write(raw_meta)
+        ofile.write(b"".join(table))
+        for name in names:
+            ofile.write(bytes(_aligned(ofile.tell()) - ofile.tell()))
+            ofile.write(arrays[name])
+        size = ofile.tell()
+    os.replace(tmp_path, out_path)
+    return size
+
+
+def read_meta(snapshot_path):
+    """
+    :return: the json meta of a snapshot, without mapping its columns
+    """
+    with open(snapshot_path, "rb") as ifile:
+        raw = ifile.read(HEADER_SIZE)
+        if len(raw) < HEADER_SIZE:
+            raise ValueError(f"{snapshot_path} is too short to be a snapshot")
+        meta_len = _check_header(snapshot_path, raw)[0]
+        return json.loads(ifile.read(meta_len))
+
+
+def _check_header(snapshot_path, raw):
+    magic, version, meta_len, n_columns = HEADER.unpack_from(raw)
+    if magic != MAGIC:
+        raise ValueError(f"{snapshot_path} is not a cache snapshot")
+    if version != VERSION:
+        raise ValueError(f"unsupported snapshot version {version}")
+    return meta_len, n_columns
+
+
+def load_snapshot(snapshot_path):
+    """
+    rebuild the engine saved by save_snapshot() from a read-only mapping
+    of the file
+    :return: (cache, info)
+    """
+    with open(snapshot_path, "rb") as ifile:
+        with mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if len(mapped) < HEADER_SIZE:
+                raise ValueError(f"{snapshot_path} is too short to be a snapshot")
+            meta_len, n_columns = _check_header(snapshot_path, mapped[:HEADER_SIZE])
+            meta = json.loads(mapped[HEADER_SIZE:HEADER_SIZE + meta_len])
+            if meta["byteorder"] != sys.byteorder:
+                raise ValueError(f"{snapshot_path} was written on a {meta['byteorder']} endian machine")
+
+            view = memoryview(mapped)
+            arrays = {}
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                pos = HEADER_SIZE + meta_len
+                for _ in range(n_columns):
+                    name, typecode, offset, count = COLUMN.unpack_from(mapped, pos)
+                    pos += COLUMN.size
+                    typecode = typecode.decode()
+                    nbytes = count * array(typecode).itemsize
+                    arrays[name.rstrip(b"\0").decode()] = view[offset:offset + nbytes].cast(typecode)
+                cache = new_engine(meta)
+                cache.restore(meta, arrays)
+            finally:
+                for column in arrays.values(): #the mapping can only close once no view is left
+                    column.release()
+                view.release()
+                if gc_enabled:
+                    gc.enable()
+    return cache, meta["info"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("snapshot", help="the path to the snapshot", type=str)
+    args = ap.parse_args()
+
+    print(read_meta(args.snapshot))
@@ -3,8 +3,17 @@
 import argparse
 import struct
 
+import trace_format
+from trace_reader import decode_array, open_sbin
 
-def change_get_to_set(trace_path, default_ttl):
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed by change_get_to_set_vectorized
+    np = None
+
+
+def change_get_to_set(trace_path, default_ttl, out_format="bin"):
     #default_ttl_list: 86400:0.65,1296000:0.27,43200:0.07
     """
     because the cache is cold (no item inside at start time),
@@ -15,6 +24,8 @@ def change_get_to_set(trace_path, default_ttl):
     get/gets/cas/replace/incr/decr/append/prepend/delete of each item to set
 
     :param trace_path:
+    :param out_format: "bin" writes the compact trace_format file,
+                       "text" the old "ts obj key_len op_ttl" lines
     :return:
     """
     s = struct.Struct("<IQII")
@@ -26,7 +37,11 @@ def change_get_to_set(trace_path, default_ttl):
     ifile = open(trace_path, "rb")
     # ofile = open(trace_path + ".processed", "wb")
     # ofile = open(trace_path + "-100000000_items_10_ttl.txt", "w")
-    ofile = open(trace_path + "-temp.txt", "w")
+    if out_format == "text":
+        ofile = open(trace_path + "-temp.txt", "w")
+        out_lines = []
+    else:
+        writer = trace_format.TraceWriter(trace_path + "-temp" + trace_format.EXTENSION, default_ttl)
     r = ifile.read(s.size)
     # r=ifile.readline()[-1]
     while r:
@@ -48,7 +63,7 @@ def change_get_to_set(trace_path, default_ttl):
             op = 3
             if ttl == 0:
                 ttl = default_ttl
-        print("TTL=",ttl,"kvlen=",kv_len,"key_len",key_len)
+        # print("TTL=",ttl,"kvlen=",kv_len,"key_len",key_len)
         op_ttl_new = (op << 24) | (ttl & (0x01000000 - 1))
 
         if key_len == 0:
@@ -66,10 +81,15 @@ def change_get_to_set(trace_path, default_ttl):
         # print(ts, obj, kv_len, op_ttl_new)
         #(epoch time, obj, length of data, time to live
         # ofile.write(s.pack(ts, obj, kv_len, op_ttl_new))
-        stringval = str(ts)+" "+ str(obj) +" "+ str(key_len) +" "+str(op_ttl_new)+"\n"
-        ofile.write(stringval)
+        if out_format == "text":
+            out_lines.append(str(ts)+" "+ str(obj) +" "+ str(key_len) +" "+str(op_ttl_new)+"\n")
+            if len(out_lines) >= 65536:
+                ofile.write("".join(out_lines))
+                out_lines = []
+        else:
+            writer.write(ts, obj, key_len, val_len, op, ttl)
         seen_obj.add(obj)
-        print(ttl,op_ttl_new)
+        # print(ttl,op_ttl_new)
         # if(n_req==1):
         #
         #     break
@@ -79,7 +99,88 @@ def change_get_to_set(trace_path, default_ttl):
     end_ts = ts
 
     ifile.close()
-    ofile.close()
+    if out_format == "text":
+        ofile.write("".join(out_lines))
+        ofile.close()
+    else:
+        writer.close(len(seen_obj))
+    print("time range {}-{} ({} sec) total {} obj".format(
+        start_ts, end_ts, end_ts - start_ts, len(seen_obj)))
+
+
+def change_get_to_set_vectorized(trace_path, default_ttl, out_format="bin",
+                                 chunk_records=4194304, max_req=100000000):
+    """
+    same rewrite as change_get_to_set, but the trace is mapped as a numpy
+    structured array and processed chunk_records at a time with array ops:
+    the bit fields are split with bitwise ops, the first request of every
+    object in a chunk comes from np.unique(..., return_index=True), and a
+    sorted array of objects seen in earlier chunks filters out the ones that
+    are not first occurrences of the whole trace
+
+    :param trace_path:
+    :param out_format: "bin" writes the compact trace_format file,
+                       "text" the old "ts obj key_len op_ttl" lines
+    :return:
+    """
+    if np is None:
+        raise ImportError("numpy is required for change_get_to_set_vectorized")
+
+    records = open_sbin(trace_path)[:max_req]
+    seen_obj = np.empty(0, dtype=np.uint64) #sorted
+    n_zero_key = 0
+
+    if out_format == "text":
+        ofile = open(trace_path + "-temp.txt", "w")
+    else:
+        writer = trace_format.TraceWriter(trace_path + "-temp" + trace_format.EXTENSION, default_ttl)
+
+    for lo in range(0, len(records), chunk_records):
+        cols = decode_array(records[lo:lo + chunk_records])
+        obj = cols["obj"]
+        op = cols["op"].astype(np.uint8)
+        ttl = cols["ttl"].astype(np.uint32)
+
+        # first request of each object in this chunk that was not seen before
+        uniq, first_idx = np.unique(obj, return_index=True)
+        pos = np.searchsorted(seen_obj, uniq)
+        pos[pos == len(seen_obj)] = 0
+        new = seen_obj[pos] != uniq if len(seen_obj) else np.ones(len(uniq), dtype=bool)
+        first_idx = first_idx[new]
+
+        # get, gets, set, add, cas, ... (index starts from 1), rewrite to set
+        first_idx = first_idx[(op[first_idx] != 3) & (op[first_idx] != 4)]
+        op[first_idx] = 3
+        ttl[first_idx[ttl[first_idx] == 0]] = default_ttl
+
+        seen_obj = np.union1d(seen_obj, uniq[new])
+        n_zero_key += int(np.count_nonzero(cols["key_len"] == 0))
+
+        if out_format == "text":
+            op_ttl_new = (op.astype(np.uint32) << 24) | (ttl & (0x01000000 - 1))
+            ofile.write("".join(f"{t} {o} {k} {v}\n" for t, o, k, v in zip(
+                cols["ts"].tolist(), obj.tolist(), cols["key_len"].tolist(), op_ttl_new.tolist())))
+        else:
+            out = np.zeros(len(obj), dtype=trace_format.CTRACE_DTYPE)
+            out["ts"] = cols["ts"]
+            out["obj"] = obj
+            out["val_len"] = cols["val_len"]
+            out["ttl"] = ttl
+            out["key_len"] = cols["key_len"]
+            out["op"] = op
+            writer.write_array(out)
+
+    if out_format == "text":
+        ofile.close()
+    else:
+        writer.close(len(seen_obj))
+
+    if n_zero_key:
+        print("trace contains {} requests of key size 0".format(n_zero_key))
+    if len(records):
+        start_ts, end_ts = int(records["ts"][0]), int(records["ts"][-1])
+    else:
+        start_ts, end_ts = -1, -1
     print("time range {}-{} ({} sec) total {} obj".format(
         start_ts, end_ts, end_ts - start_ts, len(seen_obj)))
 
@@ -90,9 +191,11 @@ if __name__ == "__main__":
                     default="change_get_to_set")
     ap.add_argument("trace", help="the path to the trace", type=str)
     ap.add_argument("default_ttl", help="the default ttl", type=int)
+    ap.add_argument("--format", help="output format, compact binary or text for debugging",
+                    choices=["bin", "text"], default="bin")
 
     args = ap.parse_args()
 
-    globals()[args.func](args.trace, args.default_ttl)
+    globals()[args.func](args.trace, args.default_ttl, args.format)
 
 #command run: python3 trace_conv.py n.sbin 100
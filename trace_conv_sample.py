@@ -6,8 +6,12 @@ import struct
 import timeit
 import os
 
+import trace_format
+from hashing import mix64_array
+from trace_reader import decode_array, open_sbin
 
-def change_get_to_set(trace_path, default_ttl):
+
+def change_get_to_set(trace_path, default_ttl, out_format="bin", sample_rate=1000):
     #default_ttl_list: 86400:0.65,1296000:0.27,43200:0.07
     """
     because the cache is cold (no item inside at start time),
@@ -18,6 +22,9 @@ def change_get_to_set(trace_path, default_ttl):
     get/gets/cas/replace/incr/decr/append/prepend/delete of each item to set
 
     :param trace_path:
+    :param out_format: "bin" writes the compact trace_format file,
+                       "text" the old "ts obj key_len ttl" lines
+    :param sample_rate: get one sample from sample_rate items
     :return:
     """
     s = struct.Struct("<IQII")
@@ -28,11 +35,15 @@ def change_get_to_set(trace_path, default_ttl):
 
     ifile = open(trace_path, "rb")
     # ofile = open(trace_path + ".processed", "wb")
-    ofile = open(trace_path + "-sampled_1000_items_100_ttl_mix_3.txt", "w")
+    out_path = trace_path + "-sampled_1000_items_100_ttl_mix_3"
+    if out_format == "text":
+        ofile = open(out_path + ".txt", "w")
+        out_lines = []
+    else:
+        writer = trace_format.TraceWriter(out_path + trace_format.EXTENSION, default_ttl)
     r = ifile.read(s.size)
     fsize = os.path.getsize(trace_path)
     pos = 0
-    sample_rate = 1000 #get one sample from sample_rate items
 
     lines = fsize//s.size
     print(f"total number of lines = {lines}")
@@ -77,8 +88,13 @@ def change_get_to_set(trace_path, default_ttl):
         # print(ts, obj, kv_len, op_ttl_new)
         #(epoch time, obj, length of data, time to live
         # ofile.write(s.pack(ts, obj, kv_len, op_ttl_new))
-        stringval = str(ts)+" "+ str(obj) +" "+ str(key_len) +" "+str(ttl)+"\n"
-        ofile.write(stringval)
+        if out_format == "text":
+            out_lines.append(str(ts)+" "+ str(obj) +" "+ str(key_len) +" "+str(ttl)+"\n")
+            if len(out_lines) >= 65536:
+                ofile.write("".join(out_lines))
+                out_lines = []
+        else:
+            writer.write(ts, obj, key_len, val_len, op, ttl)
         seen_obj.add(obj)
         if (n_req%100000 == 0):
             print(f"sampled items: {n_req}")
@@ -88,12 +104,122 @@ def change_get_to_set(trace_path, default_ttl):
     end_ts = ts
 
     ifile.close()
-    ofile.close()
+    if out_format == "text":
+        ofile.write("".join(out_lines))
+        ofile.close()
+    else:
+        writer.close(len(seen_obj))
     print(f"total number of sampled items {n_req}")
     print("time range {}-{} ({} sec) total {} obj".format(
         start_ts, end_ts, end_ts - start_ts, len(seen_obj)))
 
 
+def _open_output(out_path, default_ttl, out_format):
+    if out_format == "text":
+        return open(out_path + ".txt", "w")
+    return trace_format.TraceWriter(out_path + trace_format.EXTENSION, default_ttl)
+
+
+def _write_records(out, records, default_ttl, out_format):
+    """
+    decode a chunk of raw .sbin records, fill in default_ttl and append it to out
+    """
+    cols = decode_array(records)
+    ttl = cols["ttl"].astype("<u4")
+    ttl[ttl == 0] = default_ttl
+    if out_format == "text":
+        out.write("".join(f"{t} {o} {k} {v}\n" for t, o, k, v in zip(
+            cols["ts"].tolist(), cols["obj"].tolist(), cols["key_len"].tolist(), ttl.tolist())))
+        return
+    chunk = trace_format.np.zeros(len(records), dtype=trace_format.CTRACE_DTYPE)
+    chunk["ts"] = cols["ts"]
+    chunk["obj"] = cols["obj"]
+    chunk["val_len"] = cols["val_len"]
+    chunk["ttl"] = ttl
+    chunk["key_len"] = cols["key_len"]
+    chunk["op"] = cols["op"]
+    out.write_array(chunk)
+
+
+def _close_output(out, n_obj, out_format):
+    if out_format == "text":
+        out.close()
+    else:
+        out.close(n_obj)
+
+
+def sample_strided(trace_path, default_ttl, out_format="bin", sample_rate=1000,
+                   chunk_records=4194304):
+    """
+    the same temporal sample as change_get_to_set (every sample_rate-th
+    request), taken in one pass as a strided view arr[::sample_rate] of the
+    memory-mapped trace instead of a seek/read pair per sampled record.
+    the view is decoded and written chunk_records sampled records at a
+    time, so memory does not grow with the sample
+
+    :param trace_path:
+    :param sample_rate: get one sample from sample_rate items
+    :return:
+    """
+    records = open_sbin(trace_path)
+    print(f"total number of lines = {len(records)}")
+    np = trace_format.np
+    sampled = records[::sample_rate]
+
+    out = _open_output(trace_path + f"-sampled_{sample_rate}_items_{default_ttl}_ttl", default_ttl, out_format)
+    sampled_obj = np.empty(0, dtype=np.uint64)
+    for lo in range(0, len(sampled), chunk_records):
+        chunk = sampled[lo:lo + chunk_records]
+        _write_records(out, chunk, default_ttl, out_format)
+        sampled_obj = np.union1d(sampled_obj, chunk["obj"])
+    _close_output(out, len(sampled_obj), out_format)
+
+    print(f"total number of sampled items {len(sampled)}")
+    if len(sampled):
+        start_ts, end_ts = int(sampled["ts"][0]), int(sampled["ts"][-1])
+        print("time range {}-{} ({} sec) total {} obj".format(
+            start_ts, end_ts, end_ts - start_ts, len(sampled_obj)))
+
+
+def sample_spatial(trace_path, default_ttl, out_format="bin", sample_rate=1000,
+                   chunk_records=4194304):
+    """
+    SHARDS style spatial sample: keep every request of the objects whose
+    mix64(obj) % sample_rate == 0. unlike the temporal sample, each kept
+    object keeps its whole access sequence, so a cache of
+    heapsize // sample_rate bytes replayed on the sample predicts the miss
+    ratio of the full size cache on the full trace
+
+    :param trace_path:
+    :param sample_rate: keep one object out of sample_rate
+    :return:
+    """
+    records = open_sbin(trace_path)
+    print(f"total number of lines = {len(records)}")
+    np = trace_format.np
+
+    out = _open_output(trace_path + f"-spatial_{sample_rate}_items_{default_ttl}_ttl", default_ttl, out_format)
+    n_req = 0
+    start_ts, end_ts = -1, -1
+    sampled_obj = np.empty(0, dtype=np.uint64)
+    for lo in range(0, len(records), chunk_records):
+        chunk = records[lo:lo + chunk_records]
+        chunk = chunk[mix64_array(chunk["obj"]) % np.uint64(sample_rate) == 0]
+        if not len(chunk):
+            continue
+        _write_records(out, chunk, default_ttl, out_format)
+        sampled_obj = np.union1d(sampled_obj, chunk["obj"])
+        if start_ts == -1:
+            start_ts = int(chunk["ts"][0])
+        end_ts = int(chunk["ts"][-1])
+        n_req += len(chunk)
+    _close_output(out, len(sampled_obj), out_format)
+
+    print(f"total number of sampled items {n_req}")
+    print("time range {}-{} ({} sec) total {} obj".format(
+        start_ts, end_ts, end_ts - start_ts, len(sampled_obj)))
+
+
 if __name__ == "__main__":
     start = timeit.default_timer()
     ap = argparse.ArgumentParser()
@@ -101,13 +227,17 @@ if __name__ == "__main__":
                     default="change_get_to_set")
     ap.add_argument("trace", help="the path to the trace", type=str)
     ap.add_argument("default_ttl", help="the default ttl", type=int)
+    ap.add_argument("--format", help="output format, compact binary or text for debugging",
+                    choices=["bin", "text"], default="bin")
+    ap.add_argument("--sample_rate", help="get one sample from sample_rate items (or objects)",
+                    type=int, default=1000)
 
     args = ap.parse_args()
 
-    globals()[args.func](args.trace, args.default_ttl)
+    globals()[args.func](args.trace, args.default_ttl, args.format, args.sample_rate)
     
-stop = timeit.default_timer()
+    stop = timeit.default_timer()
 
-print('Time: ', stop - start) 
+    print('Time: ', stop - start) 
 
 #command run: python3 trace_conv.py n.sbin 100
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, only needed to map a trace as an array
+    np = None
+
+
+# compact intermediate trace written by trace_conv.py / trace_conv_sample.py
+#
+# layout, all little-endian:
+#     64 byte header  magic, version, record count, start/end timestamp,
+#                     unique object count, default ttl
+#     N records       24 bytes each, already decoded so the replay never has
+#                     to touch the packed kv_len / op_ttl bit fields
+#
+# the record array starts right after the header and can be mapped zero-copy
+# with numpy.memmap(path, dtype=CTRACE_DTYPE, offset=HEADER_SIZE)
+
+MAGIC = b"CTRC"
+VERSION = 1
+HEADER = struct.Struct("<4sIQIIQI")
+HEADER_SIZE = 64
+# ts, obj, val_len, ttl, key_len, op, padding
+RECORD = struct.Struct("<IQIIHBx")
+EXTENSION = ".ctrace"
+
+if np is not None:
+    CTRACE_DTYPE = np.dtype([("ts", "<u4"), ("obj", "<u8"), ("val_len", "<u4"),
+                             ("ttl", "<u4"), ("key_len", "<u2"), ("op", "u1"),
+                             ("pad", "u1")])
+    assert CTRACE_DTYPE.itemsize == RECORD.size
+else:
+    CTRACE_DTYPE = None
+
+
+def is_ctrace(trace_path):
+    return trace_path.endswith(EXTENSION)
+
+
+class TraceWriter(object):
+    """
+    buffered writer for the compact trace format; records are packed into
+    a chunk and flushed in one write every chunk_records records, and the
+    header is filled in by close()
+    """
+
+    def __init__(self, out_path, default_ttl=0, chunk_records=65536):
+        self.out_path = out_path
+        self.default_ttl = default_ttl
+        self.n_req = 0
+        self.start_ts = -1
+        self.end_ts = -1
+        self.__chunk_records = chunk_records
+        self.__chunk = []
+        self.__ofile = open(out_path, "wb")
+        self.__ofile.write(bytes(HEADER_SIZE)) #placeholder until close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self.__ofile.closed:
+            self.close()
+
+    def write(self, ts, obj, key_len, val_len, op, ttl):
+        if self.start_ts == -1:
+            self.start_ts = ts
+        self.end_ts = ts
+        self.n_req += 1
+        self.__chunk.append(RECORD.pack(ts, obj, val_len, ttl, key_len, op))
+        if len(self.__chunk) >= self.__chunk_records:
+            self.flush()
+
+    def write_array(self, records):
+        """
+        append a CTRACE_DTYPE array in one write
+        """
+        if not len(records):
+            return
+        self.flush()
+        if self.start_ts == -1:
+            self.start_ts = int(records["ts"][0])
+        self.end_ts = int(records["ts"][-1])
+        self.n_req += len(records)
+        self.__ofile.write(np.ascontiguousarray(records, dtype=CTRACE_DTYPE).tobytes())
+
+    def flush(self):
+        if self.__chunk:
+            self.__ofile.write(b"".join(self.__chunk))
+            self.__chunk = []
+
+    def close(self, n_obj=0):
+        """
+        :type n_obj: int, number of unique objects, stored in the header
+        """
+        self.flush()
+        self.__ofile.seek(0)
+        self.__ofile.write(HEADER.pack(MAGIC, VERSION, self.n_req,
+                                       max(self.start_ts, 0), max(self.end_ts, 0),
+                                       n_obj, self.default_ttl))
+        self.__ofile.close()
+
+
+def read_header(trace_path):
+    """
+    :return: dict with version, n_req, start_ts, end_ts, n_obj, default_ttl
+    """
+    with open(trace_path, "rb") as ifile:
+        raw = ifile.read(HEADER_SIZE)
+    if len(raw) < HEADER.size:
+        raise ValueError(f"{trace_path} is too short to be a compact trace")
+    magic, version, n_req, start_ts, end_ts, n_obj, default_ttl = HEADER.unpack_from(raw)
+    if magic != MAGIC:
+        raise ValueError(f"{trace_path} is not a compact trace")
+    if version != VERSION:
+        raise ValueError(f"unsupported compact trace version {version}")
+    return {"version": version, "n_req": n_req, "start_ts": start_ts,
+            "end_ts": end_ts, "n_obj": n_obj, "default_ttl": default_ttl}
+
+
+def open_ctrace(trace_path):
+    """
+    map the record array of a compact trace without copying it (needs numpy)
+    """
+    if np is None:
+        raise ImportError("numpy is required to map a trace as an array")
+    n_req = read_header(trace_path)["n_req"]
+    if n_req == 0:
+        return np.empty(0, dtype=CTRACE_DTYPE)
+    return np.memmap(trace_path, dtype=CTRACE_DTYPE, mode="r",
+                     offset=HEADER_SIZE, shape=(n_req,))
+
+
+def iter_ctrace(trace_path, batch_size=65536):
+    """
+    stream a compact trace in batches
+
+    :return: generator of lists of (ts, obj, op, ttl, key_len, val_len)
+    """
+    n_req = read_header(trace_path)["n_req"]
+    if np is not None:
+        records = open_ctrace(trace_path)
+        for lo in range(0, n_req, batch_size):
+            chunk = records[lo:lo + batch_size]
+            yield list(zip(chunk["ts"].tolist(), chunk["obj"].tolist(),
+                           chunk["op"].tolist(), chunk["ttl"].tolist(),
+                           chunk["key_len"].tolist(), chunk["val_len"].tolist()))
+        return
+
+    with open(trace_path, "rb") as ifile:
+        ifile.seek(HEADER_SIZE)
+        remaining = n_req
+        while remaining > 0:
+            n = min(batch_size, remaining)
+            raw = ifile.read(n * RECORD.size)
+            remaining -= n
+            yield [(ts, obj, op, ttl, key_len, val_len)
+                   for ts, obj, val_len, ttl, key_len, op in RECORD.iter_unpack(raw)]
+
+
+def export_text(trace_path, out_path=None):
+    """
+    write a compact trace back out as "ts obj key_len ttl" lines for debugging
+    """
+    if out_path is None:
+        out_path = trace_path + ".txt"
+    with open(out_path, "w") as ofile:
+        for batch in iter_ctrace(trace_path):
+            ofile.write("".join(f"{ts} {obj} {key_len} {ttl}\n"
+                                for ts, obj, op, ttl, key_len, val_len in batch))
+    return out_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("trace", help="the path to the compact trace", type=str)
+    ap.add_argument("--export", help="also write the trace as text", action="store_true")
+    args = ap.parse_args()
+
+    print(read_header(args.trace))
+    if args.export:
+        print(f"wrote {export_text(args.trace)}")
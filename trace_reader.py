@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import struct
+
+import trace_format
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, the struct based reader is used without it
+    np = None
+
+
+# twitter twemcache binary trace: timestamp, obj id, key/value length, op/ttl
+RECORD = struct.Struct("<IQII")
+
+if np is not None:
+    SBIN_DTYPE = np.dtype([("ts", "<u4"), ("obj", "<u8"),
+                           ("kv_len", "<u4"), ("op_ttl", "<u4")])
+else:
+    SBIN_DTYPE = None
+
+DEFAULT_BATCH_SIZE = 65536
+
+
+def is_binary_trace(trace_path):
+    return trace_path.endswith(".sbin")
+
+
+def decode_fields(kv_len, op_ttl):
+    """
+    split the packed fields of one record the same way change_get_to_set does
+
+    :return: (op, ttl, key_len, val_len)
+    """
+    op = (op_ttl >> 24) & (0x00000100 - 1)
+    ttl = op_ttl & (0x01000000 - 1)
+    key_len = (kv_len >> 22) & (0x00000400 - 1)
+    val_len = kv_len & (0x00400000 - 1)
+    return op, ttl, key_len, val_len
+
+
+def decode_array(records):
+    """
+    vectorized decode_fields for a SBIN_DTYPE array (or memmap view)
+
+    :return: dict of numpy columns ts, obj, op, ttl, key_len, val_len
+    """
+    kv_len = records["kv_len"]
+    op_ttl = records["op_ttl"]
+    return {
+        "ts": records["ts"],
+        "obj": records["obj"],
+        "op": (op_ttl >> 24) & (0x00000100 - 1),
+        "ttl": op_ttl & (0x01000000 - 1),
+        "key_len": (kv_len >> 22) & (0x00000400 - 1),
+        "val_len": kv_len & (0x00400000 - 1),
+    }
+
+
+def open_sbin(trace_path):
+    """
+    memory-map a .sbin trace as a read-only structured array (needs numpy)
+    """
+    if np is None:
+        raise ImportError("numpy is required to map a trace as an array")
+    if os.path.getsize(trace_path) < RECORD.size:
+        return np.empty(0, dtype=SBIN_DTYPE)
+    return np.memmap(trace_path, dtype=SBIN_DTYPE, mode="r",
+                     shape=(os.path.getsize(trace_path) // RECORD.size,))
+
+
+def iter_sbin(trace_path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    stream a .sbin trace in batches without loading it into memory
+
+    :return: generator of lists of (ts, obj, op, ttl, key_len, val_len)
+    """
+    if os.path.getsize(trace_path) < RECORD.size:
+        return
+    if np is not None:
+        records = open_sbin(trace_path)
+        for lo in range(0, len(records), batch_size):
+            cols = decode_array(records[lo:lo + batch_size])
+            yield list(zip(cols["ts"].tolist(), cols["obj"].tolist(),
+                           cols["op"].tolist(), cols["ttl"].tolist(),
+                           cols["key_len"].tolist(), cols["val_len"].tolist()))
+        return
+
+    with open(trace_path, "rb") as ifile:
+        with mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            n = len(mm) // RECORD.size
+            step = batch_size * RECORD.size
+            for lo in range(0, n * RECORD.size, step):
+                hi = min(lo + step, n * RECORD.size)
+                view = memoryview(mm)[lo:hi]
+                batch = [(ts, obj) + decode_fields(kv_len, op_ttl)
+                         for ts, obj, kv_len, op_ttl in RECORD.iter_unpack(view)]
+                view.release()
+                yield batch
+
+
+def iter_text(trace_path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    stream a converted text trace ("ts obj key_len ttl" per line) in batches
+
+    :return: generator of lists of (ts, obj, key_len, ttl)
+    """
+    batch = []
+    with open(trace_path, "r") as ifile:
+        for line in ifile:
+            data = line.split(" ")
+            if len(data) < 4:
+                continue
+            batch.append((int(data[0]), int(data[1]), int(data[2]), int(data[3])))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def read_trace(trace_path, default_ttl=0, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    yield one (current_time, obj, size, ttl) record at a time, the shape the
+    cache replay loops consume. .sbin traces are decoded on the fly with
+    size = key_len and ttl = default_ttl where the trace has none, the same
+    fields trace_conv_sample.py writes; compact .ctrace files written by the
+    converters are read as is, and anything else is read as text
+    """
+    if trace_format.is_ctrace(trace_path):
+        for batch in trace_format.iter_ctrace(trace_path, batch_size):
+            for ts, obj, op, ttl, key_len, val_len in batch:
+                yield ts, obj, key_len, ttl
+    elif is_binary_trace(trace_path):
+        for batch in iter_sbin(trace_path, batch_size):
+            for ts, obj, op, ttl, key_len, val_len in batch:
+                yield ts, obj, key_len, ttl if ttl != 0 else default_ttl
+    else:
+        for batch in iter_text(trace_path, batch_size):
+            yield from batch
+
+
+def read_trace_batches(trace_path, default_ttl=0, batch_size=DEFAULT_BATCH_SIZE, start=0,
+                       size_field="key_len"):
+    """
+    the records of read_trace in blocks of up to batch_size, as the columns
+    (times, objs, sizes, ttls) that the caches' *_many methods take
+
+    :param start: number of records to skip; mapped binary traces seek
+                  straight to it, the other readers are read past it
+    :param size_field: column of a .ctrace replayed as the object size,
+                       key_len like every other format, or val_len where a
+                       converted text trace keeps sizes too large for key_len
+    """
+    if trace_format.is_ctrace(trace_path) and np is not None:
+        records = trace_format.open_ctrace(trace_path)
+        for lo in range(start, len(records), batch_size):
+            chunk = records[lo:lo + batch_size]
+            yield (chunk["ts"].tolist(), chunk["obj"].tolist(),
+                   chunk[size_field].tolist(), chunk["ttl"].tolist())
+    elif is_binary_trace(trace_path) and np is not None:
+        records = open_sbin(trace_path)
+        for lo in range(start, len(records), batch_size):
+            cols = decode_array(records[lo:lo + batch_size])
+            ttl = cols["ttl"]
+            if default_ttl:
+                ttl = np.where(ttl != 0, ttl, default_ttl)
+            yield (cols["ts"].tolist(), cols["obj"].tolist(),
+                   cols["key_len"].tolist(), ttl.tolist())
+    else:
+        yield from _skip(_stream_batches(trace_path, default_ttl, batch_size, size_field), start)
+
+
+def _stream_batches(trace_path, default_ttl, batch_size, size_field="key_len"):
+    """
+    read_trace_batches for the readers that cannot seek
+    """
+    if trace_format.is_ctrace(trace_path):
+        for batch in trace_format.iter_ctrace(trace_path, batch_size):
+            ts, obj, op, ttl, key_len, val_len = zip(*batch)
+            yield ts, obj, key_len if size_field == "key_len" else val_len, ttl
+    elif is_binary_trace(trace_path):
+        for batch in iter_sbin(trace_path, batch_size):
+            ts, obj, op, ttl, key_len, val_len = zip(*batch)
+            yield ts, obj, key_len, tuple(t if t != 0 else default_ttl for t in ttl)
+    else:
+        for batch in iter_text(trace_path, batch_size):
+            yield tuple(zip(*batch))
+
+
+def _skip(batches, start):
+    """
+    drop the first start records of a stream of column batches
+    """
+    for batch in batches:
+        if start >= len(batch[0]):
+            start -= len(batch[0])
+            continue
+        if start:
+            batch = tuple(column[start:] for column in batch)
+            start = 0
+        yield batch
+
+
+def trace_length(trace_path):
+    """
+    number of records in a trace, without keeping the file in memory
+    """
+    if trace_format.is_ctrace(trace_path):
+        return trace_format.read_header(trace_path)["n_req"]
+    if is_binary_trace(trace_path):
+        return os.path.getsize(trace_path) // RECORD.size
+    n = 0
+    chunk = b""
+    with open(trace_path, "rb") as ifile:
+        for chunk in iter(lambda: ifile.read(1 << 20), b""):
+            n += chunk.count(b"\n")
+    if chunk and not chunk.endswith(b"\n"): #last line has no newline
+        n += 1
+    return n
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("trace", help="the path to the trace", type=str)
+    ap.add_argument("--default_ttl", help="ttl used when a record has none", type=int, default=0)
+    args = ap.parse_args()
+
+    start = time.time()
+    n_req = 0
+    for record in read_trace(args.trace, args.default_ttl):
+        n_req += 1
+    print(f"{n_req} records in {time.time() - start} seconds")
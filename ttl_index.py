@@ -0,0 +1,121 @@
+import heapq
+import itertools
+from array import array
+
+
+class TTLIndex(object):
+    """
+    min-heap of absolute expiry times shared by the TTL-aware caches.
+
+    a cache registers every key with add() whenever its expiry changes and
+    calls discard() when the key leaves the cache for any other reason.
+    expire(now) then hands back exactly the keys whose expiry has passed,
+    in expiry order, without scanning the rest of the cache.
+
+    updates are lazy: the old heap entry is left behind and skipped when it
+    surfaces, and the heap is rebuilt once stale entries outnumber live ones
+    """
+
+    def __init__(self):
+        self.__heap = [] #(expiry, seq, key), seq breaks ties between keys that do not compare
+        self.__expiry = {} #key -> current absolute expiry
+        self.__seq = itertools.count()
+        self.expirations = 0 #number of keys handed out by expire()
+
+    def __len__(self):
+        return len(self.__expiry)
+
+    def __contains__(self, key):
+        return key in self.__expiry
+
+    def add(self, key, expiry):
+        """
+        register key or move it to a new expiry time
+        :type expiry: int
+        """
+        if self.__expiry.get(key) == expiry:
+            return
+        self.__expiry[key] = expiry
+        heapq.heappush(self.__heap, (expiry, next(self.__seq), key))
+        if len(self.__heap) > 2 * len(self.__expiry) + 64:
+            self.__compact()
+
+    def discard(self, key):
+        """
+        forget key, its heap entry is dropped lazily
+        """
+        self.__expiry.pop(key, None)
+
+    def next_expiry(self):
+        """
+        :rtype: int, smallest live expiry or None if the index is empty
+        """
+        heap = self.__heap
+        while heap and self.__expiry.get(heap[0][2]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def expire(self, now, inclusive=False):
+        """
+        remove and return the keys whose expiry is before now
+        (or at now when inclusive is set), oldest first
+        :type now: int
+        :rtype: list
+        """
+        heap = self.__heap
+        expiry = self.__expiry
+        expired = []
+        while heap and (heap[0][0] < now or (inclusive and heap[0][0] == now)):
+            e, _, key = heapq.heappop(heap)
+            if expiry.get(key) == e:
+                del expiry[key]
+                expired.append(key)
+        self.expirations += len(expired)
+        return expired
+
+    def columns(self, typecode="q"):
+        """
+        the heap as it is, stale entries included, and the live keys in
+        insertion order as flat columns for a snapshot: ties between equal
+        expiries, and so the order expire() hands keys out, depend on both.
+        keys must be ints, typecode is the array type of the expiry times
+        :return: dict name -> array
+        """
+        heap = self.__heap
+        return {
+            "ttl_heap_expiry": array(typecode, [e for e, seq, key in heap]),
+            "ttl_heap_seq": array("q", [seq for e, seq, key in heap]),
+            "ttl_heap_keys": array("Q", [key for e, seq, key in heap]),
+            "ttl_keys": array("Q", self.__expiry.keys()),
+            "ttl_expiry": array(typecode, self.__expiry.values()),
+            "ttl_expirations": array("q", [self.expirations]),
+        }
+
+    def restore(self, columns):
+        """
+        refill an empty index from columns()
+        """
+        self.__heap = list(zip(columns["ttl_heap_expiry"], columns["ttl_heap_seq"],
+                               columns["ttl_heap_keys"])) #already in heap order
+        self.__expiry = dict(zip(columns["ttl_keys"], columns["ttl_expiry"]))
+        self.__seq = itertools.count(max(columns["ttl_heap_seq"], default=-1) + 1)
+        self.expirations = columns["ttl_expirations"][0]
+
+    def clear(self):
+        self.__heap = []
+        self.__expiry.clear()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_TTLIndex__seq"] = next(self.__seq) #itertools.count does not pickle on every python
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        state["_TTLIndex__seq"] = itertools.count(state["_TTLIndex__seq"])
+        self.__dict__.update(state)
+
+    def __compact(self):
+        seq = self.__seq
+        self.__heap = [(e, next(seq), k) for k, e in self.__expiry.items()]
+        heapq.heapify(self.__heap)
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+
+import argparse
+import bisect
+import json
+import math
+import random
+import time
+
+import trace_format
+from hashing import MASK64, mix64
+from trace_reader import RECORD, is_binary_trace, iter_sbin, iter_text
+
+
+N_QUANTILES = 1000 #resolution of the fitted size distributions
+MIN_FIT_FREQ = 10 #ranks requested fewer times are sampling noise, left out of the alpha fit
+RANK_STEP = 1.1 #ratio between consecutive ranks used in the fit and in the population sums
+
+
+def _decoded_batches(trace_path):
+    """
+    batches of (ts, obj, op, ttl, key_len, val_len) of any trace format.
+    the size of a text trace is the object size, so it goes to val_len
+    like replay_sweep._share_trace puts it, with a key_len of 0; its last
+    column is the packed op_ttl of trace_conv.py
+    """
+    if trace_format.is_ctrace(trace_path):
+        yield from trace_format.iter_ctrace(trace_path)
+    elif is_binary_trace(trace_path):
+        yield from iter_sbin(trace_path)
+    else:
+        for batch in iter_text(trace_path):
+            yield [(ts, obj, op_ttl >> 24, op_ttl & 0xffffff, 0, size) for ts, obj, size, op_ttl in batch]
+
+
+def fit_alpha(counts):
+    """
+    least squares slope of log(frequency) over log(rank), at log-spaced
+    ranks so every decade weighs the same, for the ranks requested at least
+    MIN_FIT_FREQ times
+    :type counts: list of request counts per object
+    :rtype: float, zipf alpha (0 for no measurable skew)
+    """
+    freqs = sorted((c for c in counts if c >= MIN_FIT_FREQ), reverse=True)
+    xs = []
+    ys = []
+    rank = 1
+    while rank <= len(freqs):
+        xs.append(math.log(rank))
+        ys.append(math.log(freqs[rank - 1]))
+        rank = max(rank + 1, int(rank * RANK_STEP))
+    if len(xs) < 2:
+        return 0.0
+    mx = sum(xs) / len(xs)
+    my = sum(ys) / len(ys)
+    sxx = sum((x - mx) ** 2 for x in xs)
+    sxy = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+    return max(0.0, -sxy / sxx)
+
+
+def _rank_blocks(n):
+    """
+    split ranks 1..n into log-spaced blocks
+    :return: list of (number of ranks, middle rank)
+    """
+    blocks = []
+    lo = 1
+    while lo <= n:
+        hi = min(n, max(lo, int(lo * RANK_STEP)))
+        blocks.append((hi - lo + 1, (lo + hi) / 2))
+        lo = hi + 1
+    return blocks
+
+
+def expected_objects(population, alpha, n_req):
+    """
+    expected number of distinct objects among n_req zipf(alpha) draws from
+    population objects
+    """
+    blocks = _rank_blocks(population)
+    norm = sum(count * mid ** -alpha for count, mid in blocks)
+    return sum(count * -math.expm1(n_req * math.log1p(-(mid ** -alpha) / norm))
+               for count, mid in blocks)
+
+
+def fit_population(objects, alpha, n_req):
+    """
+    a trace only shows the objects it happened to request; find the
+    population whose zipf(alpha) sample of n_req requests is expected to
+    hold as many distinct objects as the trace
+    """
+    if objects < 2 or expected_objects(objects, alpha, n_req) >= objects:
+        return objects
+    lo = objects
+    hi = 2 * objects
+    while expected_objects(hi, alpha, n_req) < objects:
+        lo = hi
+        hi *= 2
+        if hi > 1024 * objects: #alpha too steep to ever reach that many objects
+            return hi
+    while hi - lo > max(1, objects // 1000):
+        mid = (lo + hi) // 2
+        if expected_objects(mid, alpha, n_req) < objects:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+
+def _quantiles(values):
+    """
+    :return: N_QUANTILES + 1 evenly spaced quantiles of values
+    """
+    if not values:
+        return [0] * (N_QUANTILES + 1)
+    values = sorted(values)
+    last = len(values) - 1
+    return [values[last * i // N_QUANTILES] for i in range(N_QUANTILES + 1)]
+
+
+def fit(trace_path):
+    """
+    fit a workload model to a trace: zipf alpha of the object popularity,
+    the object population it is drawn from, request rate, per-object key
+    and value size distributions, and the per-object ttl and per-request
+    op mixes
+
+    :return: dict model, json serializable
+    """
+    counts = {} #obj -> requests
+    attrs = {} #obj -> (key_len, val_len, ttl) of its first request
+    ops = {}
+    n_req = 0
+    first_ts = last_ts = None
+    for batch in _decoded_batches(trace_path):
+        for ts, obj, op, ttl, key_len, val_len in batch:
+            counts[obj] = counts.get(obj, 0) + 1
+            if obj not in attrs:
+                attrs[obj] = (key_len, val_len, ttl)
+            ops[op] = ops.get(op, 0) + 1
+            if first_ts is None:
+                first_ts = ts
+            last_ts = ts
+            n_req += 1
+    if not n_req:
+        raise ValueError(f"{trace_path} holds no requests")
+
+    ttls = {}
+    for key_len, val_len, ttl in attrs.values():
+        ttls[ttl] = ttls.get(ttl, 0) + 1
+    alpha = fit_alpha(list(counts.values()))
+    return {
+        "source": trace_path,
+        "requests": n_req,
+        "objects": len(counts),
+        "alpha": alpha,
+        "population": fit_population(len(counts), alpha, n_req),
+        "start_ts": first_ts,
+        "rate": n_req / max(1, last_ts - first_ts + 1), #requests per second
+        "key_len": _quantiles([a[0] for a in attrs.values()]),
+        "val_len": _quantiles([a[1] for a in attrs.values()]),
+        "ttl_mix": sorted([ttl, n] for ttl, n in ttls.items()),
+        "op_mix": sorted([op, n] for op, n in ops.items()),
+    }
+
+
+class ZipfSampler(object):
+    """
+    rank in 1..n with probability ~ 1 / rank ** alpha in O(1) time and
+    memory, by rejection-inversion (Hormann and Derflinger, 1996)
+    """
+
+    def __init__(self, n, alpha, rng):
+        self.n = n
+        self.alpha = alpha
+        self.rng = rng
+        if alpha > 0:
+            self.__h_x1 = self.__h_integral(1.5) - 1.0
+            self.__h_n = self.__h_integral(n + 0.5)
+            self.__s = 2.0 - self.__h_integral_inverse(self.__h_integral(2.5) - self.__h(2.0))
+
+    def __h(self, x):
+        return math.exp(-self.alpha * math.log(x))
+
+    def __h_integral(self, x):
+        log_x = math.log(x)
+        t = (1.0 - self.alpha) * log_x
+        helper = math.expm1(t) / t if abs(t) > 1e-8 else 1.0 + t * 0.5 * (1.0 + t / 3.0 * (1.0 + 0.25 * t))
+        return helper * log_x
+
+    def __h_integral_inverse(self, x):
+        t = max(-1.0, x * (1.0 - self.alpha))
+        helper = math.log1p(t) / t if abs(t) > 1e-8 else 1.0 - t * (0.5 - t * (1.0 / 3.0 - 0.25 * t))
+        return math.exp(helper * x)
+
+    def sample(self):
+        if self.alpha <= 0:
+            return self.rng.randrange(self.n) + 1
+        rand = self.rng.random
+        while True:
+            u = self.__h_n + rand() * (self.__h_x1 - self.__h_n)
+            x = self.__h_integral_inverse(u)
+            k = min(self.n, max(1, int(x + 0.5)))
+            if k - x <= self.__s or u >= self.__h_integral(k + 0.5) - self.__h(k):
+                return k
+
+
+def _unit(obj, salt):
+    """
+    a uniform float in [0, 1) fixed for (obj, salt), so per-object
+    attributes need no memory
+    """
+    return mix64(obj ^ salt) / (MASK64 + 1)
+
+
+def _from_quantiles(quantiles, u):
+    return quantiles[int(u * (len(quantiles) - 1))]
+
+
+def _from_mix(values, cum_counts, u):
+    return values[bisect.bisect_right(cum_counts, u * cum_counts[-1])]
+
+
+def generate(model, n_req, seed=0):
+    """
+    lazily yield n_req synthetic (ts, obj, kv_len, op_ttl) records, the raw
+    fields of the twemcache .sbin layout. object ids are scrambled zipf
+    ranks; the sizes and ttl of an object are drawn once from the model by
+    hashing its id, so every request to it agrees and nothing is stored.
+    values too large for their bit field are clamped to its maximum
+    """
+    rng = random.Random(seed)
+    zipf = ZipfSampler(max(1, model["population"]), model["alpha"], rng)
+    salt = mix64(seed)
+    ttl_values = [ttl for ttl, n in model["ttl_mix"]]
+    ttl_cum = []
+    for ttl, n in model["ttl_mix"]:
+        ttl_cum.append((ttl_cum[-1] if ttl_cum else 0) + n)
+    op_values = [op for op, n in model["op_mix"]]
+    op_cum = []
+    for op, n in model["op_mix"]:
+        op_cum.append((op_cum[-1] if op_cum else 0) + n)
+    key_q = model["key_len"]
+    val_q = model["val_len"]
+    start = model["start_ts"]
+    rate = model["rate"]
+
+    for i in range(n_req):
+        obj = mix64(zipf.sample() ^ salt)
+        key_len = min(_from_quantiles(key_q, _unit(obj, 1)), 0x3ff)
+        val_len = min(_from_quantiles(val_q, _unit(obj, 2)), 0x3fffff)
+        ttl = min(_from_mix(ttl_values, ttl_cum, _unit(obj, 3)), 0xffffff)
+        op = min(_from_mix(op_values, op_cum, rng.random()), 0xff)
+        yield int(start + i / rate), obj, (key_len << 22) | val_len, (op << 24) | ttl
+
+
+def write_sbin(records, out_path, chunk_records=65536):
+    """
+    stream records to a .sbin file, chunk_records at a time
+    :return: number of records written
+    """
+    n = 0
+    chunk = []
+    with open(out_path, "wb") as ofile:
+        for record in records:
+            chunk.append(RECORD.pack(*record))
+            if len(chunk) == chunk_records:
+                ofile.write(b"".join(chunk))
+                n += len(chunk)
+                chunk = []
+        ofile.write(b"".join(chunk))
+        n += len(chunk)
+    return n
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="command", required=True)
+    ap_fit = sub.add_parser("fit", help="fit a model to a trace and write it as json")
+    ap_fit.add_argument("trace", help="the path to the trace", type=str)
+    ap_fit.add_argument("model", help="where to write the model", type=str)
+    ap_gen = sub.add_parser("generate", help="write a synthetic .sbin trace from a model")
+    ap_gen.add_argument("model", help="model written by fit", type=str)
+    ap_gen.add_argument("out", help="output .sbin path", type=str)
+    ap_gen.add_argument("--requests", help="number of requests", type=int, default=1000000)
+    ap_gen.add_argument("--seed", help="seed of the generator", type=int, default=0)
+    args = ap.parse_args()
+
+    start = time.time()
+    if args.command == "fit":
+        model = fit(args.trace)
+        with open(args.model, "w") as ofile:
+            json.dump(model, ofile, indent=1)
+        print(f"{model['requests']} requests, {model['objects']} objects, "
+              f"alpha {model['alpha']:.3f}, population {model['population']}, "
+              f"{model['rate']:.1f} requests/s")
+    else:
+        with open(args.model) as ifile:
+            model = json.load(ifile)
+        n = write_sbin(generate(model, args.requests, args.seed), args.out)
+        print(f"{n} requests written to {args.out}")
+    print(f"time: {time.time() - start} seconds")